@@ -41,11 +41,14 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'corsheaders',
     'main'
 ]
 
 MIDDLEWARE = [
+    'main.metrics.RequestMetricsMiddleware',
+    'main.compression.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -149,6 +152,59 @@ REST_FRAMEWORK = {
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend']
 }
 
+# Quote search: 'fulltext' (tsvector + GIN index), 'fuzzy' (pg_trgm) or 'regex' (legacy iregex scan)
+QUOTES_SEARCH_MODE = os.environ.get('QUOTES_SEARCH_MODE', 'fulltext')
+# Minimal pg_trgm word similarity (0..1) for a quote to match in fuzzy mode
+QUOTES_FUZZY_THRESHOLD = float(os.environ.get('QUOTES_FUZZY_THRESHOLD', '0.5'))
+# Set per connection, where the indexable <% operator reads it. A fixed value, so
+# pooled connections never carry one request's threshold into another
+_database_options = DATABASES['default'].setdefault('OPTIONS', {})
+_database_options['options'] = ' '.join(filter(None, [
+    _database_options.get('options'), f'-c pg_trgm.word_similarity_threshold={QUOTES_FUZZY_THRESHOLD}'
+]))
+
+# Unpaginated quote lists (search/type/topic) with at least this many results are streamed
+QUOTES_STREAM_MIN_COUNT = int(os.environ.get('QUOTES_STREAM_MIN_COUNT', '1000'))
+
+# Requests slower than this are logged with their slowest queries by main.metrics
+QUOTES_SLOW_REQUEST_MS = float(os.environ.get('QUOTES_SLOW_REQUEST_MS', '500'))
+# Latest requests per endpoint kept for the /api/metrics/ percentiles
+QUOTES_METRICS_WINDOW = int(os.environ.get('QUOTES_METRICS_WINDOW', '1000'))
+
+# API responses smaller than this many bytes are sent uncompressed (see main/compression.py)
+API_COMPRESS_MIN_SIZE = int(os.environ.get('API_COMPRESS_MIN_SIZE', '1024'))
+
+# publish_static_api output directory and the scheme and host written into its pagination links
+STATIC_API_ROOT = os.environ.get('STATIC_API_ROOT', os.path.join(BASE_DIR, 'static_api'))
+STATIC_API_BASE_URL = os.environ.get('STATIC_API_BASE_URL', 'http://localhost:8000')
+
+# Versioned API response cache (see main/cache.py). Local memory by default (per
+# process, LRU-culled at MAX_ENTRIES); set API_CACHE_URL=redis://... in production
+# so all workers share one cache.
+API_CACHE_TIMEOUT = int(os.environ.get('API_CACHE_TIMEOUT', '3600'))
+API_CACHE_URL = os.environ.get('API_CACHE_URL')
+# The catalog version lives in the database; each cache keeps a copy for this many
+# seconds. With a per-process cache this bounds how long other workers serve
+# responses from before a catalog change; a shared cache sees bumps at once.
+API_CATALOG_VERSION_TTL = int(os.environ.get('API_CATALOG_VERSION_TTL', '60' if API_CACHE_URL else '2'))
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'api': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': API_CACHE_URL,
+        'TIMEOUT': API_CACHE_TIMEOUT,
+        'KEY_PREFIX': 'quotes-api',
+    } if API_CACHE_URL else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'quotes-api',
+        'TIMEOUT': API_CACHE_TIMEOUT,
+        'OPTIONS': {'MAX_ENTRIES': 2000},
+    },
+}
+
 # CORS settings
 CORS_ALLOWED_ORIGINS = os.environ.get(
     'CORS_ALLOWED_ORIGINS', 
@@ -164,12 +220,16 @@ CORS_ALLOW_HEADERS = [
     'authorization',
     'content-type',
     'dnt',
+    'if-none-match',
     'origin',
     'user-agent',
     'x-csrftoken',
     'x-requested-with',
 ]
 
+# Let the frontend revalidate API responses with If-None-Match and read their timings
+CORS_EXPOSE_HEADERS = ['etag', 'server-timing']
+
 # Import local settings if they exist
 try:
     from .settings_local import *
@@ -15,7 +15,7 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.urls import path, include
-from main import views
+from main import async_views, views
 from main.admin import custom_admin_site
 from rest_framework import routers
 
@@ -27,6 +27,10 @@ router.register(r'topics', views.TopicViewSet, basename='topic')
 
 urlpatterns = [
     path('admin/', custom_admin_site.urls),
+    path('api/async/quotes/', async_views.quote_list, name='async-quote-list'),
+    path('api/async/types/', async_views.type_list, name='async-type-list'),
+    path('api/async/topics/', async_views.topic_list, name='async-topic-list'),
+    path('api/metrics/', views.metrics, name='metrics'),
     path('api/', include(router.urls)),
     path('', include("django_nextjs.urls")),
     path('', include("main.urls")),
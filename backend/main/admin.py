@@ -9,6 +9,9 @@ from . import admin_views
 class QuoteAdmin(admin.ModelAdmin):
     list_display = ('quote', 'author', 'book', 'get_types', 'get_topics')
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).defer('search_vector').prefetch_related('type', 'topics')
+
     def get_types(self, instance):
         return [type.type for type in instance.type.all()]
     get_types.short_description = 'Types'
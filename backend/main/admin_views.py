@@ -1,72 +1,57 @@
 from django.shortcuts import render
 from django.contrib.admin.views.decorators import staff_member_required
-from django.db.models import Count
-from .models import Quote, Type, Topic
+from .models import AuthorCount, Quote, TypeTopicCount, UnlinkedQuoteCount
 
 
 @staff_member_required
 def statistics_view(request):
     """
-    View для отображения статистики цитат в админке
+    View для отображения статистики цитат в админке.
+    Все числа читаются из предрасчитанных таблиц (TypeTopicCount, AuthorCount,
+    UnlinkedQuoteCount), которые обновляются сигналами и командой refresh_statistics
     """
     
     # Статистика по приёмам (Type)
-    type_stats = Type.objects.annotate(
-        quote_count=Count('quote')
-    ).filter(quote_count__gt=0).order_by('-quote_count')
-    
-    # Цитаты без приёмов
-    quotes_without_types = Quote.objects.filter(type__isnull=True).count()
+    type_stats = [
+        {'type': type_name, 'quote_count': count}
+        for type_name, count in TypeTopicCount.objects.filter(
+            topic__isnull=True, type__isnull=False, count__gt=0
+        ).order_by('-count', 'type__type').values_list('type__type', 'count')
+    ]
     
     # Статистика по темам (Topic)
-    topic_stats = Topic.objects.annotate(
-        quote_count=Count('quote')
-    ).filter(quote_count__gt=0).order_by('-quote_count')
-    
-    # Цитаты без тем
-    quotes_without_topics = Quote.objects.filter(topics__isnull=True).count()
+    topic_stats = [
+        {'topic': topic_name, 'quote_count': count}
+        for topic_name, count in TypeTopicCount.objects.filter(
+            type__isnull=True, topic__isnull=False, count__gt=0
+        ).order_by('-count', 'topic__topic').values_list('topic__topic', 'count')
+    ]
     
-    # Статистика по авторам
-    author_quotes = Quote.objects.exclude(author='').values('author').annotate(
-        quote_count=Count('id')
-    )
+    # Цитаты без приёмов и без тем
+    unlinked = dict(UnlinkedQuoteCount.objects.values_list('field', 'count'))
     
-    # Обработка авторов для сортировки по фамилии
+    # Статистика по авторам, уже отсортированная по фамилии
     author_stats = []
-    for item in author_quotes:
-        author_name = item['author'].strip()
-        quote_count = item['quote_count']
-        
-        # Извлечение фамилии (второе слово или первое, если одно)
-        name_parts = author_name.split()
-        if len(name_parts) >= 2:
-            # Фамилия - второе слово
-            surname = name_parts[1]
-        else:
-            # Фамилия - первое слово (если одно)
-            surname = name_parts[0] if name_parts else author_name
-        
+    quotes_without_authors = 0
+    for author, count in AuthorCount.objects.order_by('sort_key', 'author').values_list('author', 'count'):
+        if author == '':
+            # Цитаты без авторов
+            quotes_without_authors = count
+            continue
         author_stats.append({
-            'full_name': author_name,
-            'surname': surname,
-            'quote_count': quote_count
+            'full_name': author.strip(),
+            'quote_count': count
         })
     
-    # Сортировка по фамилии в алфавитном порядке
-    author_stats.sort(key=lambda x: x['surname'].lower())
-    
-    # Цитаты без авторов
-    quotes_without_authors = Quote.objects.filter(author='').count()
-    
     context = {
         'title': 'Статистика цитат',
         'type_stats': type_stats,
-        'quotes_without_types': quotes_without_types,
+        'quotes_without_types': unlinked.get('type', 0),
         'topic_stats': topic_stats,
-        'quotes_without_topics': quotes_without_topics,
+        'quotes_without_topics': unlinked.get('topics', 0),
         'author_stats': author_stats,
         'quotes_without_authors': quotes_without_authors,
         'opts': Quote._meta,  # Для интеграции с admin breadcrumbs
     }
     
-    return render(request, 'admin/statistics.html', context)
\ No newline at end of file
+    return render(request, 'admin/statistics.html', context)
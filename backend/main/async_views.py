@@ -0,0 +1,160 @@
+"""
+Async variants of the quote, type and topic list endpoints for ASGI deployments.
+
+Blocking ORM work goes through run_concurrently: independent queries, such as the
+count and the page slice of the quote list, run in separate worker threads and so
+on separate database connections, overlapping instead of running one after another.
+Filtering, ordering and the response format are shared with the DRF viewsets.
+"""
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from django.http import HttpResponse
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from .pagination import CustomQuotePagination, KeysetPage, get_page_bounds, get_page_info
+from .serializers import TypeSerializer, TopicSerializer, serialize_quotes
+from .views import QuoteViewSet, TypeViewSet, TopicViewSet, get_unpaginated_info
+from types import SimpleNamespace
+import asyncio
+import copy
+import math
+
+
+def _in_own_connection(func):
+    """Run func like a request of its own, closing stale connections before and after"""
+    def wrapper():
+        close_old_connections()
+        try:
+            return func()
+        finally:
+            close_old_connections()
+    return wrapper
+
+
+async def run_concurrently(*funcs):
+    """Run blocking callables concurrently, each in a worker thread with its own DB connection"""
+    return await asyncio.gather(*(
+        sync_to_async(_in_own_connection(func), thread_sensitive=False)() for func in funcs
+    ))
+
+
+def make_view(viewset_class, request):
+    """Viewset instance set up for a list request, on a private copy of request"""
+    view = viewset_class(action='list', args=(), kwargs={}, format_kwarg=None)
+    # QuoteViewSet.filter_queryset swaps GET on the request it is given
+    view.request = Request(copy.copy(request))
+    return view
+
+
+def filtered_quotes(request):
+    """Quote queryset filtered and ordered exactly as QuoteViewSet.list does"""
+    view = make_view(QuoteViewSet, request)
+    return view.filter_queryset(view.get_queryset())
+
+
+def render(data, status=200):
+    """JSON response with the same bytes as the DRF JSONRenderer"""
+    return HttpResponse(JSONRenderer().render(data), status=status, content_type='application/json')
+
+
+async def quote_list(request):
+    """Async QuoteViewSet.list: page number or cursor pagination, or all quotes when filtered"""
+    params = request.GET
+    try:
+        if params.get('search') or params.get('type') or params.get('topic'):
+            return await _unpaginated_quotes(request)
+        return await _paginated_quotes(request)
+    except ValidationError as exc:
+        return render(exc.detail, status=400)
+    except NotFound as exc:
+        return render({'detail': exc.detail}, status=404)
+
+
+async def _unpaginated_quotes(request):
+    results, = await run_concurrently(lambda: serialize_quotes(filtered_quotes(request)))
+    envelope = get_unpaginated_info(len(results))
+    envelope['results'] = results
+    return render(envelope)
+
+
+async def _paginated_quotes(request):
+    pagination = CustomQuotePagination()
+    pagination.request = Request(request)
+    page_size = pagination.get_page_size(pagination.request)
+    # Lazy until a worker evaluates it, so no query runs on the event loop
+    queryset = pagination.annotate_ordering_keys(filtered_quotes(request))
+    cursor = pagination.decode_cursor(pagination.request, queryset)
+    if cursor is not None:
+        page_number, direction, values = cursor
+        # The page starts or ends at the cursor and holds less than two pages
+        window_query = pagination.seek(queryset, direction, values)[:2 * page_size]
+    else:
+        direction = None
+        try:
+            page_number = int(request.GET.get('page', 1))
+        except ValueError:
+            page_number = 0
+        if page_number < 1:
+            return render({'detail': 'Invalid page.'}, status=404)
+        # The merged page starts less than a page size after the standard page start
+        # and holds less than two pages, so this window covers it whatever the count is
+        window_start = (page_number - 1) * page_size
+        window_query = queryset[window_start:window_start + 2 * page_size]
+
+    total_count, window = await run_concurrently(
+        lambda: filtered_quotes(request).count(),
+        lambda: serialize_quotes(window_query),
+    )
+
+    standard_pages = math.ceil(total_count / page_size)
+    if standard_pages > 1 and total_count % page_size > 0:
+        total_pages = standard_pages - 1
+    else:
+        total_pages = standard_pages
+    if cursor is not None and not 1 <= page_number <= total_pages:
+        return render({'detail': pagination.invalid_cursor_message}, status=404)
+    if page_number > max(total_pages, 1):
+        return render({'detail': 'Invalid page.'}, status=404)
+
+    start_index, end_index = get_page_bounds(
+        page_number, total_count, page_size, request.GET.get('ordering', '') == '-id'
+    )
+    if direction == 'after':
+        results = window[:end_index - start_index]
+    elif direction == 'before':
+        results = window[:end_index - start_index][::-1]
+    else:
+        results = window[start_index - window_start:end_index - window_start]
+
+    # Cursor links carry the ordering keys of the first and last quote, as in the sync view
+    edge_ids = [results[0]['id'], results[-1]['id']] if total_pages > 1 and results else []
+    if edge_ids:
+        keyed, = await run_concurrently(
+            lambda: {quote.pk: quote for quote in queryset.filter(pk__in=edge_ids).only('id')}
+        )
+        edge_ids = [quote_id for quote_id in edge_ids if quote_id in keyed]
+    pagination.page = KeysetPage(
+        [keyed[quote_id] for quote_id in edge_ids], page_number, SimpleNamespace(num_pages=total_pages)
+    )
+
+    return render({
+        **get_page_info(total_count, page_number, pagination.page_size, results),
+        'next': pagination.get_next_link(),
+        'previous': pagination.get_previous_link(),
+        'results': results,
+    })
+
+
+async def type_list(request):
+    """Async TypeViewSet.list"""
+    view = make_view(TypeViewSet, request)
+    data, = await run_concurrently(lambda: TypeSerializer(view.get_queryset(), many=True).data)
+    return render(data)
+
+
+async def topic_list(request):
+    """Async TopicViewSet.list"""
+    view = make_view(TopicViewSet, request)
+    data, = await run_concurrently(lambda: TopicSerializer(view.get_queryset(), many=True).data)
+    return render(data)
@@ -0,0 +1,173 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+from functools import wraps
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.response import Response
+from .compression import compress, negotiate_encoding
+from .metrics import timed
+import hashlib
+
+CATALOG_VERSION_KEY = 'catalog:version'
+# Database sequence holding the catalog version, shared by all processes (migration 0014)
+CATALOG_VERSION_SEQUENCE = 'main_catalog_version'
+
+api_cache = caches['api']
+
+
+def get_catalog_version():
+    """
+    Current catalog version, part of every response cache key. Read from the database
+    sequence and trusted for API_CATALOG_VERSION_TTL seconds, so a bump by another
+    worker or a management command reaches this process even with a local cache.
+    """
+    version = api_cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT last_value FROM {CATALOG_VERSION_SEQUENCE}')
+            version = cursor.fetchone()[0]
+        api_cache.set(CATALOG_VERSION_KEY, version, timeout=settings.API_CATALOG_VERSION_TTL)
+    return version
+
+
+def bump_catalog_version():
+    """Invalidate all cached responses at once by moving to a new catalog version"""
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT nextval(%s)', [CATALOG_VERSION_SEQUENCE])
+        version = cursor.fetchone()[0]
+    api_cache.set(CATALOG_VERSION_KEY, version, timeout=settings.API_CATALOG_VERSION_TTL)
+    return version
+
+
+def request_fingerprint(request, variant=''):
+    """
+    Digest of the host and path plus normalized query params (sorted, empty values
+    dropped) and the view's cache variant, e.g. the date of a per-day response
+    """
+    params = sorted(
+        (key, value)
+        for key, values in request.query_params.lists()
+        for value in values if value != ''
+    )
+    return hashlib.sha1(repr((request.get_host(), request.path, params, variant)).encode('utf-8')).hexdigest()
+
+
+def response_cache_key(request, variant=''):
+    """Cache key from the request fingerprint and the catalog version"""
+    return f'response:{get_catalog_version()}:{request_fingerprint(request, variant)}'
+
+
+def response_encoding(request):
+    return negotiate_encoding(request.headers.get('Accept-Encoding', ''))
+
+
+def response_etag(request, variant=''):
+    """Strong ETag of a GET response: same catalog version, request, media type and encoding, same bytes"""
+    source = (
+        f'{get_catalog_version()}:{request_fingerprint(request, variant)}:'
+        f'{request.accepted_media_type}:{response_encoding(request)}'
+    )
+    return '"%s"' % hashlib.sha1(source.encode('utf-8')).hexdigest()
+
+
+def encoded_response(body, encoding, renderer):
+    """Response with already rendered (and maybe compressed) body bytes"""
+    content_type = renderer.media_type
+    if renderer.charset:
+        content_type = f'{content_type}; charset={renderer.charset}'
+    response = HttpResponse(body, content_type=content_type)
+    if encoding:
+        response['Content-Encoding'] = encoding
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
+
+
+def cached_response(view_method):
+    """
+    Serve successful GET responses of a view method from the versioned response cache.
+    The data is cached once per request, the rendered and compressed bytes once per
+    media type and encoding, so repeated requests neither re-render nor recompress.
+    """
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = response_cache_key(request, self.get_cache_variant(request))
+        renderer = request.accepted_renderer
+        # The browsable API renders HTML around the data for each request
+        cache_bytes = renderer.format != 'api'
+        if cache_bytes:
+            encoding = response_encoding(request)
+            body_key = f'{key}:{request.accepted_media_type}:{encoding}'
+            cached = api_cache.get(body_key)
+            if cached is not None:
+                return encoded_response(*cached, renderer)
+
+        data = api_cache.get(key)
+        if data is None:
+            response = view_method(self, request, *args, **kwargs)
+            # Streamed responses are not kept in memory, so they are not cached either
+            if response.status_code != 200 or not isinstance(response, Response):
+                return response
+            data = response.data
+            api_cache.set(key, data)
+        if not cache_bytes:
+            return Response(data)
+
+        with timed('render'):
+            body = renderer.render(data, request.accepted_media_type, self.get_renderer_context())
+        if encoding and len(body) >= settings.API_COMPRESS_MIN_SIZE:
+            with timed('compress'):
+                body = compress(body, encoding)
+        else:
+            encoding = None
+        api_cache.set(body_key, (body, encoding))
+        return encoded_response(body, encoding, renderer)
+    return wrapper
+
+
+class NotModified(APIException):
+    status_code = status.HTTP_304_NOT_MODIFIED
+    default_detail = 'Not modified.'
+
+
+class ConditionalGetMixin:
+    """
+    Tag GET responses with an ETag derived from the catalog version and answer a
+    matching If-None-Match with 304 before the queryset or serializer run.
+    """
+    def get_cache_variant(self, request):
+        """
+        What else besides the catalog and the request a response depends on, or None
+        when it differs on every request and must not be tagged or cached
+        """
+        return ''
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.etag = None
+        if request.method not in ('GET', 'HEAD'):
+            return
+
+        variant = self.get_cache_variant(request)
+        if variant is None:
+            return
+        self.etag = response_etag(request, variant)
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match:
+            etags = [etag.removeprefix('W/') for etag in parse_etags(if_none_match)]
+            if '*' in etags or self.etag in etags:
+                raise NotModified()
+
+    def handle_exception(self, exc):
+        if isinstance(exc, NotModified):
+            return Response(status=exc.status_code)
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if getattr(self, 'etag', None) and response.status_code in (200, 304):
+            response['ETag'] = self.etag
+        return response
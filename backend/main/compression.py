@@ -0,0 +1,98 @@
+"""
+Brotli/gzip response compression negotiated from Accept-Encoding.
+
+Cached API responses are compressed once in cache.cached_response and kept as
+bytes; CompressionMiddleware handles the rest of the API (streamed lists and
+exports included). Only API media types are compressed, never HTML pages that
+carry CSRF tokens. Brotli is used when the brotli package is installed.
+"""
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+import gzip
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = ('application/json', 'application/x-ndjson', 'application/msgpack', 'text/csv')
+
+BROTLI_QUALITY = 5
+GZIP_LEVEL = 6
+
+
+def available_encodings():
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def negotiate_encoding(accept_encoding):
+    """Preferred supported encoding of an Accept-Encoding header, brotli on ties, or None"""
+    qualities = {}
+    for part in accept_encoding.split(','):
+        coding, _, params = part.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        qualities[coding.strip().lower()] = quality
+
+    best, best_quality = None, 0.0
+    for encoding in available_encodings():
+        quality = qualities.get(encoding, qualities.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def compress_stream(chunks, encoding):
+    """Compress an iterable of byte chunks, flushing after each so the client keeps receiving"""
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        for chunk in chunks:
+            yield compressor.process(chunk) + compressor.flush()
+        yield compressor.finish()
+    else:
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        for chunk in chunks:
+            yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        yield compressor.flush()
+
+
+def is_compressible(response):
+    content_type = response.get('Content-Type', '').split(';')[0].strip()
+    return content_type in COMPRESSIBLE_TYPES and not response.has_header('Content-Encoding')
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """Compress API responses that aren't compressed yet with the client's preferred encoding"""
+    def process_response(self, request, response):
+        if response.status_code != 200 or not is_compressible(response):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = negotiate_encoding(request.headers.get('Accept-Encoding', ''))
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            if response.is_async:
+                return response
+            response.streaming_content = compress_stream(response.streaming_content, encoding)
+            del response['Content-Length']
+        else:
+            if len(response.content) < settings.API_COMPRESS_MIN_SIZE:
+                return response
+            response.content = compress(response.content, encoding)
+            response['Content-Length'] = str(len(response.content))
+        response['Content-Encoding'] = encoding
+        return response
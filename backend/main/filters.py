@@ -1,17 +1,104 @@
 from django_filters import rest_framework as filters
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramWordSimilarity
+from django.db.models import BooleanField, F, Func, Q, Value
+from django.db.models.functions import Greatest
+from functools import reduce
+from operator import or_
 from .models import Quote
-from django.db.models import Q
+import re
+
+SEARCH_MODE_CHOICES = (
+    ('fulltext', 'Full-text'),
+    ('fuzzy', 'Fuzzy'),
+    ('regex', 'Regex'),
+)
+
+# Configurations used to build Quote.search_vector (see models.quote_search_vector)
+SEARCH_CONFIGS = ('simple', 'russian', 'english')
+
+
+def build_prefix_query(value):
+    """
+    Build a tsquery matching words that start with each term of value, in order.
+    Returns None when value contains no word characters.
+    """
+    terms = re.findall(r'\w+', value)
+    if not terms:
+        return None
+    raw_query = ' <-> '.join(f'{term}:*' for term in terms)
+    return reduce(or_, (
+        SearchQuery(raw_query, search_type='raw', config=config)
+        for config in SEARCH_CONFIGS
+    ))
+
+
+class WordSimilar(Func):
+    """
+    value <% field: value is word-similar to an extent of field, by the connection's
+    pg_trgm.word_similarity_threshold. The planner serves it from a gin_trgm_ops
+    index on field.
+    """
+    arg_joiner = ' <%% '
+    template = '(%(expressions)s)'
+    output_field = BooleanField()
+
 
 class QuoteFilter(filters.FilterSet):
     search = filters.CharFilter(method='custom_search', label='Search')
+    search_mode = filters.ChoiceFilter(choices=SEARCH_MODE_CHOICES, method='filter_search_mode', label='Search mode')
     type = filters.NumberFilter(field_name='type__id', lookup_expr='exact', label='Type')
     topic = filters.NumberFilter(field_name='topics__id', lookup_expr='exact', label='Topic')
 
     class Meta:
         model = Quote
-        fields = ['search', 'type', 'topic']
+        fields = ['search', 'search_mode', 'type', 'topic']
+
+    def get_search_mode(self):
+        """Search mode from the validated request data, falling back to settings"""
+        return self.form.cleaned_data.get('search_mode') or settings.QUOTES_SEARCH_MODE
+
+    def filter_search_mode(self, queryset, name, value):
+        # Search mode only changes how custom_search works
+        return queryset
 
     def custom_search(self, queryset, name, value):
+        search_mode = self.get_search_mode()
+        if search_mode == 'fulltext':
+            query = build_prefix_query(value)
+            if query is not None:
+                return self.fulltext_search(queryset, query)
+        elif search_mode == 'fuzzy':
+            return self.fuzzy_search(queryset, value)
+        return self.regex_search(queryset, value)
+
+    def fulltext_search(self, queryset, query):
+        """Indexed search over search_vector, best matches first"""
+        return queryset.filter(search_vector=query).annotate(
+            search_rank=SearchRank(F('search_vector'), query)
+        ).order_by('-search_rank', *queryset.query.order_by)
+
+    def fuzzy_search(self, queryset, value):
+        """
+        Typo-tolerant search via pg_trgm word similarity over quote, author and book.
+        Most similar quotes come first.
+        """
+        # The threshold is the connection's pg_trgm.word_similarity_threshold, set
+        # from QUOTES_FUZZY_THRESHOLD; similarity is computed only for the matches
+        similarity = Greatest(
+            TrigramWordSimilarity(value, 'quote'),
+            TrigramWordSimilarity(value, 'author'),
+            TrigramWordSimilarity(value, 'book'),
+        )
+        return queryset.filter(
+            Q(WordSimilar(Value(value), 'quote')) |
+            Q(WordSimilar(Value(value), 'author')) |
+            Q(WordSimilar(Value(value), 'book'))
+        ).annotate(
+            search_similarity=similarity
+        ).order_by('-search_similarity', *queryset.query.order_by)
+
+    def regex_search(self, queryset, value):
         regex_pattern = r'(\W|^|«)' + value
         return queryset.filter(
             Q(quote__iregex=regex_pattern) |
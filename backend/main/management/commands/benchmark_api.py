@@ -0,0 +1,215 @@
+from django import get_version
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from main.cache import api_cache
+from main.models import Quote, Topic, Type
+from main.pagination import CustomQuotePagination
+import io
+import json
+import math
+import statistics
+import subprocess
+import time
+import tracemalloc
+
+
+def build_cases(total, type_id, topic_id):
+    """(name, path, params) of the API hot paths for a catalog of total quotes"""
+    page_size = CustomQuotePagination.page_size
+    standard_pages = math.ceil(total / page_size)
+    # The remainder is merged into the page before, see get_page_bounds
+    last_page = standard_pages - 1 if standard_pages > 1 and total % page_size else max(standard_pages, 1)
+    middle = max(total // 2, 1)
+    return [
+        ('list asc first page', '/api/quotes/', {'page': 1}),
+        ('list asc middle page', '/api/quotes/', {'page': max(last_page // 2, 1)}),
+        ('list asc merged last page', '/api/quotes/', {'page': last_page, 'ordering': 'id'}),
+        ('list desc merged first page', '/api/quotes/', {'page': 1, 'ordering': '-id'}),
+        ('list desc last page', '/api/quotes/', {'page': last_page, 'ordering': '-id'}),
+        ('position first', '/api/quotes/', {'position': 1}),
+        ('position middle', '/api/quotes/', {'position': middle}),
+        ('position last desc', '/api/quotes/', {'position': total, 'ordering': '-id'}),
+        ('positions window', '/api/quotes/positions/', {'position': middle, 'radius': 10}),
+        ('random', '/api/quotes/random/', {}),
+        ('random by type and topic', '/api/quotes/random/', {'type': type_id, 'topic': topic_id}),
+        ('daily', '/api/quotes/daily/', {}),
+        ('search fulltext', '/api/quotes/', {'search': 'Толст', 'search_mode': 'fulltext'}),
+        ('search fuzzy', '/api/quotes/', {'search': 'Толстй', 'search_mode': 'fuzzy'}),
+        ('search regex', '/api/quotes/', {'search': 'Толст', 'search_mode': 'regex'}),
+        ('filter type', '/api/quotes/', {'type': type_id}),
+        ('filter topic', '/api/quotes/', {'topic': topic_id}),
+        ('filter type and topic', '/api/quotes/', {'type': type_id, 'topic': topic_id}),
+        ('facets', '/api/quotes/facets/', {}),
+        ('facets by topic', '/api/quotes/facets/', {'topic': topic_id}),
+        ('pages_info asc', '/api/quotes/pages_info/', {}),
+        ('pages_info desc', '/api/quotes/pages_info/', {'ordering': '-id'}),
+        ('total_count', '/api/quotes/total_count/', {}),
+        ('types', '/api/types/', {}),
+        ('types by topic', '/api/types/', {'topic': topic_id}),
+        ('topics', '/api/topics/', {}),
+        ('topics by type', '/api/topics/', {'type': type_id}),
+        ('admin statistics', '/admin/statistics/', {}),
+        ('export ndjson', '/api/quotes/export/', {'export_format': 'ndjson'}),
+        ('export csv', '/api/quotes/export/', {'export_format': 'csv'}),
+    ]
+
+
+def get_commit():
+    """Current git commit of the code being measured, if known"""
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True, cwd=settings.BASE_DIR
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure latency, query count and memory of the quote API hot paths on seeded '
+        'datasets and write the results to JSON. Replaces all quotes unless --keep-data is given.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', default='1000,10000', help='Comma-separated dataset sizes, e.g. 1000,10000,100000,1000000'
+        )
+        parser.add_argument('--seed', type=int, default=42, help='generate_quotes seed of every dataset')
+        parser.add_argument('--processes', type=int, default=1, help='generate_quotes worker processes')
+        parser.add_argument('--repeat', type=int, default=5, help='Uncached runs per case')
+        parser.add_argument(
+            '--case', action='append', dest='cases', help='Only run cases whose name contains this (repeatable)'
+        )
+        parser.add_argument('--keep-data', action='store_true', help='Benchmark the quotes already in the database')
+        parser.add_argument('--output', default='benchmark_api.json', help='JSON results file')
+        parser.add_argument('--compare', help='Earlier JSON results to print median latency ratios against')
+        parser.add_argument(
+            '--no-input', '--noinput', action='store_false', dest='interactive', help='Do not ask for confirmation'
+        )
+
+    def handle(self, *args, **options):
+        if not options['keep_data'] and options['interactive']:
+            confirm = input('This replaces all quotes, types and topics with generated data. Continue? (yes/no): ')
+            if confirm.lower() != 'yes':
+                self.stdout.write(self.style.ERROR('Operation cancelled'))
+                return
+
+        baseline = {}
+        if options['compare']:
+            try:
+                with open(options['compare'], encoding='utf-8') as file:
+                    baseline = {(row['size'], row['case']): row for row in json.load(file)['results']}
+            except (OSError, ValueError, KeyError) as exc:
+                raise CommandError(f'Cannot read {options["compare"]}: {exc}')
+
+        user, _ = User.objects.get_or_create(
+            username='benchmark-api', defaults={'is_staff': True, 'is_superuser': True}
+        )
+        self.client = Client()
+        self.client.force_login(user)
+
+        sizes = [None] if options['keep_data'] else [int(size) for size in options['sizes'].split(',')]
+        results = []
+        try:
+            with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+                for size in sizes:
+                    results += self.run_size(size, options, baseline)
+        finally:
+            user.delete()
+
+        report = {
+            'commit': get_commit(),
+            'created_at': timezone.now().isoformat(),
+            'django': get_version(),
+            'seed': None if options['keep_data'] else options['seed'],
+            'repeat': options['repeat'],
+            'results': results,
+        }
+        with open(options['output'], 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'Wrote {len(results)} results to {options["output"]}'))
+
+    def run_size(self, size, options, baseline):
+        if size is not None:
+            self.stdout.write(f'Seeding {size} quotes...')
+            call_command(
+                'generate_quotes', fast=True, clear=True, count=size, seed=options['seed'],
+                processes=options['processes'], stdout=io.StringIO()
+            )
+        total = Quote.objects.count()
+        if total == 0:
+            raise CommandError('No quotes to benchmark')
+        type_id = Type.objects.order_by('id').values_list('id', flat=True).first()
+        topic_id = Topic.objects.order_by('id').values_list('id', flat=True).first()
+
+        self.stdout.write(
+            f'\n{total} quotes\n{"case":<30}{"median ms":>11}{"cached ms":>11}{"queries":>9}{"peak KiB":>10}{"MB/s":>8}{"vs base":>9}'
+        )
+        results = []
+        for name, path, params in build_cases(total, type_id, topic_id):
+            if options['cases'] and not any(part in name for part in options['cases']):
+                continue
+            result = {'size': total, 'case': name, 'path': path, 'params': params}
+            result.update(self.measure(path, params, options['repeat']))
+            results.append(result)
+
+            previous = baseline.get((total, name))
+            ratio = ''
+            if previous and previous['median_ms']:
+                ratio = f'{result["median_ms"] / previous["median_ms"]:>8.2f}x'
+            self.stdout.write(
+                f'{name:<30}{result["median_ms"]:>11.2f}{result["cached_ms"]:>11.2f}'
+                f'{result["queries"]:>9}{result["peak_kib"]:>10.0f}{result["mb_per_s"]:>8.1f}{ratio}'
+            )
+            if result['status'] != 200:
+                self.stdout.write(self.style.WARNING(f'  {path} returned {result["status"]}'))
+        return results
+
+    def get(self, path, params):
+        """GET path and read the whole body, streamed or not; returns the response and its size"""
+        response = self.client.get(path, params)
+        if response.streaming:
+            size = sum(len(chunk) for chunk in response.streaming_content)
+        else:
+            size = len(response.content)
+        return response, size
+
+    def measure(self, path, params, repeat):
+        timings = []
+        for _ in range(repeat):
+            api_cache.clear()
+            started = time.perf_counter()
+            response, size = self.get(path, params)
+            timings.append((time.perf_counter() - started) * 1000)
+
+        # Served from the response cache filled by the last run
+        started = time.perf_counter()
+        self.get(path, params)
+        cached_ms = (time.perf_counter() - started) * 1000
+
+        # Queries and memory from a separate uncached run, so tracing doesn't skew latency
+        api_cache.clear()
+        tracemalloc.start()
+        with CaptureQueriesContext(connection) as queries:
+            self.get(path, params)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        return {
+            'status': response.status_code,
+            'bytes': size,
+            'median_ms': statistics.median(timings),
+            'min_ms': min(timings),
+            'max_ms': max(timings),
+            'cached_ms': cached_ms,
+            # Body throughput, the figure of merit for the streamed export
+            'mb_per_s': size / 1e6 / (statistics.median(timings) / 1000),
+            'queries': len(queries),
+            'peak_kib': peak / 1024,
+        }
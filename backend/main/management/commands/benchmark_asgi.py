@@ -0,0 +1,92 @@
+from django.core.management.base import BaseCommand, CommandError
+from main.models import Type
+import aiohttp
+import asyncio
+import itertools
+import statistics
+import time
+
+# Quote list pages, a filtered list and the type/topic lists, relative to the API root
+ENDPOINTS = ['quotes/?page={page}', 'quotes/?type={type}', 'types/', 'topics/']
+
+
+class Command(BaseCommand):
+    help = (
+        'Load-test the sync API on a WSGI server against the async API on an ASGI server, '
+        'e.g. gunicorn config.wsgi -w 4 -b :8000 and gunicorn config.asgi -w 4 -k uvicorn.workers.UvicornWorker -b :8001'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--wsgi-url', default='http://127.0.0.1:8000', help='Base URL of the WSGI server')
+        parser.add_argument('--asgi-url', default='http://127.0.0.1:8001', help='Base URL of the ASGI server')
+        parser.add_argument('--concurrency', default='1,10,50', help='Comma-separated numbers of concurrent clients')
+        parser.add_argument('--requests', type=int, default=500, help='Requests per target and concurrency level')
+        parser.add_argument(
+            '--warm', action='store_true',
+            help='Let the WSGI server answer repeated requests from its response cache, which the async API does not have'
+        )
+
+    def handle(self, *args, **options):
+        type_ids = list(Type.objects.values_list('id', flat=True)) or [0]
+        targets = [
+            ('WSGI', options['wsgi_url'].rstrip('/') + '/api/'),
+            ('ASGI', options['asgi_url'].rstrip('/') + '/api/async/'),
+        ]
+
+        self.stdout.write(f'{"server":<6}{"clients":>9}{"req/s":>10}{"p50 ms":>10}{"p95 ms":>10}{"errors":>8}')
+        for concurrency in [int(value) for value in options['concurrency'].split(',')]:
+            for name, api_root in targets:
+                urls = self.build_urls(api_root, type_ids, options['requests'], cold=not options['warm'])
+                elapsed, latencies, errors = asyncio.run(self.run_load(urls, concurrency))
+                if not latencies:
+                    raise CommandError(f'No successful requests to {api_root}, is the {name} server running?')
+                latencies.sort()
+                self.stdout.write(
+                    f'{name:<6}{concurrency:>9}{len(urls) / elapsed:>10.1f}'
+                    f'{statistics.median(latencies):>10.1f}{latencies[int(len(latencies) * 0.95)]:>10.1f}{errors:>8}'
+                )
+
+    def build_urls(self, api_root, type_ids, count, cold):
+        """
+        Round-robin over the endpoints, varying the page and type filter. Cold URLs
+        carry a unique query param so both servers do the full work on every request.
+        """
+        endpoints = itertools.cycle(ENDPOINTS)
+        urls = []
+        for index in range(count):
+            url = api_root + next(endpoints).format(page=1 + index % 10, type=type_ids[index % len(type_ids)])
+            if cold:
+                url += ('&' if '?' in url else '?') + f'nocache={time.monotonic_ns()}'
+            urls.append(url)
+        return urls
+
+    async def run_load(self, urls, concurrency):
+        """Fetch urls with concurrency clients; returns elapsed seconds, latencies in ms and errors"""
+        queue = asyncio.Queue()
+        for url in urls:
+            queue.put_nowait(url)
+        latencies = []
+        errors = 0
+
+        async def client(session):
+            nonlocal errors
+            while not queue.empty():
+                url = queue.get_nowait()
+                started = time.perf_counter()
+                try:
+                    async with session.get(url) as response:
+                        await response.read()
+                        if response.status != 200:
+                            errors += 1
+                            continue
+                except aiohttp.ClientError:
+                    errors += 1
+                    continue
+                latencies.append((time.perf_counter() - started) * 1000)
+
+        connector = aiohttp.TCPConnector(limit=concurrency)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            started = time.perf_counter()
+            await asyncio.gather(*(client(session) for _ in range(concurrency)))
+            elapsed = time.perf_counter() - started
+        return elapsed, latencies, errors
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+from main.compression import available_encodings, compress
+from main.models import Quote
+from main.renderers import API_RENDERERS
+from main.serializers import serialize_quotes
+import statistics
+import time
+
+
+def median_ms(func, repeat):
+    """Median wall time of func in milliseconds and its last result"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000, result
+
+
+class Command(BaseCommand):
+    help = 'Compare payload size and encode time of quote lists per response format and compression'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='100,1000,10000', help='Comma-separated numbers of quotes per payload')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per size, format and encoding')
+
+    def handle(self, *args, **options):
+        renderers = [renderer() for renderer in API_RENDERERS if renderer.format != 'api']
+        queryset = Quote.objects.defer('search_vector').order_by('length', 'id')
+        total = Quote.objects.count()
+
+        self.stdout.write(
+            f'{"quotes":>8} {"format":<9}{"encoding":<10}{"bytes":>12}{"ratio":>7}{"render ms":>11}{"compress ms":>13}'
+        )
+        for size in [int(size) for size in options['sizes'].split(',')]:
+            if size > total:
+                self.stdout.write(self.style.WARNING(f'Skipping {size}: only {total} quotes in DB'))
+                continue
+            data = {'count': size, 'results': serialize_quotes(queryset[:size])}
+            json_size = None
+            for renderer in renderers:
+                render_ms, body = median_ms(lambda: renderer.render(data), options['repeat'])
+                json_size = json_size or len(body)
+                for encoding in (None, *available_encodings()):
+                    compress_ms, encoded = 0.0, body
+                    if encoding:
+                        compress_ms, encoded = median_ms(lambda: compress(body, encoding), options['repeat'])
+                    self.stdout.write(
+                        f'{size:>8} {renderer.format:<9}{encoding or "identity":<10}{len(encoded):>12}'
+                        f'{len(encoded) / json_size:>7.2f}{render_ms:>11.2f}{compress_ms:>13.2f}'
+                    )
@@ -0,0 +1,62 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from main.filters import QuoteFilter
+from main.models import Quote
+import io
+import statistics
+import time
+
+# Word-start, substring and misspelled queries against generate_quotes data
+DEFAULT_QUERIES = [
+    'Толст', 'Пушкин', 'Достоевский', 'Шекспир', 'Война и',
+    'Толстй', 'Достаевский', 'Шекспр', 'Гамлт', 'любов',
+]
+
+
+class Command(BaseCommand):
+    help = 'Compare search modes (regex, fulltext, fuzzy) latency on the quotes table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=0, help='Regenerate the dataset with this many quotes first (e.g. 100000)')
+        parser.add_argument('--seed', type=int, default=42, help='generate_quotes seed of the regenerated dataset')
+        parser.add_argument('--processes', type=int, default=1, help='generate_quotes worker processes')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per query and mode')
+        parser.add_argument('--modes', default='regex,fulltext,fuzzy', help='Comma-separated search modes')
+        parser.add_argument('--query', action='append', dest='queries', help='Query to run (repeatable)')
+
+    def handle(self, *args, **options):
+        if options['count']:
+            self.stdout.write(f'Seeding {options["count"]} quotes...')
+            call_command(
+                'generate_quotes', fast=True, clear=True, count=options['count'], seed=options['seed'],
+                processes=options['processes'], stdout=io.StringIO()
+            )
+
+        queries = options['queries'] or DEFAULT_QUERIES
+        modes = options['modes'].split(',')
+        self.stdout.write(f'Benchmarking {len(queries)} queries on {Quote.objects.count()} quotes, {options["repeat"]} runs each')
+
+        self.stdout.write(f'{"query":<16}' + ''.join(f'{mode + " ms":>14}{"hits":>7}' for mode in modes))
+        totals = {mode: [] for mode in modes}
+        for query in queries:
+            row = f'{query:<16}'
+            for mode in modes:
+                timings, hits = self.run_query(query, mode, options['repeat'])
+                median = statistics.median(timings)
+                totals[mode].append(median)
+                row += f'{median:>14.2f}{hits:>7}'
+            self.stdout.write(row)
+
+        self.stdout.write(f'{"median":<16}' + ''.join(
+            f'{statistics.median(totals[mode]):>14.2f}{"":>7}' for mode in modes
+        ))
+
+    def run_query(self, query, mode, repeat):
+        timings = []
+        hits = 0
+        for _ in range(repeat):
+            started = time.perf_counter()
+            queryset = QuoteFilter({'search': query, 'search_mode': mode}, queryset=Quote.objects.all()).qs
+            hits = len(list(queryset.values_list('id', flat=True)))
+            timings.append((time.perf_counter() - started) * 1000)
+        return timings, hits
@@ -0,0 +1,40 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.core.management.base import BaseCommand
+from main.models import Quote
+from main.serializers import QuoteSerializer, serialize_quotes
+import statistics
+import time
+
+
+class Command(BaseCommand):
+    help = 'Compare per-quote cost of QuoteSerializer(many=True) and serialize_quotes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='100,1000,10000', help='Comma-separated numbers of quotes to serialize')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per size and serializer')
+
+    def handle(self, *args, **options):
+        serializers = {
+            'QuoteSerializer': lambda queryset: QuoteSerializer(queryset, many=True).data,
+            'serialize_quotes': serialize_quotes,
+        }
+        queryset = Quote.objects.defer('search_vector').order_by('length', 'id')
+        total = Quote.objects.count()
+
+        self.stdout.write(f'{"quotes":>8} {"serializer":<18}{"total ms":>10}{"us/quote":>10}{"queries":>9}')
+        for size in [int(size) for size in options['sizes'].split(',')]:
+            if size > total:
+                self.stdout.write(self.style.WARNING(f'Skipping {size}: only {total} quotes in DB'))
+                continue
+            for name, serialize in serializers.items():
+                timings = []
+                for _ in range(options['repeat']):
+                    with CaptureQueriesContext(connection) as queries:
+                        started = time.perf_counter()
+                        serialize(queryset[:size])
+                        timings.append(time.perf_counter() - started)
+                median = statistics.median(timings)
+                self.stdout.write(
+                    f'{size:>8} {name:<18}{median * 1000:>10.1f}{median / size * 1e6:>10.1f}{len(queries):>9}'
+                )
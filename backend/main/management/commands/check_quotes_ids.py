@@ -1,43 +1,73 @@
 from django.core.management.base import BaseCommand
+from django.db.models import Count, F, Max, Min, Window
+from django.db.models.functions import Lead
 from main.models import Quote
+import json
 
 
 class Command(BaseCommand):
     help = 'Check quotes IDs range and continuity'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=10, help='Number of gap ranges to list, 0 for all')
+        parser.add_argument('--format', choices=['text', 'json'], default='text', help='Output format')
+
     def handle(self, *args, **options):
-        quotes = Quote.objects.all().order_by('id')
-        total = quotes.count()
-        
-        if total == 0:
+        summary = Quote.objects.aggregate(total=Count('id'), first_id=Min('id'), last_id=Max('id'))
+        total, first_id, last_id = summary['total'], summary['first_id'], summary['last_id']
+
+        # Each gap is the range between an ID and the next one, found with LEAD() over the ID index
+        gaps = Quote.objects.annotate(
+            next_id=Window(Lead('id'), order_by='id')
+        ).filter(next_id__gt=F('id') + 1).order_by('id')
+        gap_count = gaps.count() if total else 0
+        listed = gaps[:options['limit']] if options['limit'] else gaps
+        gap_ranges = [[gap_start + 1, gap_end - 1] for gap_start, gap_end in listed.values_list('id', 'next_id')]
+
+        report = {
+            'total': total,
+            'first_id': first_id,
+            'last_id': last_id,
+            'missing_ids': last_id - first_id + 1 - total if total else 0,
+            'gap_count': gap_count,
+            'gaps': gap_ranges,
+            'starts_at_one': first_id == 1,
+            'sequential': first_id == 1 and last_id == total,
+        }
+        if options['format'] == 'json':
+            self.stdout.write(json.dumps(report))
+            return
+        self.write_text(report)
+
+    def write_text(self, report):
+        if report['total'] == 0:
             self.stdout.write(self.style.WARNING('No quotes found'))
             return
-        
-        first_id = quotes.first().id
-        last_id = quotes.last().id
-        
+
+        total = report['total']
         self.stdout.write(f'Total quotes: {total}')
-        self.stdout.write(f'ID range: {first_id} - {last_id}')
+        self.stdout.write(f'ID range: {report["first_id"]} - {report["last_id"]}')
         self.stdout.write(f'Expected range for continuous IDs: 1 - {total}')
-        
+
         # Check for gaps in IDs
-        all_ids = set(quotes.values_list('id', flat=True))
-        expected_ids = set(range(first_id, last_id + 1))
-        missing_ids = expected_ids - all_ids
-        
-        if missing_ids:
-            self.stdout.write(self.style.WARNING(f'Found {len(missing_ids)} gaps in IDs'))
-            if len(missing_ids) <= 10:
-                self.stdout.write(f'Missing IDs: {sorted(missing_ids)}')
+        if report['gap_count']:
+            self.stdout.write(self.style.WARNING(
+                f'Found {report["missing_ids"]} missing IDs in {report["gap_count"]} gaps'
+            ))
+            ranges = ', '.join(
+                str(start) if start == end else f'{start}-{end}' for start, end in report['gaps']
+            )
+            more = report['gap_count'] - len(report['gaps'])
+            self.stdout.write(f'Missing IDs: {ranges}' + (f' and {more} more gaps' if more else ''))
         else:
             self.stdout.write(self.style.SUCCESS('✓ No gaps in ID sequence'))
-        
+
         # Check if starts from 1
-        if first_id == 1:
+        if report['starts_at_one']:
             self.stdout.write(self.style.SUCCESS('✓ IDs start from 1'))
         else:
-            self.stdout.write(self.style.WARNING(f'⚠ IDs start from {first_id} instead of 1'))
-        
+            self.stdout.write(self.style.WARNING(f'⚠ IDs start from {report["first_id"]} instead of 1'))
+
         # Check if continuous from 1 to total
-        if first_id == 1 and last_id == total and not missing_ids:
-            self.stdout.write(self.style.SUCCESS('✓ Perfect sequential IDs from 1 to ' + str(total)))
\ No newline at end of file
+        if report['sequential']:
+            self.stdout.write(self.style.SUCCESS('✓ Perfect sequential IDs from 1 to ' + str(total)))
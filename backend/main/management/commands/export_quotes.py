@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand, CommandError
+from main.models import Quote
+from main.renderers import stream_csv, stream_ndjson
+from main.serializers import EXPORT_FIELDS, iter_quote_exports
+import sys
+import time
+
+
+class Command(BaseCommand):
+    help = 'Export all quotes with type and topic names to NDJSON or CSV, readable by import_quotes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Output file, or - for stdout')
+        parser.add_argument('--format', choices=['ndjson', 'csv'], help='Output format (default: from the file extension)')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Quotes read per server-side cursor fetch')
+        parser.add_argument('--separator', default='|', help='Separator of several types or topics in one CSV cell')
+
+    def handle(self, *args, **options):
+        output_format = options['format'] or ('csv' if options['path'].endswith('.csv') else 'ndjson')
+        if options['path'] == '-':
+            output = sys.stdout.buffer
+        else:
+            try:
+                output = open(options['path'], 'wb')
+            except OSError as exc:
+                raise CommandError(f'Cannot open {options["path"]}: {exc}')
+
+        self.exported = 0
+        rows = self.count_rows(iter_quote_exports(Quote.objects.order_by('id'), chunk_size=options['chunk_size']))
+        if output_format == 'csv':
+            chunks = stream_csv(rows, EXPORT_FIELDS, separator=options['separator'])
+        else:
+            chunks = stream_ndjson(rows)
+
+        # Progress goes to stderr, so the export itself can go to stdout
+        written = 0
+        started = time.monotonic()
+        try:
+            for chunk in chunks:
+                output.write(chunk)
+                written += len(chunk)
+                elapsed = time.monotonic() - started
+                self.stderr.write(f'Exported {self.exported} quotes ({self.exported / elapsed:.0f} rows/s)...', ending='\r')
+        finally:
+            if output is not sys.stdout.buffer:
+                output.close()
+
+        elapsed = time.monotonic() - started
+        self.stderr.write(self.style.SUCCESS(
+            f'\nSuccessfully exported {self.exported} quotes ({written / 1024 / 1024:.1f} MiB) in {elapsed:.2f}s '
+            f'({self.exported / elapsed if elapsed else 0:.0f} rows/s)'
+        ))
+
+    def count_rows(self, rows):
+        for row in rows:
+            self.exported += 1
+            yield row
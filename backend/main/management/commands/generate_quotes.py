@@ -1,8 +1,132 @@
-from django.core.management.base import BaseCommand
-from django.db import transaction
-from main.models import Quote, Type
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from main.cache import bump_catalog_version
+from main.models import AuthorCount, Quote, QuoteRank, Topic, Type, TypeTopicCount, UnlinkedQuoteCount
 from faker import Faker
+import csv
+import io
+import multiprocessing
+import numpy as np
 import random
+import secrets
+import time
+
+TYPES = [
+    'Философские', 'Мотивационные', 'Жизненные', 'О любви',
+    'О дружбе', 'О успехе', 'О счастье', 'О мудрости',
+    'Юмористические', 'Исторические', 'Литературные', 'Научные'
+]
+
+TOPICS = [
+    'Любовь', 'Дружба', 'Время', 'Смерть', 'Свобода', 'Счастье',
+    'Война', 'Природа', 'Искусство', 'Работа', 'Семья', 'Наука'
+]
+
+# Famous authors for variety
+AUTHORS = [
+    'Александр Пушкин', 'Лев Толстой', 'Фёдор Достоевский', 'Антон Чехов',
+    'Михаил Лермонтов', 'Иван Тургенев', 'Николай Гоголь', 'Максим Горький',
+    'Владимир Маяковский', 'Сергей Есенин', 'Анна Ахматова', 'Борис Пастернак',
+    'Альберт Эйнштейн', 'Стив Джобс', 'Марк Твен', 'Уильям Шекспир',
+    'Оскар Уайльд', 'Эрнест Хемингуэй', 'Джордж Оруэлл', 'Чарльз Диккенс',
+    'Конфуций', 'Сократ', 'Платон', 'Аристотель', 'Лао-цзы',
+    'Махатма Ганди', 'Мартин Лютер Кинг', 'Нельсон Мандела',
+    'Томас Эдисон', 'Никола Тесла', 'Исаак Ньютон', 'Леонардо да Винчи'
+]
+
+BOOKS = [
+    'Война и мир', 'Преступление и наказание', 'Анна Каренина', 'Мастер и Маргарита',
+    'Евгений Онегин', 'Мёртвые души', 'Отцы и дети', 'Обломов',
+    'Гарри Поттер', '1984', 'Убить пересмешника', 'Великий Гэтсби',
+    'Гордость и предубеждение', 'Джейн Эйр', 'Грозовой перевал',
+    'Божественная комедия', 'Дон Кихот', 'Гамлет', 'Король Лир',
+    'Ромео и Джульетта', 'Макбет', 'Фауст', 'Илиада', 'Одиссея'
+]
+
+# Text pools of the fast mode, built once per run before worker processes fork
+text_pools = {}
+
+
+def build_text_pools(seed, sentences=5000, names=500):
+    """Faker output generated up front, so rows are assembled from pools instead of Faker calls"""
+    # One seeded Faker per locale: a multi-locale Faker picks locales with the global random
+    fakers = [Faker(locale) for locale in ('ru_RU', 'en_US')]
+    for fake in fakers:
+        fake.seed_instance(seed)
+
+    def pool(generate, size):
+        return np.array([generate(fakers[index % 2], index) for index in range(size)], dtype=object)
+
+    return {
+        'sentences': pool(lambda fake, index: fake.sentence(nb_words=3 + index % 10), sentences),
+        'authors': np.array(AUTHORS, dtype=object),
+        'names': pool(lambda fake, index: fake.name(), names),
+        'books': np.array(BOOKS, dtype=object),
+        'phrases': pool(lambda fake, index: fake.catch_phrase(), names),
+    }
+
+
+def pick_distinct(rng, size, choices, low, high):
+    """(row, choice) pairs giving each of size rows low..high distinct random choices"""
+    high = min(high, len(choices))
+    counts = rng.integers(low, high + 1, size)
+    order = rng.random((size, len(choices))).argsort(axis=1)
+    rows = [np.flatnonzero(counts > column) for column in range(high)]
+    return np.concatenate([[], *rows]).astype(np.int64), np.concatenate(
+        [[], *(np.asarray(choices)[order[row, column]] for column, row in enumerate(rows))]
+    ).astype(np.int64)
+
+
+def copy_rows(cursor, table, columns, rows):
+    """Load rows into table with COPY FROM STDIN"""
+    buffer = io.StringIO()
+    csv.writer(buffer, quoting=csv.QUOTE_ALL).writerows(rows)
+    buffer.seek(0)
+    cursor.copy_expert(f'COPY {table} ({", ".join(columns)}) FROM STDIN WITH (FORMAT csv)', buffer)
+
+
+def generate_chunk(chunk):
+    """
+    Generate and COPY one chunk of quotes with their type and topic links. Random
+    choices come from a generator seeded with (seed, chunk index), so a chunk has
+    the same content whichever process writes it.
+    """
+    index, first_id, first_row, size, seed, type_ids, topic_ids = chunk
+    rng = np.random.default_rng([seed, index])
+    pools = text_pools
+
+    # Same length mix as the default mode: long, medium, short and very short quotes
+    category = (first_row + np.arange(size)) % 4
+    sentence_counts = np.select(
+        [category == 0, category == 1, category == 2],
+        [rng.integers(4, 8, size), rng.integers(2, 4, size), rng.integers(1, 3, size)],
+        1
+    )
+    sentences = pools['sentences'][rng.integers(0, len(pools['sentences']), sentence_counts.sum())]
+    quotes = [' '.join(parts)[:1000] for parts in np.split(sentences, np.cumsum(sentence_counts)[:-1])]
+    authors = np.where(
+        rng.random(size) > 0.1,
+        pools['authors'][rng.integers(0, len(pools['authors']), size)],
+        pools['names'][rng.integers(0, len(pools['names']), size)],
+    )
+    books = np.where(
+        rng.random(size) > 0.3,
+        pools['books'][rng.integers(0, len(pools['books']), size)],
+        pools['phrases'][rng.integers(0, len(pools['phrases']), size)],
+    )
+    ids = first_id + np.arange(size)
+    type_rows, type_links = pick_distinct(rng, size, type_ids, 1, 3)
+    topic_rows, topic_links = pick_distinct(rng, size, topic_ids, 0, 2)
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        copy_rows(cursor, Quote._meta.db_table, ['id', 'quote', 'author', 'book'],
+                  zip(ids.tolist(), quotes, authors.tolist(), books.tolist()))
+        copy_rows(cursor, Quote.type.through._meta.db_table, ['quote_id', 'type_id'],
+                  zip(ids[type_rows].tolist(), type_links.tolist()))
+        copy_rows(cursor, Quote.topics.through._meta.db_table, ['quote_id', 'topic_id'],
+                  zip(ids[topic_rows].tolist(), topic_links.tolist()))
+    return size
+
 
 class Command(BaseCommand):
     help = 'Generate test quotes using Faker'
@@ -10,54 +134,34 @@ class Command(BaseCommand):
     def add_arguments(self, parser):
         parser.add_argument('--count', type=int, default=4000, help='Number of quotes to generate')
         parser.add_argument('--clear', action='store_true', help='Clear existing quotes before generating')
+        parser.add_argument('--fast', action='store_true', help='Generate from pre-built text pools with NumPy and COPY, for large datasets')
+        parser.add_argument('--seed', type=int, help='Random seed of the fast mode, for reproducible datasets')
+        parser.add_argument('--chunk-size', type=int, default=10000, help='Quotes per COPY transaction in the fast mode')
+        parser.add_argument('--processes', type=int, default=1, help='Worker processes writing chunks in the fast mode')
 
     def handle(self, *args, **options):
+        if options['fast']:
+            return self.handle_fast(**options)
+
         fake = Faker(['ru_RU', 'en_US'])
         count = options['count']
-        
+
         if options['clear']:
             self.stdout.write('Clearing existing quotes...')
             Quote.objects.all().delete()
             Type.objects.all().delete()
 
         # Create some quote types
-        types_data = [
-            'Философские', 'Мотивационные', 'Жизненные', 'О любви', 
-            'О дружбе', 'О успехе', 'О счастье', 'О мудрости',
-            'Юмористические', 'Исторические', 'Литературные', 'Научные'
-        ]
-        
         types = []
-        for type_name in types_data:
+        for type_name in TYPES:
             type_obj, created = Type.objects.get_or_create(type=type_name)
             types.append(type_obj)
-        
+
         self.stdout.write(f'Generating {count} quotes...')
-        
-        # Famous authors for variety
-        authors = [
-            'Александр Пушкин', 'Лев Толстой', 'Фёдор Достоевский', 'Антон Чехов',
-            'Михаил Лермонтов', 'Иван Тургенев', 'Николай Гоголь', 'Максим Горький',
-            'Владимир Маяковский', 'Сергей Есенин', 'Анна Ахматова', 'Борис Пастернак',
-            'Альберт Эйнштейн', 'Стив Джобс', 'Марк Твен', 'Уильям Шекспир',
-            'Оскар Уайльд', 'Эрнест Хемингуэй', 'Джордж Оруэлл', 'Чарльз Диккенс',
-            'Конфуций', 'Сократ', 'Платон', 'Аристотель', 'Лао-цзы',
-            'Махатма Ганди', 'Мартин Лютер Кинг', 'Нельсон Мандела',
-            'Томас Эдисон', 'Никола Тесла', 'Исаак Ньютон', 'Леонардо да Винчи'
-        ]
-        
-        books = [
-            'Война и мир', 'Преступление и наказание', 'Анна Каренина', 'Мастер и Маргарита',
-            'Евгений Онегин', 'Мёртвые души', 'Отцы и дети', 'Обломов',
-            'Гарри Поттер', '1984', 'Убить пересмешника', 'Великий Гэтсби',
-            'Гордость и предубеждение', 'Джейн Эйр', 'Грозовой перевал',
-            'Божественная комедия', 'Дон Кихот', 'Гамлет', 'Король Лир',
-            'Ромео и Джульетта', 'Макбет', 'Фауст', 'Илиада', 'Одиссея'
-        ]
 
         batch_size = 100
         quotes_to_create = []
-        
+
         with transaction.atomic():
             for i in range(count):
                 # Generate quote text of varying lengths
@@ -69,35 +173,35 @@ class Command(BaseCommand):
                     quote_text = fake.text(max_nb_chars=200)
                 else:  # 25% very short quotes (20-50 chars)
                     quote_text = fake.sentence(nb_words=random.randint(3, 10))
-                
+
                 # Clean up quote text
                 quote_text = quote_text.replace('\n', ' ').strip()
                 if len(quote_text) > 1000:
                     quote_text = quote_text[:997] + '...'
-                
-                author = random.choice(authors) if random.random() > 0.1 else fake.name()
-                book = random.choice(books) if random.random() > 0.3 else fake.catch_phrase()
-                
+
+                author = random.choice(AUTHORS) if random.random() > 0.1 else fake.name()
+                book = random.choice(BOOKS) if random.random() > 0.3 else fake.catch_phrase()
+
                 quote = Quote(
                     quote=quote_text,
                     author=author,
                     book=book
                 )
                 quotes_to_create.append(quote)
-                
+
                 if len(quotes_to_create) >= batch_size:
                     Quote.objects.bulk_create(quotes_to_create)
-                    
+
                     # Add types to created quotes
                     last_quotes = Quote.objects.order_by('-id')[:batch_size]
                     for quote in last_quotes:
                         # Assign 1-3 random types to each quote
                         quote_types = random.sample(types, random.randint(1, min(3, len(types))))
                         quote.type.set(quote_types)
-                    
+
                     quotes_to_create = []
                     self.stdout.write(f'Created {i + 1}/{count} quotes...', ending='\r')
-            
+
             # Create remaining quotes
             if quotes_to_create:
                 Quote.objects.bulk_create(quotes_to_create)
@@ -106,7 +210,90 @@ class Command(BaseCommand):
                     quote_types = random.sample(types, random.randint(1, min(3, len(types))))
                     quote.type.set(quote_types)
 
+        # bulk_create bypasses post_save, which keeps these up to date
+        QuoteRank.objects.rebuild()
+        TypeTopicCount.objects.rebuild()
+        AuthorCount.objects.rebuild()
+        UnlinkedQuoteCount.objects.rebuild()
+        bump_catalog_version()
+
         total_quotes = Quote.objects.count()
         self.stdout.write(
             self.style.SUCCESS(f'\nSuccessfully generated {count} quotes. Total quotes in DB: {total_quotes}')
-        )
\ No newline at end of file
+        )
+
+    def handle_fast(self, count, clear, seed, chunk_size, processes, **options):
+        """Generate count quotes in chunks of COPY statements, optionally in parallel processes"""
+        if connection.vendor != 'postgresql':
+            raise CommandError('The fast mode loads rows with PostgreSQL COPY')
+        if seed is None:
+            seed = secrets.randbits(32)
+        self.stdout.write(f'Generating {count} quotes with seed {seed}...')
+        started = time.monotonic()
+
+        if clear:
+            self.stdout.write('Clearing existing quotes, types and topics...')
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'TRUNCATE {Quote._meta.db_table}, {Type._meta.db_table}, {Topic._meta.db_table} '
+                    'RESTART IDENTITY CASCADE'
+                )
+
+        type_ids = self.get_or_create_names(Type, 'type', TYPES)
+        topic_ids = self.get_or_create_names(Topic, 'topic', TOPICS)
+        first_id = self.reserve_quote_ids(count)
+
+        global text_pools
+        text_pools = build_text_pools(seed)
+        chunks = [
+            (index, first_id + first_row, first_row, min(chunk_size, count - first_row), seed, type_ids, topic_ids)
+            for index, first_row in enumerate(range(0, count, chunk_size))
+        ]
+
+        created = 0
+        if processes > 1:
+            # Forked workers open their own connections and inherit text_pools
+            connections.close_all()
+            with multiprocessing.get_context('fork').Pool(processes) as pool:
+                for size in pool.imap_unordered(generate_chunk, chunks):
+                    created += size
+                    self.report_progress(created, count, started)
+        else:
+            for chunk in chunks:
+                created += generate_chunk(chunk)
+                self.report_progress(created, count, started)
+
+        # COPY sends no signals, so refresh everything derived from quotes once
+        QuoteRank.objects.rebuild()
+        TypeTopicCount.objects.rebuild()
+        AuthorCount.objects.rebuild()
+        UnlinkedQuoteCount.objects.rebuild()
+        bump_catalog_version()
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'\nSuccessfully generated {count} quotes in {elapsed:.2f}s ({count / elapsed:.0f} rows/s). '
+            f'Total quotes in DB: {Quote.objects.count()}'
+        ))
+
+    def get_or_create_names(self, model, field, names):
+        """IDs of the objects named names, creating missing ones without per-object signals"""
+        existing = dict(model.objects.filter(**{f'{field}__in': names}).order_by('-id').values_list(field, 'id'))
+        missing = [model(**{field: name}) for name in names if name not in existing]
+        existing.update((getattr(obj, field), obj.id) for obj in model.objects.bulk_create(missing))
+        return [existing[name] for name in names]
+
+    def reserve_quote_ids(self, count):
+        """Take count consecutive quote IDs from the sequence and return the first"""
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [Quote._meta.db_table])
+            sequence, = cursor.fetchone()
+            cursor.execute('SELECT nextval(%s)', [sequence])
+            first_id, = cursor.fetchone()
+            if count > 1:
+                cursor.execute('SELECT setval(%s, %s)', [sequence, first_id + count - 1])
+        return first_id
+
+    def report_progress(self, created, count, started):
+        rate = created / (time.monotonic() - started)
+        self.stdout.write(f'Created {created}/{count} quotes ({rate:.0f} rows/s)...', ending='\r')
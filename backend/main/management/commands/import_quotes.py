@@ -0,0 +1,144 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from main.cache import bump_catalog_version
+from main.models import AuthorCount, Quote, QuoteRank, Topic, Type, TypeTopicCount, UnlinkedQuoteCount
+import csv
+import itertools
+import json
+import sys
+import time
+
+QUOTE_FIELDS = ('quote', 'author', 'book')
+MAX_LENGTHS = {'author': 200, 'book': 200}
+
+
+class NameCache:
+    """Type or Topic IDs by name, creating missing ones in bulk"""
+    def __init__(self, model, field):
+        self.model = model
+        self.field = field
+        self.ids = {}
+        # Names aren't unique, the oldest object wins as it would in the admin list
+        for object_id, name in model.objects.order_by('-id').values_list('id', field):
+            self.ids[name] = object_id
+        self.created = 0
+
+    def resolve(self, names):
+        """IDs for names, creating the unknown ones with a single bulk_create"""
+        missing = [name for name in dict.fromkeys(names) if name not in self.ids]
+        if missing:
+            for obj in self.model.objects.bulk_create(self.model(**{self.field: name}) for name in missing):
+                self.ids[getattr(obj, self.field)] = obj.id
+            self.created += len(missing)
+        return [self.ids[name] for name in names]
+
+
+class Command(BaseCommand):
+    help = 'Import quotes from a CSV or JSON Lines file with batched quote and type/topic writes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Input file, or - for stdin')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Input format (default: from the file extension)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Quotes written per transaction')
+        parser.add_argument('--separator', default='|', help='Separator of several types or topics in one CSV cell')
+
+    def handle(self, *args, **options):
+        input_format = options['format'] or ('jsonl' if options['path'].endswith(('.jsonl', '.ndjson')) else 'csv')
+        if options['path'] == '-':
+            stream = sys.stdin
+        else:
+            try:
+                stream = open(options['path'], encoding='utf-8', newline='')
+            except OSError as exc:
+                raise CommandError(f'Cannot open {options["path"]}: {exc}')
+
+        self.types = NameCache(Type, 'type')
+        self.topics = NameCache(Topic, 'topic')
+        self.skipped = 0
+        imported = 0
+        started = time.monotonic()
+        try:
+            with stream:
+                rows = self.read_jsonl(stream) if input_format == 'jsonl' else self.read_csv(stream, options['separator'])
+                while batch := list(itertools.islice(rows, options['batch_size'])):
+                    imported += self.write_batch(batch)
+                    elapsed = time.monotonic() - started
+                    self.stdout.write(f'Imported {imported} quotes ({imported / elapsed:.0f} rows/s)...', ending='\r')
+        finally:
+            # Bulk writes send no signals, so refresh everything derived from quotes once,
+            # also for the batches committed before a failing one
+            QuoteRank.objects.rebuild()
+            TypeTopicCount.objects.rebuild()
+            AuthorCount.objects.rebuild()
+            UnlinkedQuoteCount.objects.rebuild()
+            bump_catalog_version()
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'\nSuccessfully imported {imported} quotes in {elapsed:.2f}s '
+            f'({imported / elapsed if elapsed else 0:.0f} rows/s), skipped {self.skipped} rows, '
+            f'created {self.types.created} types and {self.topics.created} topics'
+        ))
+
+    def read_csv(self, stream, separator):
+        """Rows of a CSV file with a header; types and topics cells hold separated names"""
+        for line_number, record in enumerate(csv.DictReader(stream), 2):
+            for key in ('types', 'topics'):
+                record[key] = (record.get(key) or '').split(separator)
+            yield from self.clean(line_number, record)
+
+    def read_jsonl(self, stream):
+        """Rows of a JSON Lines file; types and topics are lists of names or a single name"""
+        for line_number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as exc:
+                self.skip(line_number, f'invalid JSON ({exc})')
+                continue
+            if not isinstance(record, dict):
+                self.skip(line_number, 'not a JSON object')
+                continue
+            for key in ('types', 'topics'):
+                if isinstance(record.get(key), str):
+                    record[key] = [record[key]]
+            yield from self.clean(line_number, record)
+
+    def clean(self, line_number, record):
+        """Yield (quote fields, type names, topic names) for a valid record, else report it"""
+        fields = {field: str(record.get(field) or '').strip() for field in QUOTE_FIELDS}
+        if not fields['quote']:
+            self.skip(line_number, 'empty quote')
+            return
+        for field, max_length in MAX_LENGTHS.items():
+            if len(fields[field]) > max_length:
+                self.skip(line_number, f'{field} longer than {max_length} characters')
+                return
+        names = [
+            list(dict.fromkeys(str(name).strip() for name in record.get(key) or [] if str(name).strip()))
+            for key in ('types', 'topics')
+        ]
+        yield fields, *names
+
+    def skip(self, line_number, reason):
+        self.skipped += 1
+        self.stderr.write(f'Line {line_number}: skipped, {reason}')
+
+    @transaction.atomic
+    def write_batch(self, batch):
+        """Write a batch of quotes and their type/topic links with one bulk_create per table"""
+        type_ids = self.types.resolve([name for _, names, _ in batch for name in names])
+        topic_ids = self.topics.resolve([name for _, _, names in batch for name in names])
+        quotes = Quote.objects.bulk_create(Quote(**fields) for fields, _, _ in batch)
+
+        type_links = []
+        topic_links = []
+        type_ids = iter(type_ids)
+        topic_ids = iter(topic_ids)
+        for quote, (_, type_names, topic_names) in zip(quotes, batch):
+            type_links += [Quote.type.through(quote_id=quote.id, type_id=next(type_ids)) for _ in type_names]
+            topic_links += [Quote.topics.through(quote_id=quote.id, topic_id=next(topic_ids)) for _ in topic_names]
+        Quote.type.through.objects.bulk_create(type_links)
+        Quote.topics.through.objects.bulk_create(topic_links)
+        return len(quotes)
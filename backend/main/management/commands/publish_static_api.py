@@ -0,0 +1,172 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+from django.utils import timezone
+from main.cache import get_catalog_version
+from main.compression import available_encodings, compress
+from main.pagination import CustomQuotePagination, get_page_bounds, get_page_info
+from main.serializers import iter_serialized_quotes
+from main.views import QuoteViewSet
+from urllib.parse import urlsplit
+import hashlib
+import json
+import os
+import time
+
+MANIFEST_NAME = 'manifest.json'
+NGINX_MAP_NAME = 'static_api.map'
+
+# Query strings of the quote list pages, in the parameter order the frontend sends
+ORDERINGS = {
+    'asc': ('', 'page={page}'),
+    'desc': ('-id', 'page={page}&ordering=-id'),
+}
+
+# Small resources, always re-rendered: (manifest key, file stem)
+RESOURCES = [
+    ('/api/quotes/pages_info/?', 'quotes/pages-info'),
+    ('/api/quotes/pages_info/?ordering=-id', 'quotes/pages-info-desc'),
+    ('/api/quotes/total_count/?', 'quotes/total-count'),
+    ('/api/types/?', 'types'),
+    ('/api/topics/?', 'topics'),
+]
+
+
+def write_atomic(path, content):
+    """Write content to path through a temporary file, so readers never see a partial file"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = f'{path}.tmp'
+    with open(temporary, 'wb') as file:
+        file.write(content)
+    os.replace(temporary, path)
+
+
+class Command(BaseCommand):
+    help = (
+        'Write the responses of quotes/?page=N (both orderings), pages_info/, total_count/, '
+        'types/ and topics/ as content-hashed static files with a manifest and an nginx map, '
+        're-rendering only the pages whose quotes changed since the last run'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=settings.STATIC_API_ROOT, help='Directory to publish into')
+        parser.add_argument(
+            '--base-url', default=settings.STATIC_API_BASE_URL,
+            help='Scheme and host the API is served from, used in the pagination links'
+        )
+        parser.add_argument('--url-prefix', default='/static-api/', help='URL nginx serves the output directory at')
+        parser.add_argument('--precompress', action='store_true', help='Also write .br/.gz files for nginx *_static')
+        parser.add_argument('--force', action='store_true', help='Re-render every page, e.g. after a code change')
+
+    def handle(self, *args, **options):
+        self.output = options['output']
+        self.precompress = options['precompress']
+        base_url = urlsplit(options['base_url'])
+        if not base_url.scheme or not base_url.netloc:
+            raise CommandError(f'--base-url must look like https://example.com, got {options["base_url"]!r}')
+        self.client = Client(HTTP_HOST=base_url.netloc)
+        self.secure = base_url.scheme == 'https'
+
+        previous = {}
+        try:
+            with open(os.path.join(self.output, MANIFEST_NAME), encoding='utf-8') as file:
+                previous = json.load(file)
+        except (OSError, ValueError):
+            pass
+        # Pages whose digest didn't change are kept as they are
+        reusable = {}
+        if not options['force'] and previous.get('base_url') == options['base_url']:
+            reusable = previous.get('files', {})
+
+        started = time.monotonic()
+        self.rendered = self.written = 0
+        files = {}
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, base_url.hostname]):
+            for direction, (ordering, query) in ORDERINGS.items():
+                for page, digest in self.page_digests(ordering, options['base_url']):
+                    key = f'/api/quotes/?{query.format(page=page)}'
+                    stem = f'quotes/page-{page}' + ('-desc' if direction == 'desc' else '')
+                    known = reusable.get(key)
+                    if known and known.get('digest') == digest and os.path.exists(os.path.join(self.output, known['file'])):
+                        files[key] = known
+                    else:
+                        files[key] = {'file': self.publish(key, stem), 'digest': digest}
+                    self.stdout.write(f'Published {len(files)} shards...', ending='\r')
+            for key, stem in RESOURCES:
+                files[key] = {'file': self.publish(key, stem), 'digest': None}
+
+        manifest = {
+            'catalog_version': get_catalog_version(),
+            'generated_at': timezone.now().isoformat(),
+            'base_url': options['base_url'],
+            'files': files,
+        }
+        write_atomic(
+            os.path.join(self.output, MANIFEST_NAME),
+            json.dumps(manifest, ensure_ascii=False, indent=2).encode('utf-8')
+        )
+        # Keyed by "$uri?$args", e.g. map "$uri?$args" $static_api_file { include static_api.map; }
+        write_atomic(os.path.join(self.output, NGINX_MAP_NAME), ''.join(
+            f'"{key}" {options["url_prefix"]}{entry["file"]};\n' for key, entry in files.items()
+        ).encode('utf-8'))
+
+        removed = self.remove_stale(previous.get('files', {}), files)
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'\nPublished {len(files)} shards in {elapsed:.2f}s: {self.rendered} rendered, '
+            f'{self.written} files written, {removed} stale files removed'
+        ))
+
+    def page_digests(self, ordering, base_url):
+        """
+        (page, digest) of every list page in one ordering. A digest covers the page's
+        serialized quotes, the total count and the base URL: everything its response
+        is built from, so an unchanged digest means unchanged bytes.
+        """
+        queryset = QuoteViewSet.queryset
+        if ordering:
+            queryset = queryset.order_by(ordering)
+        row_digests = [
+            hashlib.sha1(json.dumps(row, sort_keys=True, ensure_ascii=False).encode('utf-8')).digest()
+            for row in iter_serialized_quotes(queryset, chunk_size=5000)
+        ]
+        total_count = len(row_digests)
+        page_size = CustomQuotePagination.page_size
+        for page in range(1, get_page_info(total_count, 1, page_size, [])['total_pages'] + 1):
+            start_index, end_index = get_page_bounds(page, total_count, page_size, ordering == '-id')
+            digest = hashlib.sha1(f'{total_count}:{base_url}'.encode('utf-8'))
+            for row_digest in row_digests[start_index:end_index]:
+                digest.update(row_digest)
+            yield page, digest.hexdigest()
+
+    def publish(self, key, stem):
+        """Render the response of key through the API and store it under a content-hashed name"""
+        path, _, query = key.partition('?')
+        response = self.client.get(f'{path}?{query}' if query else path, secure=self.secure)
+        if response.status_code != 200:
+            raise CommandError(f'{key} returned {response.status_code}')
+        self.rendered += 1
+
+        body = response.content
+        name = f'{stem}.{hashlib.sha256(body).hexdigest()[:16]}.json'
+        path = os.path.join(self.output, name)
+        if not os.path.exists(path):
+            write_atomic(path, body)
+            self.written += 1
+            if self.precompress:
+                for encoding in available_encodings():
+                    write_atomic(f'{path}.{"gz" if encoding == "gzip" else encoding}', compress(body, encoding))
+        return name
+
+    def remove_stale(self, previous_files, files):
+        """Delete shards of the previous manifest the new one no longer references"""
+        current = {entry['file'] for entry in files.values()}
+        removed = 0
+        for name in {entry['file'] for entry in previous_files.values()} - current:
+            for path in (name, f'{name}.br', f'{name}.gz'):
+                try:
+                    os.remove(os.path.join(self.output, path))
+                except FileNotFoundError:
+                    pass
+            removed += 1
+        return removed
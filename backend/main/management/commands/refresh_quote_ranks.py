@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from main.cache import bump_catalog_version
+from main.models import QuoteRank
+import time
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the precomputed quote positions used by position lookups'
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        QuoteRank.objects.rebuild()
+        bump_catalog_version()
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Successfully rebuilt {QuoteRank.objects.count()} quote positions in {elapsed:.2f}s'
+        ))
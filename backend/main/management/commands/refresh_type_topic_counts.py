@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from main.cache import bump_catalog_version
+from main.models import TypeTopicCount
+import time
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the type/topic co-occurrence counts behind the type, topic and facet lists'
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        TypeTopicCount.objects.rebuild()
+        bump_catalog_version()
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Successfully rebuilt {TypeTopicCount.objects.count()} type/topic counts in {elapsed:.2f}s'
+        ))
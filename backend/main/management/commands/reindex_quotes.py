@@ -1,6 +1,27 @@
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
 from django.db import connection, transaction
-from main.models import Quote
+from main.cache import bump_catalog_version
+from main.models import Quote, QuoteRank
+import time
+
+# Old to new ID of every quote, numbered 1..N in current ID order
+CREATE_ID_MAP = """
+CREATE TEMPORARY TABLE quote_id_map (old_id bigint PRIMARY KEY, new_id bigint NOT NULL) ON COMMIT DROP;
+INSERT INTO quote_id_map (old_id, new_id)
+SELECT id, new_id FROM (SELECT id, ROW_NUMBER() OVER (ORDER BY id) AS new_id FROM {quote}) numbered
+WHERE id <> new_id;
+ANALYZE quote_id_map;
+"""
+
+# New IDs are written negated first: they may still be taken by rows not renumbered yet
+MOVE_TO_NEGATIVE = """
+UPDATE {table} SET {column} = -m.new_id FROM quote_id_map m WHERE {table}.{column} = m.old_id
+"""
+
+FLIP_TO_POSITIVE = """
+UPDATE {table} SET {column} = -{column} WHERE {column} < 0
+"""
 
 
 class Command(BaseCommand):
@@ -12,93 +33,81 @@ class Command(BaseCommand):
             action='store_true',
             help='Run the command without making actual changes'
         )
+        parser.add_argument(
+            '--no-input', '--noinput',
+            action='store_false',
+            dest='interactive',
+            help='Do not ask for confirmation'
+        )
 
     def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('reindex_quotes renumbers quotes in PostgreSQL only')
+
         dry_run = options.get('dry_run', False)
-        
         if dry_run:
             self.stdout.write(self.style.WARNING('DRY RUN MODE - No changes will be made'))
-        
-        # Get all quotes ordered by current ID to maintain order
-        quotes = Quote.objects.all().order_by('id')
-        total_quotes = quotes.count()
-        
+
+        quote_table = Quote._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT COUNT(*), MIN(id), MAX(id), COUNT(*) FILTER (WHERE id <> new_id) '
+                f'FROM (SELECT id, ROW_NUMBER() OVER (ORDER BY id) AS new_id FROM {quote_table}) numbered'
+            )
+            total_quotes, first_id, last_id, moved_quotes = cursor.fetchone()
+
         self.stdout.write(f'Found {total_quotes} quotes to reindex')
-        
         if total_quotes == 0:
             self.stdout.write(self.style.WARNING('No quotes found'))
             return
-        
-        # Show current ID range
-        first_id = quotes.first().id
-        last_id = quotes.last().id
-        self.stdout.write(f'Current ID range: {first_id} - {last_id}')
-        
-        if not dry_run:
-            # Ask for confirmation
+        self.stdout.write(f'Current ID range: {first_id} - {last_id}, {moved_quotes} quotes need a new ID')
+
+        if dry_run:
+            self.stdout.write(self.style.SUCCESS(
+                f'DRY RUN: Would reindex {total_quotes} quotes to IDs 1 - {total_quotes}'
+            ))
+            return
+
+        if options['interactive']:
             confirm = input('\nThis will reindex all quote IDs starting from 1. Are you sure? (yes/no): ')
             if confirm.lower() != 'yes':
                 self.stdout.write(self.style.ERROR('Operation cancelled'))
                 return
-        
-        try:
-            with transaction.atomic():
-                # Store quotes data in memory with their relationships
-                quotes_data = []
-                for old_quote in quotes:
-                    quotes_data.append({
-                        'quote': old_quote.quote,
-                        'author': old_quote.author,
-                        'book': old_quote.book,
-                        'type': list(old_quote.type.all()),
-                        'topics': list(old_quote.topics.all()),
-                    })
-                
-                if not dry_run:
-                    self.stdout.write('Deleting existing quotes...')
-                    Quote.objects.all().delete()
-                    
-                    # Reset the sequence based on database backend
-                    with connection.cursor() as cursor:
-                        if connection.vendor == 'postgresql':
-                            cursor.execute("ALTER SEQUENCE main_quote_id_seq RESTART WITH 1")
-                        elif connection.vendor == 'sqlite':
-                            cursor.execute("DELETE FROM sqlite_sequence WHERE name='main_quote'")
-                        elif connection.vendor == 'mysql':
-                            cursor.execute("ALTER TABLE main_quote AUTO_INCREMENT = 1")
-                    
-                    self.stdout.write('Creating reindexed quotes...')
-                    
-                    # Recreate quotes with new sequential IDs
-                    for i, data in enumerate(quotes_data, 1):
-                        new_quote = Quote.objects.create(
-                            quote=data['quote'],
-                            author=data['author'],
-                            book=data['book']
-                        )
-                        
-                        # Restore many-to-many relationships
-                        if data['type']:
-                            new_quote.type.set(data['type'])
-                        if data['topics']:
-                            new_quote.topics.set(data['topics'])
-                        
-                        if i % 100 == 0:
-                            self.stdout.write(f'Processed {i}/{total_quotes} quotes...')
-                    
-                    # Verify the reindexing
-                    new_quotes = Quote.objects.all().order_by('id')
-                    new_first_id = new_quotes.first().id
-                    new_last_id = new_quotes.last().id
-                    
-                    self.stdout.write(self.style.SUCCESS(
-                        f'Successfully reindexed {total_quotes} quotes. New ID range: {new_first_id} - {new_last_id}'
-                    ))
-                else:
-                    self.stdout.write(self.style.SUCCESS(
-                        f'DRY RUN: Would reindex {total_quotes} quotes to IDs 1 - {total_quotes}'
-                    ))
-                    
-        except Exception as e:
-            self.stdout.write(self.style.ERROR(f'Error during reindexing: {str(e)}'))
-            raise
\ No newline at end of file
+
+        started = time.monotonic()
+        with transaction.atomic(), connection.cursor() as cursor:
+            # Readers keep seeing the old IDs until commit, writers wait
+            self.step(cursor, 'Locking quotes', f'LOCK TABLE {quote_table} IN SHARE ROW EXCLUSIVE MODE')
+            self.step(cursor, 'Numbering quotes', CREATE_ID_MAP.format(quote=quote_table))
+            # Positions reference quote IDs and are rebuilt below
+            self.step(cursor, 'Clearing quote positions', f'DELETE FROM {QuoteRank._meta.db_table}')
+
+            # Link table foreign keys are deferred, so they are only checked at commit
+            columns = [
+                (quote_table, 'id'),
+                (Quote.type.through._meta.db_table, 'quote_id'),
+                (Quote.topics.through._meta.db_table, 'quote_id'),
+            ]
+            for table, column in columns:
+                self.step(cursor, f'Renumbering {table}', MOVE_TO_NEGATIVE.format(table=table, column=column))
+                self.step(cursor, f'Restoring {table} signs', FLIP_TO_POSITIVE.format(table=table, column=column))
+
+            for sql in connection.ops.sequence_reset_sql(no_style(), [Quote]):
+                self.step(cursor, 'Resetting ID sequence', sql)
+
+            step_started = time.monotonic()
+            QuoteRank.objects.rebuild()
+            self.stdout.write(f'Rebuilding quote positions: {time.monotonic() - step_started:.2f}s')
+
+        bump_catalog_version()
+        self.stdout.write(self.style.SUCCESS(
+            f'Successfully reindexed {total_quotes} quotes ({moved_quotes} moved) in '
+            f'{time.monotonic() - started:.2f}s. New ID range: 1 - {total_quotes}'
+        ))
+
+    def step(self, cursor, label, sql):
+        """Execute sql and report how long it took and how many rows it changed"""
+        started = time.monotonic()
+        cursor.execute(sql)
+        rows = f', {cursor.rowcount} rows' if cursor.rowcount >= 0 else ''
+        self.stdout.write(f'{label}: {time.monotonic() - started:.2f}s{rows}')
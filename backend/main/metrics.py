@@ -0,0 +1,225 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+import heapq
+import json
+import logging
+import math
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+current_metrics = ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    """Query count, SQL time, slowest queries and named timings of one request"""
+    top_queries = 3
+    max_sql_length = 1000
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_ms = 0.0
+        self.timings = defaultdict(float)
+        # Min-heap of (ms, sequence, sql) keeping the slowest queries
+        self.slowest = []
+        # Async views run queries of one request in several worker threads
+        self.lock = threading.Lock()
+
+    def add_query(self, sql, duration):
+        with self.lock:
+            self.queries += 1
+            self.sql_ms += duration
+            entry = (duration, self.queries, sql[:self.max_sql_length])
+            if len(self.slowest) < self.top_queries:
+                heapq.heappush(self.slowest, entry)
+            else:
+                heapq.heappushpop(self.slowest, entry)
+
+    def slowest_queries(self):
+        return [{'ms': round(duration, 2), 'sql': sql} for duration, _, sql in sorted(self.slowest, reverse=True)]
+
+    def server_timing(self, total_ms, size):
+        """Server-Timing header value, e.g. db;dur=3.10;desc="4 queries", serialize;dur=1.20, ..."""
+        metrics = [f'db;dur={self.sql_ms:.2f};desc="{self.queries} queries"']
+        metrics += [f'{name};dur={duration:.2f}' for name, duration in self.timings.items()]
+        if size is not None:
+            metrics.append(f'size;desc="{size} bytes"')
+        metrics.append(f'total;dur={total_ms:.2f}')
+        return ', '.join(metrics)
+
+
+def time_query(execute, sql, params, many, context):
+    """Execute wrapper adding every query to the metrics of the request it runs for"""
+    metrics = current_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.add_query(sql, (time.perf_counter() - started) * 1000)
+
+
+@receiver(connection_created)
+def install_query_timer(sender, connection, **kwargs):
+    # Installed on every connection, so queries from worker threads are counted too:
+    # the request's metrics follow it there through the context variable
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
+
+
+@contextmanager
+def timed(name):
+    """Add the time spent in the block, less its SQL time, to the current request's timing name"""
+    metrics = current_metrics.get()
+    if metrics is None:
+        yield
+        return
+    started = time.perf_counter()
+    sql_ms = metrics.sql_ms
+    try:
+        yield
+    finally:
+        metrics.timings[name] += (time.perf_counter() - started) * 1000 - (metrics.sql_ms - sql_ms)
+
+
+def percentile(sorted_values, percent):
+    """Nearest-rank percentile of an ascending list"""
+    return sorted_values[max(math.ceil(percent / 100 * len(sorted_values)) - 1, 0)]
+
+
+class EndpointStats:
+    """Latency, queries and size of the latest requests per endpoint, in process memory"""
+    percentiles = (50, 90, 95, 99)
+
+    def __init__(self, window):
+        self.window = window
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.samples = {}
+            self.counts = defaultdict(int)
+
+    def record(self, endpoint, total_ms, queries, sql_ms, size):
+        with self.lock:
+            if endpoint not in self.samples:
+                self.samples[endpoint] = deque(maxlen=self.window)
+            self.samples[endpoint].append((total_ms, queries, sql_ms, size or 0))
+            self.counts[endpoint] += 1
+
+    def summary(self):
+        """Percentiles over each endpoint's window plus its request count since start"""
+        with self.lock:
+            snapshot = {endpoint: list(samples) for endpoint, samples in self.samples.items()}
+            counts = dict(self.counts)
+
+        summary = {}
+        for endpoint, samples in sorted(snapshot.items()):
+            durations = sorted(sample[0] for sample in samples)
+            summary[endpoint] = {
+                'count': counts[endpoint],
+                'window': len(samples),
+                **{f'p{percent}_ms': round(percentile(durations, percent), 2) for percent in self.percentiles},
+                'max_ms': round(durations[-1], 2),
+                'mean_queries': round(sum(sample[1] for sample in samples) / len(samples), 2),
+                'mean_sql_ms': round(sum(sample[2] for sample in samples) / len(samples), 2),
+                'mean_bytes': round(sum(sample[3] for sample in samples) / len(samples)),
+            }
+        return summary
+
+
+endpoint_stats = EndpointStats(settings.QUOTES_METRICS_WINDOW)
+
+
+class RequestMetricsMiddleware:
+    """
+    Time each request's queries, serialization and rendering, report them in a
+    Server-Timing header, aggregate them per endpoint and log slow requests.
+    Streamed bodies are produced after the response leaves the middleware, so
+    their queries and size are not included.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        # Set by AuthenticationMiddleware unless a middleware before it answered
+        user = getattr(request, 'user', None)
+        return self.finish(request, response, metrics, started, self.shows_timing(user))
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        # request.user would load the session synchronously
+        show_timing = settings.DEBUG or (hasattr(request, 'auser') and self.shows_timing(await request.auser()))
+        return self.finish(request, response, metrics, started, show_timing)
+
+    @staticmethod
+    def shows_timing(user):
+        """Server-Timing reveals query counts and internals, so only DEBUG and staff users get it"""
+        return settings.DEBUG or (user is not None and user.is_staff)
+
+    def finish(self, request, response, metrics, started, show_timing):
+        """Add the Server-Timing header if shown, record the endpoint sample and log a slow request"""
+        total_ms = (time.perf_counter() - started) * 1000
+        size = None if response.streaming else len(response.content)
+        if show_timing:
+            response['Server-Timing'] = metrics.server_timing(total_ms, size)
+
+        match = request.resolver_match
+        endpoint = f'{request.method} {match.view_name if match else "unresolved"}'
+        endpoint_stats.record(endpoint, total_ms, metrics.queries, metrics.sql_ms, size)
+
+        if total_ms >= settings.QUOTES_SLOW_REQUEST_MS:
+            logger.warning(json.dumps({
+                'event': 'slow_request',
+                'endpoint': endpoint,
+                'path': request.get_full_path(),
+                'status': response.status_code,
+                'total_ms': round(total_ms, 2),
+                'queries': metrics.queries,
+                'sql_ms': round(metrics.sql_ms, 2),
+                **{f'{name}_ms': round(duration, 2) for name, duration in metrics.timings.items()},
+                'bytes': size,
+                'slowest_queries': metrics.slowest_queries(),
+            }, ensure_ascii=False))
+        return response
+
+    def process_template_response(self, request, response):
+        """Time the rendering of DRF and template responses, which happens after this hook"""
+        metrics = current_metrics.get()
+        if metrics is None:
+            return response
+        started = time.perf_counter()
+
+        def rendered(response):
+            metrics.timings['render'] += (time.perf_counter() - started) * 1000
+
+        response.add_post_render_callback(rendered)
+        return response
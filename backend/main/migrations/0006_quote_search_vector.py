@@ -0,0 +1,60 @@
+# Generated by Django 5.0.4 on 2026-10-17 01:29
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0005_alter_quote_type"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="quote",
+            name="search_vector",
+            field=models.GeneratedField(
+                db_persist=True,
+                expression=django.contrib.postgres.search.CombinedSearchVector(
+                    django.contrib.postgres.search.CombinedSearchVector(
+                        django.contrib.postgres.search.CombinedSearchVector(
+                            django.contrib.postgres.search.CombinedSearchVector(
+                                django.contrib.postgres.search.SearchVector(
+                                    "quote", config="simple", weight="A"
+                                ),
+                                "||",
+                                django.contrib.postgres.search.SearchVector(
+                                    "quote", config="russian", weight="A"
+                                ),
+                                django.contrib.postgres.search.SearchConfig("simple"),
+                            ),
+                            "||",
+                            django.contrib.postgres.search.SearchVector(
+                                "quote", config="english", weight="A"
+                            ),
+                            django.contrib.postgres.search.SearchConfig("simple"),
+                        ),
+                        "||",
+                        django.contrib.postgres.search.SearchVector(
+                            "author", config="simple", weight="B"
+                        ),
+                        django.contrib.postgres.search.SearchConfig("simple"),
+                    ),
+                    "||",
+                    django.contrib.postgres.search.SearchVector(
+                        "book", config="simple", weight="C"
+                    ),
+                    django.contrib.postgres.search.SearchConfig("simple"),
+                ),
+                output_field=django.contrib.postgres.search.SearchVectorField(),
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="quote",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["search_vector"], name="main_quote_search_gin"
+            ),
+        ),
+    ]
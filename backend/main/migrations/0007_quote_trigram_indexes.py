@@ -0,0 +1,34 @@
+# Generated by Django 5.0.4 on 2026-10-17 01:30
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0006_quote_search_vector"),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddIndex(
+            model_name="quote",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["quote"], name="main_quote_quote_trgm", opclasses=["gin_trgm_ops"]
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="quote",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["author"], name="main_quote_author_trgm", opclasses=["gin_trgm_ops"]
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="quote",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["book"], name="main_quote_book_trgm", opclasses=["gin_trgm_ops"]
+            ),
+        ),
+    ]
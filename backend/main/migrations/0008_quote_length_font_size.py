@@ -0,0 +1,65 @@
+# Generated by Django 5.0.4 on 2026-10-17 01:35
+
+import django.db.models.functions.text
+import django.db.models.lookups
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0007_quote_trigram_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="quote",
+            name="font_size",
+            field=models.GeneratedField(
+                db_persist=True,
+                expression=models.Case(
+                    models.When(
+                        django.db.models.lookups.GreaterThan(
+                            django.db.models.functions.text.Length("quote"), 600
+                        ),
+                        then=models.Value("min"),
+                    ),
+                    models.When(
+                        django.db.models.lookups.GreaterThan(
+                            django.db.models.functions.text.Length("quote"), 400
+                        ),
+                        then=models.Value("under"),
+                    ),
+                    models.When(
+                        django.db.models.lookups.GreaterThan(
+                            django.db.models.functions.text.Length("quote"), 300
+                        ),
+                        then=models.Value("middle"),
+                    ),
+                    models.When(
+                        django.db.models.lookups.GreaterThan(
+                            django.db.models.functions.text.Length("quote"), 100
+                        ),
+                        then=models.Value("upper"),
+                    ),
+                    default=models.Value("max"),
+                ),
+                output_field=models.CharField(max_length=10),
+                verbose_name="Font size",
+            ),
+        ),
+        migrations.AddField(
+            model_name="quote",
+            name="length",
+            field=models.GeneratedField(
+                db_persist=True,
+                expression=django.db.models.functions.text.Length("quote"),
+                output_field=models.PositiveIntegerField(),
+                verbose_name="Length",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="quote",
+            index=models.Index(fields=["length", "id"], name="main_quote_length_id_idx"),
+        ),
+    ]
@@ -0,0 +1,95 @@
+# Generated by Django 5.0.4 on 2026-10-17 01:50
+
+import django.db.models.constraints
+import django.db.models.deletion
+from django.db import migrations, models
+
+BUILD_QUOTE_RANKS = """
+INSERT INTO main_quoterank (scope, quote_id, length_position, id_position)
+SELECT scope, quote_id,
+       ROW_NUMBER() OVER (PARTITION BY scope ORDER BY length, quote_id),
+       ROW_NUMBER() OVER (PARTITION BY scope ORDER BY quote_id)
+FROM (
+    SELECT '' AS scope, q.id AS quote_id, q.length
+    FROM main_quote q
+    UNION ALL
+    SELECT 'type=' || qt.type_id, q.id, q.length
+    FROM main_quote q JOIN main_quote_type qt ON qt.quote_id = q.id
+    UNION ALL
+    SELECT 'topic=' || qp.topic_id, q.id, q.length
+    FROM main_quote q JOIN main_quote_topics qp ON qp.quote_id = q.id
+    UNION ALL
+    SELECT 'type=' || qt.type_id || '&topic=' || qp.topic_id, q.id, q.length
+    FROM main_quote q
+    JOIN main_quote_type qt ON qt.quote_id = q.id
+    JOIN main_quote_topics qp ON qp.quote_id = q.id
+) scoped;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0008_quote_length_font_size"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="QuoteRank",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("scope", models.CharField(max_length=50, verbose_name="Scope")),
+                (
+                    "length_position",
+                    models.PositiveIntegerField(verbose_name="Position by length"),
+                ),
+                (
+                    "id_position",
+                    models.PositiveIntegerField(verbose_name="Position by ID"),
+                ),
+                (
+                    "quote",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="main.quote",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Quote rank",
+                "verbose_name_plural": "Quote ranks",
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="quoterank",
+            constraint=models.UniqueConstraint(
+                deferrable=django.db.models.constraints.Deferrable["IMMEDIATE"],
+                fields=("scope", "length_position"),
+                name="main_quoterank_scope_length_position",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="quoterank",
+            constraint=models.UniqueConstraint(
+                deferrable=django.db.models.constraints.Deferrable["IMMEDIATE"],
+                fields=("scope", "id_position"),
+                name="main_quoterank_scope_id_position",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="quoterank",
+            constraint=models.UniqueConstraint(
+                fields=("scope", "quote"), name="main_quoterank_scope_quote"
+            ),
+        ),
+        migrations.RunSQL(BUILD_QUOTE_RANKS, migrations.RunSQL.noop),
+    ]
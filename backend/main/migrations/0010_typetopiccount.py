@@ -0,0 +1,71 @@
+# Generated by Django 5.0.4 on 2026-10-17 01:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+BUILD_TYPE_TOPIC_COUNTS = """
+INSERT INTO main_typetopiccount (type_id, topic_id, count)
+SELECT qt.type_id, qp.topic_id, COUNT(*)
+FROM main_quote_type qt JOIN main_quote_topics qp ON qp.quote_id = qt.quote_id
+GROUP BY qt.type_id, qp.topic_id
+UNION ALL
+SELECT type_id, NULL, COUNT(*) FROM main_quote_type GROUP BY type_id
+UNION ALL
+SELECT NULL, topic_id, COUNT(*) FROM main_quote_topics GROUP BY topic_id;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0009_quoterank"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TypeTopicCount",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("count", models.IntegerField(default=0, verbose_name="Count")),
+                (
+                    "topic",
+                    models.ForeignKey(
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="main.topic",
+                    ),
+                ),
+                (
+                    "type",
+                    models.ForeignKey(
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="main.type",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Type topic count",
+                "verbose_name_plural": "Type topic counts",
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="typetopiccount",
+            constraint=models.UniqueConstraint(
+                fields=("type", "topic"),
+                name="main_typetopiccount_type_topic",
+                nulls_distinct=False,
+            ),
+        ),
+        migrations.RunSQL(BUILD_TYPE_TOPIC_COUNTS, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,101 @@
+# Generated by Django 5.0.4 on 2026-10-17 02:13
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def author_sort_key(author):
+    parts = author.split()
+    surname = parts[1] if len(parts) >= 2 else parts[0] if parts else author.strip()
+    return surname.lower()
+
+
+def build_statistics(apps, schema_editor):
+    Quote = apps.get_model("main", "Quote")
+    AuthorCount = apps.get_model("main", "AuthorCount")
+    UnlinkedQuoteCount = apps.get_model("main", "UnlinkedQuoteCount")
+
+    rows = Quote.objects.order_by().values_list("author").annotate(count=Count("id"))
+    AuthorCount.objects.bulk_create(
+        (
+            AuthorCount(author=author, sort_key=author_sort_key(author), count=count)
+            for author, count in rows
+        ),
+        batch_size=5000,
+    )
+    UnlinkedQuoteCount.objects.bulk_create(
+        UnlinkedQuoteCount(
+            field=field,
+            count=Quote.objects.filter(**{f"{field}__isnull": True}).count(),
+        )
+        for field in ("type", "topics")
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0010_typetopiccount"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="UnlinkedQuoteCount",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "field",
+                    models.CharField(max_length=20, unique=True, verbose_name="Field"),
+                ),
+                ("count", models.IntegerField(default=0, verbose_name="Count")),
+            ],
+            options={
+                "verbose_name": "Unlinked quote count",
+                "verbose_name_plural": "Unlinked quote counts",
+            },
+        ),
+        migrations.CreateModel(
+            name="AuthorCount",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "author",
+                    models.CharField(max_length=200, unique=True, verbose_name="Author"),
+                ),
+                (
+                    "sort_key",
+                    models.CharField(
+                        db_collation="C", max_length=200, verbose_name="Sort key"
+                    ),
+                ),
+                ("count", models.IntegerField(default=0, verbose_name="Count")),
+            ],
+            options={
+                "verbose_name": "Author count",
+                "verbose_name_plural": "Author counts",
+                "indexes": [
+                    models.Index(
+                        fields=["sort_key", "author"],
+                        name="main_authorcount_sort_key_idx",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(build_statistics, migrations.RunPython.noop),
+    ]
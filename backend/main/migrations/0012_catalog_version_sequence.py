@@ -0,0 +1,29 @@
+# Generated by Django 5.0.4 on 2026-10-17 03:05
+
+import time
+
+from django.db import migrations
+
+
+def create_sequence(apps, schema_editor):
+    # Start from a timestamp, above the versions the response cache used to keep,
+    # so entries cached under an old version are never served again
+    schema_editor.execute("CREATE SEQUENCE main_catalog_version")
+    schema_editor.execute(
+        "SELECT setval('main_catalog_version', %s)", [int(time.time() * 1000)]
+    )
+
+
+def drop_sequence(apps, schema_editor):
+    schema_editor.execute("DROP SEQUENCE main_catalog_version")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0011_author_count_unlinked_quote_count"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_sequence, drop_sequence),
+    ]
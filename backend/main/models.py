@@ -1,4 +1,10 @@
-from django.db import models
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
+from django.db import connection, models, transaction
+from django.db.models import Case, Count, F, Value, When
+from django.db.models.functions import Length
+from django.db.models.lookups import GreaterThan
+from collections import Counter
 
 # Create your models here.
 class Type(models.Model):
@@ -21,37 +27,534 @@ class Topic(models.Model):
     def __str__(self):
         return self.topic
 
+def quote_search_vector():
+    """Search vector expression: quote words in simple/russian/english configs, author and book as-is"""
+    return (
+        SearchVector('quote', config='simple', weight='A')
+        + SearchVector('quote', config='russian', weight='A')
+        + SearchVector('quote', config='english', weight='A')
+        + SearchVector('author', config='simple', weight='B')
+        + SearchVector('book', config='simple', weight='C')
+    )
+
+def quote_font_size():
+    """Font size bucket expression by quote length, largest font for the shortest quotes"""
+    return Case(
+        When(GreaterThan(Length('quote'), 600), then=Value('min')),
+        When(GreaterThan(Length('quote'), 400), then=Value('under')),
+        When(GreaterThan(Length('quote'), 300), then=Value('middle')),
+        When(GreaterThan(Length('quote'), 100), then=Value('upper')),
+        default=Value('max'),
+    )
+
+def fetch_facets(sql, params):
+    """Run a facets query returning (kind, id, name, count) rows into the facets response"""
+    facets = {'total_count': 0, 'types': [], 'topics': []}
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        for kind, facet_id, name, count in cursor.fetchall():
+            if kind == 'total':
+                facets['total_count'] = count
+            else:
+                facets[f'{kind}s'].append({'id': facet_id, kind: name, 'count': count})
+    return facets
+
+class QuoteQuerySet(models.QuerySet):
+    FACETS_SQL = """
+        WITH matches AS (
+            SELECT base.id, {type_match} AS type_match, {topic_match} AS topic_match
+            FROM ({base}) base
+        )
+        SELECT 'type', t.id, t.type, COUNT(*)
+        FROM matches m
+        JOIN {quote_type} qt ON qt.quote_id = m.id
+        JOIN {type} t ON t.id = qt.type_id
+        WHERE m.topic_match
+        GROUP BY t.id, t.type
+        UNION ALL
+        SELECT 'topic', p.id, p.topic, COUNT(*)
+        FROM matches m
+        JOIN {quote_topics} qp ON qp.quote_id = m.id
+        JOIN {topic} p ON p.id = qp.topic_id
+        WHERE m.type_match
+        GROUP BY p.id, p.topic
+        UNION ALL
+        SELECT 'total', NULL, NULL, COUNT(*)
+        FROM matches m
+        WHERE m.type_match AND m.topic_match
+        ORDER BY 1, 3
+    """
+
+    def facet_counts(self, type_id=None, topic_id=None):
+        """
+        Quote counts per type and per topic, plus the total, for these quotes narrowed
+        by type_id and topic_id, all from one grouped query. Each facet ignores its own
+        selection, so type counts follow the topic only and topic counts the type only.
+        """
+        base_sql, base_params = self.order_by().values('id').query.sql_with_params()
+        quote_type = self.model.type.through._meta.db_table
+        quote_topics = self.model.topics.through._meta.db_table
+        match_params = []
+        type_match = topic_match = 'TRUE'
+        if type_id is not None:
+            type_match = f'EXISTS (SELECT 1 FROM {quote_type} WHERE quote_id = base.id AND type_id = %s)'
+            match_params.append(type_id)
+        if topic_id is not None:
+            topic_match = f'EXISTS (SELECT 1 FROM {quote_topics} WHERE quote_id = base.id AND topic_id = %s)'
+            match_params.append(topic_id)
+        sql = self.FACETS_SQL.format(
+            base=base_sql,
+            type_match=type_match,
+            topic_match=topic_match,
+            quote_type=quote_type,
+            quote_topics=quote_topics,
+            type=Type._meta.db_table,
+            topic=Topic._meta.db_table,
+        )
+        # The match columns come before the base query in the SQL text
+        params = [*match_params, *base_params]
+        return fetch_facets(sql, params)
+
 class Quote(models.Model):
     quote = models.TextField('Quote')
     author = models.CharField('Author', max_length=200, blank=True)
     book = models.CharField('Book', max_length=200, blank=True)
     type = models.ManyToManyField(Type, blank=True)
     topics = models.ManyToManyField(Topic, blank=True)
+    search_vector = models.GeneratedField(
+        expression=quote_search_vector(),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
+    length = models.GeneratedField(
+        expression=Length('quote'),
+        output_field=models.PositiveIntegerField(),
+        db_persist=True,
+        verbose_name='Length',
+    )
+    font_size = models.GeneratedField(
+        expression=quote_font_size(),
+        output_field=models.CharField(max_length=10),
+        db_persist=True,
+        verbose_name='Font size',
+    )
+
+    objects = QuoteQuerySet.as_manager()
 
     @property
     def signs(self):
-        return len(self.quote) if self.quote else 0
-    
-    @property
-    def font_size(self):
-        if self.signs > 600:
-            return 'min'
-        elif self.signs > 400:
-            return 'under'
-        elif self.signs > 300:
-            return 'middle'
-        elif self.signs > 100:
-            return 'upper'
-        else:
-            return 'max'
+        return self.length or 0
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # length, font_size and search_vector are computed by the database; drop
+        # stale values so they are reloaded on next access
+        for field_name in ('length', 'font_size', 'search_vector'):
+            self.__dict__.pop(field_name, None)
+
     class Meta:
         verbose_name_plural = 'Quotes'
         verbose_name = 'Quote'
+        indexes = [
+            GinIndex(fields=['search_vector'], name='main_quote_search_gin'),
+            GinIndex(fields=['quote'], name='main_quote_quote_trgm', opclasses=['gin_trgm_ops']),
+            GinIndex(fields=['author'], name='main_quote_author_trgm', opclasses=['gin_trgm_ops']),
+            GinIndex(fields=['book'], name='main_quote_book_trgm', opclasses=['gin_trgm_ops']),
+            models.Index(fields=['length', 'id'], name='main_quote_length_id_idx'),
+        ]
 
     def __str__(self):
         return self.quote
     
 
+def rank_scope(type_id=None, topic_id=None):
+    """QuoteRank scope for a type/topic filter combination, '' for the whole catalog"""
+    parts = []
+    if type_id:
+        parts.append(f'type={int(type_id)}')
+    if topic_id:
+        parts.append(f'topic={int(topic_id)}')
+    return '&'.join(parts)
+
+def parse_rank_scope(scope):
+    """(type_id, topic_id) of a QuoteRank scope, the reverse of rank_scope"""
+    params = dict(part.split('=') for part in scope.split('&') if part)
+    type_id, topic_id = params.get('type'), params.get('topic')
+    return int(type_id) if type_id else None, int(topic_id) if topic_id else None
+
+def lock_table(model):
+    """
+    Lock a derived table until the end of the transaction so rebuilds run one at a
+    time; EXCLUSIVE mode blocks other writers but not readers.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f'LOCK TABLE {model._meta.db_table} IN EXCLUSIVE MODE')
+
+class QuoteRankManager(models.Manager):
+    REBUILD_SQL = """
+        INSERT INTO {rank} (scope, quote_id, length_position, id_position)
+        SELECT scope, quote_id,
+               ROW_NUMBER() OVER (PARTITION BY scope ORDER BY length, quote_id),
+               ROW_NUMBER() OVER (PARTITION BY scope ORDER BY quote_id)
+        FROM (
+            SELECT '' AS scope, q.id AS quote_id, q.length
+            FROM {quote} q
+            UNION ALL
+            SELECT 'type=' || qt.type_id, q.id, q.length
+            FROM {quote} q JOIN {quote_type} qt ON qt.quote_id = q.id
+            UNION ALL
+            SELECT 'topic=' || qp.topic_id, q.id, q.length
+            FROM {quote} q JOIN {quote_topics} qp ON qp.quote_id = q.id
+            UNION ALL
+            SELECT 'type=' || qt.type_id || '&topic=' || qp.topic_id, q.id, q.length
+            FROM {quote} q
+            JOIN {quote_type} qt ON qt.quote_id = q.id
+            JOIN {quote_topics} qp ON qp.quote_id = q.id
+        ) scoped
+    """
+
+    SCOPE_SQL = """
+        INSERT INTO {rank} (scope, quote_id, length_position, id_position)
+        SELECT %s, q.id,
+               ROW_NUMBER() OVER (ORDER BY q.length, q.id),
+               ROW_NUMBER() OVER (ORDER BY q.id)
+        FROM {quote} q {joins}
+    """
+
+    def _format(self, sql, **kwargs):
+        return sql.format(
+            rank=self.model._meta.db_table,
+            quote=Quote._meta.db_table,
+            quote_type=Quote.type.through._meta.db_table,
+            quote_topics=Quote.topics.through._meta.db_table,
+            **kwargs
+        )
+
+    def rebuild(self, scopes=None):
+        """
+        Recompute the positions of the given scopes, one window-function INSERT each,
+        or of every scope at once. Scopes left without quotes are just deleted.
+        """
+        with transaction.atomic():
+            lock_table(self.model)
+            # DELETE rather than TRUNCATE so readers keep the old positions until commit
+            if scopes is None:
+                self.all().delete()
+                with connection.cursor() as cursor:
+                    cursor.execute(self._format(self.REBUILD_SQL))
+                return
+
+            self.filter(scope__in=scopes).delete()
+            with connection.cursor() as cursor:
+                for scope in sorted(scopes):
+                    type_id, topic_id = parse_rank_scope(scope)
+                    joins, params = [], [scope]
+                    if type_id:
+                        joins.append('JOIN {quote_type} qt ON qt.quote_id = q.id AND qt.type_id = %s')
+                        params.append(type_id)
+                    if topic_id:
+                        joins.append('JOIN {quote_topics} qp ON qp.quote_id = q.id AND qp.topic_id = %s')
+                        params.append(topic_id)
+                    cursor.execute(self._format(self.SCOPE_SQL, joins=self._format(' '.join(joins))), params)
+
+    POSITION_BEFORE_SQL = {
+        # Last position ordered before the given (length, id) key, walking the quote
+        # index back from the key until a quote of the scope
+        'length_position': """
+            SELECT r.length_position FROM {quote} q
+            JOIN {rank} r ON r.quote_id = q.id AND r.scope = %s
+            WHERE (q.length, q.id) < (%s, %s)
+            ORDER BY q.length DESC, q.id DESC
+            LIMIT 1
+        """,
+        'id_position': """
+            SELECT id_position FROM {rank}
+            WHERE scope = %s AND quote_id < %s
+            ORDER BY quote_id DESC
+            LIMIT 1
+        """,
+    }
+
+    def _position_before(self, cursor, field, scope, length, quote_id):
+        params = [scope, length, quote_id] if field == 'length_position' else [scope, quote_id]
+        cursor.execute(self._format(self.POSITION_BEFORE_SQL[field]), params)
+        row = cursor.fetchone()
+        return row[0] if row else 0
+
+    def _shift(self, cursor, scope, field, first, delta):
+        """Move every position of scope from first on by delta"""
+        cursor.execute(self._format(
+            f'UPDATE {{rank}} SET {field} = {field} + %s WHERE scope = %s AND {field} >= %s'
+        ), [delta, scope, first])
+
+    def insert(self, quote_id, scopes):
+        """
+        Rank a quote in scopes it isn't ranked in yet, shifting the quotes after it.
+        Takes the rank table lock until the end of the calling transaction.
+        """
+        if not scopes:
+            return
+        with transaction.atomic():
+            lock_table(self.model)
+            length = Quote.objects.filter(pk=quote_id).values_list('length', flat=True).get()
+            with connection.cursor() as cursor:
+                for scope in sorted(scopes):
+                    positions = {}
+                    for field in ('length_position', 'id_position'):
+                        positions[field] = self._position_before(cursor, field, scope, length, quote_id) + 1
+                        self._shift(cursor, scope, field, positions[field], 1)
+                    self.create(scope=scope, quote_id=quote_id, **positions)
+
+    def remove(self, quote_id, scopes):
+        """
+        Unrank a quote from scopes, shifting the quotes after it back. Takes the rank
+        table lock until the end of the calling transaction.
+        """
+        with transaction.atomic():
+            lock_table(self.model)
+            ranks = self.filter(quote_id=quote_id, scope__in=scopes)
+            rows = list(ranks.values_list('scope', 'length_position', 'id_position'))
+            ranks.delete()
+            with connection.cursor() as cursor:
+                for scope, length_position, id_position in sorted(rows):
+                    self._shift(cursor, scope, 'length_position', length_position + 1, -1)
+                    self._shift(cursor, scope, 'id_position', id_position + 1, -1)
+
+    def move(self, quote_id, scopes):
+        """
+        Re-rank a quote by its new length in scopes, shifting only the quotes between
+        its old and new positions. Takes the rank table lock until the end
+        of the calling transaction.
+        """
+        with transaction.atomic():
+            lock_table(self.model)
+            length = Quote.objects.filter(pk=quote_id).values_list('length', flat=True).get()
+            rows = sorted(self.filter(quote_id=quote_id, scope__in=scopes).values_list('scope', 'length_position'))
+            with connection.cursor() as cursor:
+                for scope, old in rows:
+                    before = self._position_before(cursor, 'length_position', scope, length, quote_id)
+                    # Positions after the old one drop by one once the quote leaves it
+                    new = before if before > old else before + 1
+                    if new == old:
+                        continue
+                    cursor.execute(self._format("""
+                        UPDATE {rank} SET length_position = CASE
+                            WHEN quote_id = %s THEN %s ELSE length_position + %s END
+                        WHERE scope = %s AND length_position BETWEEN %s AND %s
+                    """), [quote_id, new, -1 if new > old else 1, scope, min(old, new), max(old, new)])
+
+class QuoteRank(models.Model):
+    """
+    Materialized position of every quote in each type/topic filter scope, for the
+    default (length, id) and id orderings. Single quote and link changes shift the
+    positions around the quote in the same transaction; bulk changes rebuild.
+    """
+    scope = models.CharField('Scope', max_length=50)
+    quote = models.ForeignKey(Quote, on_delete=models.CASCADE, related_name='+')
+    length_position = models.PositiveIntegerField('Position by length')
+    id_position = models.PositiveIntegerField('Position by ID')
+
+    objects = QuoteRankManager()
+
+    class Meta:
+        verbose_name_plural = 'Quote ranks'
+        verbose_name = 'Quote rank'
+        constraints = [
+            # Deferrable so shifting positions by one is checked once the UPDATE is done
+            models.UniqueConstraint(
+                fields=['scope', 'length_position'], name='main_quoterank_scope_length_position',
+                deferrable=models.Deferrable.IMMEDIATE,
+            ),
+            models.UniqueConstraint(
+                fields=['scope', 'id_position'], name='main_quoterank_scope_id_position',
+                deferrable=models.Deferrable.IMMEDIATE,
+            ),
+            models.UniqueConstraint(fields=['scope', 'quote'], name='main_quoterank_scope_quote'),
+        ]
+
+class TypeTopicCountManager(models.Manager):
+    REBUILD_SQL = """
+        INSERT INTO {counts} (type_id, topic_id, count)
+        SELECT qt.type_id, qp.topic_id, COUNT(*)
+        FROM {quote_type} qt JOIN {quote_topics} qp ON qp.quote_id = qt.quote_id
+        GROUP BY qt.type_id, qp.topic_id
+        UNION ALL
+        SELECT type_id, NULL, COUNT(*) FROM {quote_type} GROUP BY type_id
+        UNION ALL
+        SELECT NULL, topic_id, COUNT(*) FROM {quote_topics} GROUP BY topic_id
+    """
+
+    ADJUST_SQL = """
+        INSERT INTO {counts} (type_id, topic_id, count) VALUES {values}
+        ON CONFLICT (type_id, topic_id) DO UPDATE SET count = {counts}.count + EXCLUDED.count
+    """
+
+    FACETS_SQL = """
+        SELECT 'type', t.id, t.type, c.count
+        FROM {counts} c JOIN {type} t ON t.id = c.type_id
+        WHERE c.topic_id IS NOT DISTINCT FROM %s AND c.count > 0
+        UNION ALL
+        SELECT 'topic', p.id, p.topic, c.count
+        FROM {counts} c JOIN {topic} p ON p.id = c.topic_id
+        WHERE c.type_id IS NOT DISTINCT FROM %s AND c.count > 0
+        UNION ALL
+        SELECT 'total', NULL, NULL, {total}
+        ORDER BY 1, 3
+    """
+
+    def _format(self, sql, **kwargs):
+        return sql.format(
+            counts=self.model._meta.db_table,
+            quote_type=Quote.type.through._meta.db_table,
+            quote_topics=Quote.topics.through._meta.db_table,
+            type=Type._meta.db_table,
+            topic=Topic._meta.db_table,
+            **kwargs
+        )
+
+    def rebuild(self):
+        """Recount every type/topic pair from the quote link tables"""
+        with transaction.atomic():
+            lock_table(self.model)
+            self.all().delete()
+            with connection.cursor() as cursor:
+                cursor.execute(self._format(self.REBUILD_SQL))
+
+    def adjust(self, pairs, delta):
+        """Add delta to the count of each (type_id, topic_id) pair, once per occurrence"""
+        changes = Counter(pairs)
+        if not changes:
+            return
+        values = ', '.join(['(%s, %s, %s)'] * len(changes))
+        params = [value for (type_id, topic_id), times in changes.items() for value in (type_id, topic_id, times * delta)]
+        with connection.cursor() as cursor:
+            cursor.execute(self._format(self.ADJUST_SQL, values=values), params)
+        if delta < 0:
+            self.filter(count__lte=0).delete()
+
+    def facet_counts(self, type_id=None, topic_id=None):
+        """
+        Same result as QuoteQuerySet.facet_counts over all quotes, read from the
+        precomputed counts instead of joining the link tables.
+        """
+        params = [topic_id, type_id]
+        if type_id is None and topic_id is None:
+            total = f'(SELECT COUNT(*) FROM {Quote._meta.db_table})'
+        else:
+            total = (
+                f'(SELECT COALESCE(SUM(count), 0) FROM {self.model._meta.db_table}'
+                ' WHERE type_id IS NOT DISTINCT FROM %s AND topic_id IS NOT DISTINCT FROM %s)'
+            )
+            params += [type_id, topic_id]
+        return fetch_facets(self._format(self.FACETS_SQL, total=total), params)
+
+class TypeTopicCount(models.Model):
+    """
+    Number of quotes having both a type and a topic. Rows without a topic count all
+    quotes of their type, rows without a type all quotes of their topic.
+    Maintained from the quote type/topic m2m and quote delete signals.
+    """
+    type = models.ForeignKey(Type, null=True, on_delete=models.CASCADE, related_name='+')
+    topic = models.ForeignKey(Topic, null=True, on_delete=models.CASCADE, related_name='+')
+    count = models.IntegerField('Count', default=0)
+
+    objects = TypeTopicCountManager()
+
+    class Meta:
+        verbose_name_plural = 'Type topic counts'
+        verbose_name = 'Type topic count'
+        constraints = [
+            models.UniqueConstraint(fields=['type', 'topic'], name='main_typetopiccount_type_topic', nulls_distinct=False),
+        ]
+
+def author_sort_key(author):
+    """Statistics page sort key of an author: the lowercased second word of the name, else the first"""
+    parts = author.split()
+    surname = parts[1] if len(parts) >= 2 else parts[0] if parts else author.strip()
+    return surname.lower()
+
+class AuthorCountManager(models.Manager):
+    ADJUST_SQL = """
+        INSERT INTO {counts} (author, sort_key, count) VALUES {values}
+        ON CONFLICT (author) DO UPDATE SET count = {counts}.count + EXCLUDED.count
+    """
+
+    def rebuild(self):
+        """Recount quotes per author"""
+        with transaction.atomic():
+            lock_table(self.model)
+            self.all().delete()
+            rows = Quote.objects.order_by().values_list('author').annotate(count=Count('id'))
+            self.bulk_create(
+                (self.model(author=author, sort_key=author_sort_key(author), count=count) for author, count in rows),
+                batch_size=5000,
+            )
+
+    def adjust(self, authors, delta):
+        """Add delta to the count of each author, once per occurrence"""
+        changes = Counter(authors)
+        if not changes:
+            return
+        values = ', '.join(['(%s, %s, %s)'] * len(changes))
+        params = [
+            value for author, times in changes.items()
+            for value in (author, author_sort_key(author), times * delta)
+        ]
+        with connection.cursor() as cursor:
+            cursor.execute(self.ADJUST_SQL.format(counts=self.model._meta.db_table, values=values), params)
+        if delta < 0:
+            self.filter(count__lte=0).delete()
+
+class AuthorCount(models.Model):
+    """
+    Number of quotes per author with the statistics page sort key, the row with an
+    empty author counting quotes without one. Maintained from the quote signals.
+    """
+    author = models.CharField('Author', max_length=200, unique=True)
+    # C collation sorts by code point, as the statistics page always did in Python
+    sort_key = models.CharField('Sort key', max_length=200, db_collation='C')
+    count = models.IntegerField('Count', default=0)
+
+    objects = AuthorCountManager()
+
+    class Meta:
+        verbose_name_plural = 'Author counts'
+        verbose_name = 'Author count'
+        indexes = [
+            models.Index(fields=['sort_key', 'author'], name='main_authorcount_sort_key_idx'),
+        ]
+
+class UnlinkedQuoteCountManager(models.Manager):
+    def rebuild(self):
+        """Recount quotes without any type and without any topic"""
+        with transaction.atomic():
+            lock_table(self.model)
+            self.all().delete()
+            self.bulk_create(
+                self.model(field=field, count=Quote.objects.filter(**{f'{field}__isnull': True}).count())
+                for field in self.model.FIELDS
+            )
+
+    def adjust(self, field, delta):
+        if delta:
+            self.filter(field=field).update(count=F('count') + delta)
+
+class UnlinkedQuoteCount(models.Model):
+    """
+    Number of quotes without any link in a Quote many-to-many field, 'type' or
+    'topics'. Maintained from the quote and m2m signals.
+    """
+    FIELDS = ('type', 'topics')
+
+    field = models.CharField('Field', max_length=20, unique=True)
+    count = models.IntegerField('Count', default=0)
+
+    objects = UnlinkedQuoteCountManager()
+
+    class Meta:
+        verbose_name_plural = 'Unlinked quote counts'
+        verbose_name = 'Unlinked quote count'
+
 class Page(models.Model):
     title = models.CharField('Title', max_length=200)
     slug = models.CharField('Slug', max_length=200, unique = True)
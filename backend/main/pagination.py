@@ -1,18 +1,115 @@
+from django.core.exceptions import ValidationError
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from django.db.models import F, Q
+from django.db.models.expressions import OrderBy
 from collections import OrderedDict
+import base64
+import json
 import math
 
+
+def get_page_bounds(page_number, total_count, page_size, is_descending):
+    """
+    Start and end index of a page following the merged page rules: the remainder
+    is merged into the last page for ascending order and into the first for -id.
+    """
+    remainder = total_count % page_size
+    is_merged = math.ceil(total_count / page_size) > 1 and remainder > 0
+    if is_merged and is_descending:
+        if page_number == 1:
+            return 0, page_size + remainder
+        start_index = page_size + remainder + (page_number - 2) * page_size
+        return start_index, start_index + page_size
+
+    start_index = (page_number - 1) * page_size
+    if is_merged and page_number == math.ceil(total_count / page_size) - 1:
+        return start_index, total_count
+    return start_index, min(start_index + page_size, total_count)
+
+
+def get_page_info(total_count, current_page, page_size, data):
+    """Page metadata of the quote list envelope for page current_page holding data"""
+    # Calculate adjusted pages (accounting for merged last page)
+    standard_pages = math.ceil(total_count / page_size)
+    if standard_pages > 1:
+        last_page_items = total_count % page_size
+        if last_page_items > 0 and last_page_items < page_size:
+            total_pages = standard_pages - 1
+        else:
+            total_pages = standard_pages
+    else:
+        total_pages = standard_pages
+
+    # Calculate items range for current page
+    if current_page == total_pages and total_pages > 1:
+        # This is the merged last page
+        start_item = ((current_page - 1) * page_size) + 1
+        end_item = total_count
+        items_on_page = len(data)
+    else:
+        # Normal page
+        start_item = ((current_page - 1) * page_size) + 1
+        end_item = min(current_page * page_size, total_count)
+        items_on_page = len(data)
+
+    # Get actual IDs from the data for the label in min-max format
+    if data:
+        first_id = data[0].get('id', start_item) if isinstance(data[0], dict) else start_item
+        last_id = data[-1].get('id', end_item) if isinstance(data[-1], dict) else end_item
+        page_label = f"{min(first_id, last_id)} - {max(first_id, last_id)}"
+    else:
+        page_label = f"{start_item} - {end_item}"
+
+    return OrderedDict([
+        ('count', total_count),
+        ('total_pages', total_pages),
+        ('current_page', current_page),
+        ('page_size', page_size),
+        ('items_on_page', items_on_page),
+        ('start_item', start_item),
+        ('end_item', end_item),
+        ('page_label', page_label),
+    ])
+
+
+class KeysetPage:
+    """Page fetched by cursor, exposing what get_paginated_response and the links read"""
+    def __init__(self, object_list, number, paginator):
+        self.object_list = list(object_list)
+        self.number = number
+        self.paginator = paginator
+
+    def has_next(self):
+        return self.number < self.paginator.num_pages
+
+    def has_previous(self):
+        return self.number > 1
+
+    def next_page_number(self):
+        return self.number + 1 if self.has_next() else None
+
+    def previous_page_number(self):
+        return self.number - 1 if self.has_previous() else None
+
 class CustomQuotePagination(PageNumberPagination):
     """
     Custom pagination that follows special logic:
     - 100 quotes per page for all pages except the merged page
     - For ordering=id: Last page gets up to 199 quotes (previous page + remainder) 
     - For ordering=-id: First page gets up to 199 quotes (first + second page)
+
+    Pages can also be fetched by keyset: next/previous links carry a cursor with the
+    boundary ordering key, e.g. (length, id), so the database seeks straight to the
+    page through the index instead of skipping OFFSET rows.
     """
     page_size = 100
     page_size_query_param = 'page_size'
     max_page_size = 199
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
     
     def _is_descending_order(self, request):
         """Определить, используется ли убывающая сортировка по ID"""
@@ -38,7 +135,124 @@ class CustomQuotePagination(PageNumberPagination):
             
         return page_size
 
+    def _get_ordering_keys(self, queryset):
+        """Ordering of the queryset as (expression, descending) pairs ending with the primary key"""
+        keys = []
+        for term in queryset.query.order_by:
+            if isinstance(term, str):
+                keys.append((F(term.lstrip('-')), term.startswith('-')))
+            elif isinstance(term, OrderBy):
+                keys.append((term.expression, term.descending))
+            else:
+                keys.append((term, False))
+
+        if not any(isinstance(key, F) and key.name in ('id', 'pk') for key, _ in keys):
+            keys.append((F('id'), keys[-1][1] if keys else False))
+        return keys
+
+    def _keyset_filter(self, values, forward):
+        """Rows strictly after (forward) or before the given key values in queryset ordering"""
+        condition = Q()
+        equal = Q()
+        for index, ((_, descending), value) in enumerate(zip(self.ordering_keys, values)):
+            lookup = 'gt' if forward != descending else 'lt'
+            condition |= equal & Q(**{f'keyset_{index}__{lookup}': value})
+            equal &= Q(**{f'keyset_{index}': value})
+
+        # Inclusive bound on the leading key gives the planner an index range to start from
+        descending = self.ordering_keys[0][1]
+        bound = 'gte' if forward != descending else 'lte'
+        return condition & Q(**{f'keyset_0__{bound}': values[0]})
+
+    def _item_keys(self, item):
+        return [getattr(item, f'keyset_{index}') for index in range(len(self.ordering_keys))]
+
+    def annotate_ordering_keys(self, queryset):
+        """Queryset with its ordering keys annotated as keyset_0, keyset_1, ... for cursors"""
+        self.ordering_keys = self._get_ordering_keys(queryset)
+        return queryset.annotate(**{
+            f'keyset_{index}': expression for index, (expression, _) in enumerate(self.ordering_keys)
+        })
+
+    def seek(self, queryset, direction, values):
+        """Rows right after the key values in queryset order, or right before them in reverse order"""
+        if direction == 'after':
+            return queryset.filter(self._keyset_filter(values, forward=True))
+        return queryset.filter(self._keyset_filter(values, forward=False)).reverse()
+
+    def decode_cursor(self, request, queryset):
+        """
+        Page number, direction and key values of the cursor parameter, each value
+        converted to the type of its ordering key in the annotated queryset
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        key_fields = [
+            queryset.query.annotations[f'keyset_{index}'].output_field
+            for index in range(len(self.ordering_keys))
+        ]
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            page_number = int(cursor['page'])
+            direction = 'after' if 'after' in cursor else 'before'
+            values = list(cursor[direction])
+            if len(values) != len(key_fields):
+                raise ValueError('Wrong number of cursor values')
+            values = [field.to_python(value) for field, value in zip(key_fields, values)]
+        except (ValueError, TypeError, KeyError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        if None in values:
+            raise NotFound(self.invalid_cursor_message)
+        return page_number, direction, values
+
+    def encode_cursor(self, page_number, direction, values):
+        cursor = json.dumps({'page': page_number, direction: values}, separators=(',', ':'))
+        url = remove_query_param(self.request.build_absolute_uri(), self.page_query_param)
+        encoded = base64.urlsafe_b64encode(cursor.encode('ascii')).decode('ascii')
+        return replace_query_param(url, self.cursor_query_param, encoded)
+
     def paginate_queryset(self, queryset, request, view=None):
+        """
+        Paginate by cursor when one is given, otherwise by page number. Ordering keys
+        are annotated on every page so that its links can point to the neighbour pages.
+        """
+        self.request = request
+        queryset = self.annotate_ordering_keys(queryset)
+
+        cursor = self.decode_cursor(request, queryset)
+        if cursor is not None:
+            page_items = self.paginate_keyset(queryset, request, *cursor)
+        else:
+            page_items = self.paginate_offset(queryset, request)
+        if page_items is None:
+            return None
+
+        self.page.object_list = list(page_items)
+        return self.page.object_list
+
+    def paginate_keyset(self, queryset, request, page_number, direction, values):
+        """Fetch a page right after or before the cursor key with an index seek"""
+        page_size = self.get_page_size(request)
+        paginator = self.django_paginator_class(queryset, page_size)
+        total_count = paginator.count
+        standard_pages = math.ceil(total_count / page_size)
+        if standard_pages > 1 and total_count % page_size > 0:
+            paginator.num_pages = standard_pages - 1
+        if page_number < 1 or page_number > paginator.num_pages:
+            raise NotFound(self.invalid_cursor_message)
+
+        start_index, end_index = get_page_bounds(
+            page_number, total_count, page_size, self._is_descending_order(request)
+        )
+        page_items = list(self.seek(queryset, direction, values)[:end_index - start_index])
+        if direction == 'before':
+            page_items.reverse()
+
+        self.page = KeysetPage(page_items, page_number, paginator)
+        return self.page.object_list
+
+    def paginate_offset(self, queryset, request):
         """
         Custom pagination logic that merges pages based on ordering direction:
         - ordering=-id: merges first page (first + second pages)
@@ -174,63 +388,20 @@ class CustomQuotePagination(PageNumberPagination):
 
     def get_paginated_response(self, data):
         """Custom response format with additional metadata"""
-        # Calculate page info
-        total_count = self.page.paginator.count
-        page_size = self.page_size
-        
-        # Calculate adjusted pages (accounting for merged last page)
-        standard_pages = math.ceil(total_count / page_size)
-        if standard_pages > 1:
-            last_page_items = total_count % page_size
-            if last_page_items > 0 and last_page_items < page_size:
-                total_pages = standard_pages - 1
-            else:
-                total_pages = standard_pages
-        else:
-            total_pages = standard_pages
-
-        current_page = self.page.number
-        
-        # Calculate items range for current page
-        if current_page == total_pages and total_pages > 1:
-            # This is the merged last page
-            start_item = ((current_page - 1) * page_size) + 1
-            end_item = total_count
-            items_on_page = len(data)
-        else:
-            # Normal page
-            start_item = ((current_page - 1) * page_size) + 1
-            end_item = min(current_page * page_size, total_count)
-            items_on_page = len(data)
-
-        # Get actual IDs from the data for the label in min-max format
-        if data:
-            first_id = data[0].get('id', start_item) if isinstance(data[0], dict) else start_item
-            last_id = data[-1].get('id', end_item) if isinstance(data[-1], dict) else end_item
-            page_label = self._format_min_max_label(first_id, last_id)
-        else:
-            page_label = f"{start_item} - {end_item}"
-        
+        page_info = get_page_info(self.page.paginator.count, self.page.number, self.page_size, data)
         return Response(OrderedDict([
-            ('count', total_count),
-            ('total_pages', total_pages),
-            ('current_page', current_page),
-            ('page_size', page_size),
-            ('items_on_page', items_on_page),
-            ('start_item', start_item),
-            ('end_item', end_item),
-            ('page_label', page_label),
+            *page_info.items(),
             ('next', self.get_next_link()),
             ('previous', self.get_previous_link()),
             ('results', data)
         ]))
 
     def get_next_link(self):
-        if not self.page.has_next():
+        if not self.page.has_next() or not self.page.object_list:
             return None
-        return None  # Simplified for now
+        return self.encode_cursor(self.page.number + 1, 'after', self._item_keys(self.page.object_list[-1]))
 
     def get_previous_link(self):
-        if not self.page.has_previous():
+        if not self.page.has_previous() or not self.page.object_list:
             return None
-        return None  # Simplified for now
\ No newline at end of file
+        return self.encode_cursor(self.page.number - 1, 'before', self._item_keys(self.page.object_list[0]))
\ No newline at end of file
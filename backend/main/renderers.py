@@ -0,0 +1,81 @@
+from rest_framework.renderers import BaseRenderer, BrowsableAPIRenderer, JSONRenderer
+import csv
+import io
+import json
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+class MessagePackRenderer(BaseRenderer):
+    """Binary MessagePack rendering of the same data JSONRenderer gives, for Accept: application/msgpack"""
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, use_bin_type=True)
+
+
+# Renderers of the quote, type and topic endpoints; MessagePack when msgpack is installed
+API_RENDERERS = [JSONRenderer, BrowsableAPIRenderer] + ([MessagePackRenderer] if msgpack is not None else [])
+
+
+def stream_json_envelope(envelope, items, results_key='results', batch_size=500):
+    """
+    Yield the JSON of envelope with items streamed into its results list, byte for byte
+    what JSONRenderer gives for the complete dict, without holding all items in memory.
+    """
+    renderer = JSONRenderer()
+    head = renderer.render({**envelope, results_key: []})
+    # The results list is the last key, so the rendered envelope ends with '[]}'
+    yield head[:-2]
+
+    batch = []
+    separator = b''
+    for item in items:
+        batch.append(renderer.render(item))
+        if len(batch) >= batch_size:
+            yield separator + b','.join(batch)
+            separator = b','
+            batch = []
+    if batch:
+        yield separator + b','.join(batch)
+    yield b']}'
+
+
+def stream_ndjson(rows, batch_size=500):
+    """Yield rows as newline-delimited JSON, batch_size lines per chunk"""
+    batch = []
+    for row in rows:
+        batch.append(json.dumps(row, ensure_ascii=False))
+        if len(batch) >= batch_size:
+            yield ('\n'.join(batch) + '\n').encode('utf-8')
+            batch = []
+    if batch:
+        yield ('\n'.join(batch) + '\n').encode('utf-8')
+
+
+def stream_csv(rows, fieldnames, separator='|', batch_size=500):
+    """
+    Yield rows as CSV with a header, batch_size rows per chunk. List values are
+    joined with separator, as import_quotes splits them.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fieldnames)
+    for index, row in enumerate(rows, 1):
+        writer.writerow([
+            separator.join(row[field]) if isinstance(row[field], list) else row[field]
+            for field in fieldnames
+        ])
+        if index % batch_size == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
@@ -1,6 +1,16 @@
+from .metrics import timed
 from .models import Quote, Page, Type, Topic
+from django.contrib.postgres.expressions import ArraySubquery
+from django.db.models import OuterRef
 from rest_framework import serializers
 
+class TimedListSerializer(serializers.ListSerializer):
+    """ListSerializer reporting the time spent building its data as the request's serialize timing"""
+    @property
+    def data(self):
+        with timed('serialize'):
+            return super().data
+
 class QuoteSerializer(serializers.ModelSerializer):
     id = serializers.ReadOnlyField()
     signs = serializers.ReadOnlyField()
@@ -8,7 +18,55 @@ class QuoteSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Quote
-        fields = '__all__'
+        exclude = ['search_vector', 'length']
+        list_serializer_class = TimedListSerializer
+
+def iter_serialized_quotes(queryset, chunk_size=None):
+    """
+    Read-only bulk serialization producing the same dicts as QuoteSerializer(many=True),
+    built from a single values() query with type and topic IDs aggregated per quote.
+    With chunk_size, rows are read through a server-side cursor in chunks of that size.
+    """
+    type_ids = Quote.type.through.objects.filter(quote_id=OuterRef('pk')).order_by('id').values('type_id')
+    topic_ids = Quote.topics.through.objects.filter(quote_id=OuterRef('pk')).order_by('id').values('topic_id')
+    rows = queryset.prefetch_related(None).annotate(
+        type_ids=ArraySubquery(type_ids),
+        topic_ids=ArraySubquery(topic_ids),
+    ).values_list('id', 'length', 'font_size', 'quote', 'author', 'book', 'type_ids', 'topic_ids')
+    if chunk_size:
+        rows = rows.iterator(chunk_size=chunk_size)
+    for quote_id, length, font_size, quote, author, book, type_ids, topic_ids in rows:
+        yield {
+            'id': quote_id,
+            'signs': length or 0,
+            'font_size': font_size,
+            'quote': quote,
+            'author': author,
+            'book': book,
+            'type': type_ids,
+            'topics': topic_ids,
+        }
+
+EXPORT_FIELDS = ('id', 'quote', 'author', 'book', 'types', 'topics')
+
+def iter_quote_exports(queryset, chunk_size=2000):
+    """
+    Export rows of the queryset: quote fields with type and topic names instead of
+    IDs, the same keys import_quotes reads. Rows come through a server-side cursor.
+    """
+    type_names = Quote.type.through.objects.filter(quote_id=OuterRef('pk')).order_by('id').values('type__type')
+    topic_names = Quote.topics.through.objects.filter(quote_id=OuterRef('pk')).order_by('id').values('topic__topic')
+    rows = queryset.prefetch_related(None).annotate(
+        type_names=ArraySubquery(type_names),
+        topic_names=ArraySubquery(topic_names),
+    ).values_list('id', 'quote', 'author', 'book', 'type_names', 'topic_names')
+    for row in rows.iterator(chunk_size=chunk_size):
+        yield dict(zip(EXPORT_FIELDS, row))
+
+def serialize_quotes(queryset):
+    """List version of iter_serialized_quotes, all rows fetched at once"""
+    with timed('serialize'):
+        return list(iter_serialized_quotes(queryset))
 
 class PageSerializer(serializers.ModelSerializer):
     id = serializers.ReadOnlyField()
@@ -16,6 +74,7 @@ class PageSerializer(serializers.ModelSerializer):
     class Meta:
         model = Page
         fields = '__all__'
+        list_serializer_class = TimedListSerializer
 
 class TypeSerializer(serializers.ModelSerializer):
     id = serializers.ReadOnlyField()
@@ -23,10 +82,12 @@ class TypeSerializer(serializers.ModelSerializer):
     class Meta:
         model = Type
         fields = '__all__'
+        list_serializer_class = TimedListSerializer
 
 class TopicSerializer(serializers.ModelSerializer):
     id = serializers.ReadOnlyField()
 
     class Meta:
         model = Topic
-        fields = '__all__'
\ No newline at end of file
+        fields = '__all__'
+        list_serializer_class = TimedListSerializer
\ No newline at end of file
@@ -0,0 +1,266 @@
+from django.db import connection, transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from .cache import bump_catalog_version
+from .models import (
+    AuthorCount, Page, Quote, QuoteRank, Topic, Type, TypeTopicCount, UnlinkedQuoteCount, rank_scope,
+)
+from collections import defaultdict
+
+# Rank entries a transaction shifts one by one before the scopes of its further
+# changes are rebuilt after commit instead, as suits bulk edits such as admin deletions
+RANK_SHIFT_LIMIT = 100
+
+
+class CatalogRefresh:
+    """
+    Derived table updates collected over a transaction, run once after it commits
+    and followed by a single catalog version bump
+    """
+    def __init__(self):
+        self.rank_scopes = set()
+        self.shifted_ranks = 0
+
+    def __call__(self):
+        # Derived tables go first so no request caches old data under the new version
+        if self.rank_scopes:
+            QuoteRank.objects.rebuild(self.rank_scopes)
+        bump_catalog_version()
+
+
+def schedule_catalog_refresh(rank_scopes=()):
+    """
+    Add work to the catalog refresh of the current transaction, which always bumps
+    the version, and return that refresh
+    """
+    refresh = None
+    if connection.in_atomic_block:
+        refresh = next(
+            (callback for _, callback, _ in connection.run_on_commit if isinstance(callback, CatalogRefresh)),
+            None
+        )
+    is_new = refresh is None
+    if is_new:
+        refresh = CatalogRefresh()
+    refresh.rank_scopes.update(rank_scopes)
+    if is_new:
+        # Runs right away outside a transaction, so only once it holds the work
+        transaction.on_commit(refresh)
+    return refresh
+
+
+def update_ranks(update, quote_id, scopes):
+    """
+    Shift the ranks of one quote in scopes with a QuoteRank manager method, or
+    rebuild the scopes after commit once the transaction has shifted more than
+    RANK_SHIFT_LIMIT entries
+    """
+    scopes = set(scopes)
+    if not scopes:
+        return
+    if connection.in_atomic_block:
+        refresh = schedule_catalog_refresh()
+        if refresh.shifted_ranks + len(scopes) > RANK_SHIFT_LIMIT:
+            refresh.rank_scopes.update(scopes)
+            return
+        refresh.shifted_ranks += len(scopes)
+    update(quote_id, scopes)
+
+
+def type_topic_links(through, instance, reverse, pk_set=None):
+    """
+    (quote_id, type_id, topic_id) for the TypeTopicCount keys of the existing quote
+    links between instance and pk_set (all links of instance when pk_set is None)
+    in the type or topic m2m table.
+    """
+    is_type = through is Quote.type.through
+    field, other_field = ('type_id', 'topic_id') if is_type else ('topic_id', 'type_id')
+    other_through = Quote.topics.through if is_type else Quote.type.through
+
+    links = through.objects.filter(**{field if reverse else 'quote_id': instance.pk})
+    if pk_set is not None:
+        links = links.filter(**{'quote_id__in' if reverse else f'{field}__in': pk_set})
+    links = list(links.values_list('quote_id', field))
+
+    others = defaultdict(list)
+    other_links = other_through.objects.filter(quote_id__in={quote_id for quote_id, _ in links})
+    for quote_id, other_id in other_links.values_list('quote_id', other_field):
+        others[quote_id].append(other_id)
+
+    triples = []
+    for quote_id, linked_id in links:
+        for other_id in [None, *others[quote_id]]:
+            triples.append((quote_id, linked_id, other_id) if is_type else (quote_id, other_id, linked_id))
+    return triples
+
+
+def type_topic_pairs(through, instance, reverse, pk_set=None):
+    """TypeTopicCount keys of type_topic_links"""
+    return [
+        (type_id, topic_id) for _, type_id, topic_id in type_topic_links(through, instance, reverse, pk_set)
+    ]
+
+
+def quote_type_topic_pairs(quote_id):
+    """TypeTopicCount keys of all type and topic links of one quote"""
+    type_ids = list(Quote.type.through.objects.filter(quote_id=quote_id).values_list('type_id', flat=True))
+    topic_ids = list(Quote.topics.through.objects.filter(quote_id=quote_id).values_list('topic_id', flat=True))
+    return [
+        *((type_id, None) for type_id in type_ids),
+        *((None, topic_id) for topic_id in topic_ids),
+        *((type_id, topic_id) for type_id in type_ids for topic_id in topic_ids),
+    ]
+
+
+def pair_scopes(pairs):
+    """QuoteRank scopes of (type_id, topic_id) pairs"""
+    return {rank_scope(type_id, topic_id) for type_id, topic_id in pairs}
+
+
+def quote_rank_scopes(quote_id):
+    """Scopes a quote is ranked in"""
+    return QuoteRank.objects.filter(quote_id=quote_id).values_list('scope', flat=True)
+
+
+def count_unlinked(through, quote_ids):
+    """Number of quote_ids without any row in the type or topic m2m table"""
+    if not quote_ids:
+        return 0
+    linked = through.objects.filter(quote_id__in=quote_ids).values('quote_id').distinct().count()
+    return len(quote_ids) - linked
+
+
+@receiver(pre_save, sender=Quote)
+def remember_stored_values(sender, instance, update_fields=None, **kwargs):
+    """
+    Keep the author and length as stored before an update, for moving the quote
+    between author counts and re-ranking it only when its length changes
+    """
+    instance._stored_author = instance._stored_length = None
+    if instance._state.adding or (update_fields is not None and not {'author', 'quote'} & set(update_fields)):
+        return
+    stored = Quote.objects.filter(pk=instance.pk).values_list('author', 'length').first()
+    if stored is not None:
+        instance._stored_author, instance._stored_length = stored
+
+
+@receiver(post_save, sender=Quote)
+def update_quote_statistics(sender, instance, created, **kwargs):
+    """Count a new quote for its author and as having no types or topics yet"""
+    if created:
+        AuthorCount.objects.adjust([instance.author], 1)
+        for field in UnlinkedQuoteCount.FIELDS:
+            UnlinkedQuoteCount.objects.adjust(field, 1)
+    elif instance._stored_author is not None and instance._stored_author != instance.author:
+        AuthorCount.objects.adjust([instance._stored_author], -1)
+        AuthorCount.objects.adjust([instance.author], 1)
+
+
+@receiver(post_save, sender=Quote)
+def rerank_saved_quote(sender, instance, created, **kwargs):
+    """Rank a new quote in the catalog scope and move a quote of a new length in all its scopes"""
+    if created:
+        # Its links are added later, with m2m signals
+        update_ranks(QuoteRank.objects.insert, instance.pk, [''])
+    elif instance._stored_length is not None and instance._stored_length != len(instance.quote):
+        update_ranks(QuoteRank.objects.move, instance.pk, quote_rank_scopes(instance.pk))
+
+
+@receiver(pre_delete, sender=Quote)
+def forget_deleted_quote(sender, instance, **kwargs):
+    """
+    Uncount and unrank a deleted quote and its links while they still exist, as the
+    links go without m2m signals
+    """
+    pairs = quote_type_topic_pairs(instance.pk)
+    TypeTopicCount.objects.adjust(pairs, -1)
+    AuthorCount.objects.adjust([instance.author], -1)
+    if not any(type_id for type_id, _ in pairs):
+        UnlinkedQuoteCount.objects.adjust('type', -1)
+    if not any(topic_id for _, topic_id in pairs):
+        UnlinkedQuoteCount.objects.adjust('topics', -1)
+    update_ranks(QuoteRank.objects.remove, instance.pk, quote_rank_scopes(instance.pk))
+
+
+@receiver(pre_delete, sender=Type)
+@receiver(pre_delete, sender=Topic)
+def forget_deleted_type_or_topic(sender, instance, **kwargs):
+    """
+    Clear the scopes of a deleted type or topic and count the quotes it leaves
+    without any, as its links go without m2m signals. Its TypeTopicCount rows go
+    with it and the rows of its partners don't depend on it.
+    """
+    through, field, link_field = (
+        (Quote.type.through, 'type', 'type_id') if sender is Type else (Quote.topics.through, 'topics', 'topic_id')
+    )
+    quote_ids = set(through.objects.filter(**{link_field: instance.pk}).values_list('quote_id', flat=True))
+    if quote_ids:
+        linked_elsewhere = (
+            through.objects.filter(quote_id__in=quote_ids).exclude(**{link_field: instance.pk})
+            .values('quote_id').distinct().count()
+        )
+        UnlinkedQuoteCount.objects.adjust(field, len(quote_ids) - linked_elsewhere)
+    # Whole scopes go, so no positions need shifting
+    QuoteRank.objects.filter(scope__in=pair_scopes(type_topic_pairs(through, instance, reverse=True))).delete()
+
+
+@receiver(post_save, sender=Quote)
+@receiver(post_save, sender=Type)
+@receiver(post_save, sender=Topic)
+@receiver(post_save, sender=Page)
+@receiver(post_delete, sender=Quote)
+@receiver(post_delete, sender=Type)
+@receiver(post_delete, sender=Topic)
+@receiver(post_delete, sender=Page)
+def invalidate_catalog_on_change(sender, **kwargs):
+    """Any saved or deleted catalog object makes cached API responses stale"""
+    schedule_catalog_refresh()
+
+
+@receiver(m2m_changed, sender=Quote.type.through)
+@receiver(m2m_changed, sender=Quote.topics.through)
+def update_type_topic_counts(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Count and rank added links after they are written and removed links before
+    they go
+    """
+    if action == 'post_add':
+        links, delta, update = type_topic_links(sender, instance, reverse, pk_set), 1, QuoteRank.objects.insert
+    elif action == 'pre_remove':
+        links, delta, update = type_topic_links(sender, instance, reverse, pk_set), -1, QuoteRank.objects.remove
+    elif action == 'pre_clear':
+        links, delta, update = type_topic_links(sender, instance, reverse), -1, QuoteRank.objects.remove
+    else:
+        return
+    TypeTopicCount.objects.adjust([(type_id, topic_id) for _, type_id, topic_id in links], delta)
+    scopes = defaultdict(set)
+    for quote_id, type_id, topic_id in links:
+        scopes[quote_id].add(rank_scope(type_id, topic_id))
+    for quote_id, quote_scopes in scopes.items():
+        update_ranks(update, quote_id, quote_scopes)
+
+
+@receiver(m2m_changed, sender=Quote.type.through)
+@receiver(m2m_changed, sender=Quote.topics.through)
+def update_unlinked_quote_counts(sender, instance, action, reverse, pk_set, **kwargs):
+    """Count quotes gaining their first or losing their last type or topic, from before and after counts"""
+    field = 'type' if sender is Quote.type.through else 'topics'
+    if action.startswith('pre_'):
+        if not reverse:
+            quote_ids = {instance.pk}
+        elif pk_set is not None:
+            quote_ids = set(pk_set)
+        else:
+            link_field = 'type_id' if field == 'type' else 'topic_id'
+            quote_ids = set(sender.objects.filter(**{link_field: instance.pk}).values_list('quote_id', flat=True))
+        setattr(instance, f'_unlinked_{field}', (quote_ids, count_unlinked(sender, quote_ids)))
+    else:
+        quote_ids, before = getattr(instance, f'_unlinked_{field}')
+        UnlinkedQuoteCount.objects.adjust(field, count_unlinked(sender, quote_ids) - before)
+
+
+@receiver(m2m_changed, sender=Quote.type.through)
+@receiver(m2m_changed, sender=Quote.topics.through)
+def invalidate_catalog_on_m2m_change(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        schedule_catalog_refresh()
@@ -1,3 +1,1413 @@
-from django.test import TestCase
+from django.conf import settings
+from django.core.management import call_command
+from django.db.models import F, Sum
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from .cache import CATALOG_VERSION_KEY, api_cache, bump_catalog_version, get_catalog_version
+from .compression import brotli, negotiate_encoding
+from .filters import QuoteFilter, build_prefix_query
+from .metrics import endpoint_stats, percentile
+from .renderers import msgpack
+from .models import AuthorCount, Quote, QuoteRank, Topic, Type, TypeTopicCount, UnlinkedQuoteCount
+from .serializers import QuoteSerializer, serialize_quotes
+import base64
+import datetime
+import gzip
+import io
+import json
+import math
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+import unittest.mock
 
-# Create your tests here.
+
+def legacy_pages_info(queryset, is_descending, page_size=100):
+    """Reference pages_info implementation with one query per page, as it was before window functions"""
+    total_count = queryset.count()
+    standard_pages = math.ceil(total_count / page_size)
+    if standard_pages > 1 and total_count % page_size > 0:
+        total_pages = standard_pages - 1
+    else:
+        total_pages = standard_pages
+    is_merged = total_pages > 1 and total_count % page_size > 0
+
+    pages = []
+    for page_num in range(1, total_pages + 1):
+        if is_descending and is_merged and page_num == 1:
+            start_item = 1
+            end_item = page_size + total_count % page_size
+        elif is_descending and is_merged:
+            remainder = total_count % page_size
+            start_item = ((page_num - 1) * page_size) + 1 + remainder
+            end_item = min(page_num * page_size + remainder, total_count)
+        elif not is_descending and is_merged and page_num == total_pages:
+            start_item = ((page_num - 1) * page_size) + 1
+            end_item = total_count
+        else:
+            start_item = ((page_num - 1) * page_size) + 1
+            end_item = min(page_num * page_size, total_count)
+
+        page_ids = list(queryset[start_item - 1:end_item].values_list('id', flat=True))
+        if page_ids:
+            label = f"{min(page_ids[0], page_ids[-1])} - {max(page_ids[0], page_ids[-1])}"
+        else:
+            label = f"{start_item} - {end_item}"
+
+        pages.append({
+            'page': page_num,
+            'start_item': start_item,
+            'end_item': end_item,
+            'items_count': end_item - start_item + 1,
+            'label': label
+        })
+
+    return {
+        'total_count': total_count,
+        'total_pages': total_pages,
+        'page_size': page_size,
+        'pages': pages,
+        'pagination_disabled': False
+    }
+
+
+class FullTextSearchTests(TestCase):
+    def setUp(self):
+        api_cache.clear()
+        self.client = APIClient()
+        self.passes = Quote.objects.create(quote='Всё проходит, и это пройдёт.', author='Соломон')
+        self.tree = Quote.objects.create(quote='Ёлка зелёная стоит в лесу')
+        self.novel = Quote.objects.create(quote='Время лечит', author='Лев Толстой', book='Война и мир')
+        self.war = Quote.objects.create(quote='Война никому не нужна')
+
+    def search(self, value):
+        response = self.client.get('/api/quotes/', {'search': value, 'search_mode': 'fulltext'})
+        self.assertEqual(response.status_code, 200)
+        return [quote['id'] for quote in response.json()['results']]
+
+    def test_search_vector_follows_saves(self):
+        self.passes.quote = 'Ничто не вечно'
+        self.passes.save()
+        self.assertEqual(self.search('проходит'), [])
+        self.assertEqual(self.search('вечно'), [self.passes.id])
+
+    def test_prefix_matching(self):
+        self.assertEqual(self.search('прох'), [self.passes.id])
+        self.assertEqual(self.search('ПРОХОДИТ'), [self.passes.id])
+        self.assertEqual(self.search('роходит'), [])
+
+    def test_words_match_in_order(self):
+        self.assertEqual(self.search('война и мир'), [self.novel.id])
+        self.assertEqual(self.search('мир и война'), [])
+        # The words have to be adjacent
+        self.assertEqual(self.search('война мир'), [])
+
+    def test_yo_matches_ye(self):
+        self.assertEqual(self.search('елка'), [self.tree.id])
+        self.assertEqual(self.search('ёлка'), [self.tree.id])
+        self.assertEqual(self.search('пройдет'), [self.passes.id])
+
+    def test_author_and_book(self):
+        self.assertEqual(self.search('Толст'), [self.novel.id])
+        self.assertEqual(self.search('Соломон'), [self.passes.id])
+
+    def test_quote_matches_rank_above_book_matches(self):
+        self.assertEqual(self.search('война'), [self.war.id, self.novel.id])
+
+    def test_query_without_words(self):
+        self.assertIsNone(build_prefix_query('— !'))
+
+
+class FuzzySearchTests(TestCase):
+    def setUp(self):
+        api_cache.clear()
+        self.client = APIClient()
+        self.tolstoy = Quote.objects.create(quote='Все счастливые семьи похожи друг на друга', author='Лев Толстой')
+        self.hamlet = Quote.objects.create(quote='Быть или не быть', book='Гамлет')
+        self.other = Quote.objects.create(quote='Время лечит')
+
+    def search(self, value):
+        response = self.client.get('/api/quotes/', {'search': value, 'search_mode': 'fuzzy'})
+        self.assertEqual(response.status_code, 200)
+        return [quote['id'] for quote in response.json()['results']]
+
+    def test_misspelled_words_match(self):
+        self.assertEqual(self.search('Толстй'), [self.tolstoy.id])
+        self.assertEqual(self.search('Гамлт'), [self.hamlet.id])
+        self.assertEqual(self.search('счастливые'), [self.tolstoy.id])
+
+    def test_most_similar_first(self):
+        play = Quote.objects.create(quote='Вчера давали Гамлета')
+        self.assertEqual(self.search('Гамлет'), [self.hamlet.id, play.id])
+
+    def set_threshold(self, threshold):
+        # Rolled back with the test transaction
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL pg_trgm.word_similarity_threshold = %s', [threshold])
+        api_cache.clear()
+
+    def test_threshold(self):
+        self.set_threshold(0.9)
+        self.assertEqual(self.search('Толстй'), [])
+        self.set_threshold(0.2)
+        self.assertIn(self.tolstoy.id, self.search('Толстй'))
+
+    def test_connection_threshold_from_settings(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT current_setting('pg_trgm.word_similarity_threshold')")
+            self.assertEqual(float(cursor.fetchone()[0]), settings.QUOTES_FUZZY_THRESHOLD)
+
+    def test_trigram_indexes_used(self):
+        queryset = QuoteFilter({'search': 'Толстй', 'search_mode': 'fuzzy'}, queryset=Quote.objects.all()).qs
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+            plan = queryset.explain()
+        for index in ('main_quote_quote_trgm', 'main_quote_author_trgm', 'main_quote_book_trgm'):
+            self.assertIn(index, plan)
+
+
+class CursorPaginationTests(TestCase):
+    def setUp(self):
+        api_cache.clear()
+        self.client = APIClient()
+        # Three pages, the last or first one merged; repeating lengths give ties for (length, id)
+        Quote.objects.bulk_create(
+            Quote(quote='x' * (1 + (index * 37) % 250), author='Author') for index in range(350)
+        )
+        bump_catalog_version()
+
+    def get(self, url, params=None):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def without_links(self, data):
+        return {key: value for key, value in data.items() if key not in ('next', 'previous')}
+
+    def test_links_walk_the_same_pages_as_page_numbers(self):
+        for ordering in ('', 'id', '-id'):
+            params = {'ordering': ordering} if ordering else {}
+            with self.subTest(ordering=ordering):
+                pages = [self.get('/api/quotes/', {**params, 'page': number}) for number in (1, 2, 3)]
+                self.assertIsNone(pages[0]['previous'])
+                self.assertIsNone(pages[-1]['next'])
+
+                forward = [pages[0]]
+                while forward[-1]['next']:
+                    self.assertIn('cursor=', forward[-1]['next'])
+                    forward.append(self.get(forward[-1]['next']))
+                self.assertEqual([self.without_links(page) for page in forward],
+                                 [self.without_links(page) for page in pages])
+
+                backward = [forward[-1]]
+                while backward[-1]['previous']:
+                    backward.append(self.get(backward[-1]['previous']))
+                self.assertEqual([self.without_links(page) for page in reversed(backward)],
+                                 [self.without_links(page) for page in pages])
+
+    def test_cursor_page_skips_offset(self):
+        next_link = self.get('/api/quotes/', {'page': 1})['next']
+        with CaptureQueriesContext(connection) as queries:
+            self.get(next_link)
+        self.assertFalse(any('OFFSET' in query['sql'] for query in queries))
+
+    def test_malformed_cursors(self):
+        def encode(cursor):
+            return base64.urlsafe_b64encode(json.dumps(cursor).encode('ascii')).decode('ascii')
+
+        cursors = [
+            'not-a-cursor',
+            base64.urlsafe_b64encode(b'not json').decode('ascii'),
+            encode([1, 2]),
+            encode({'page': 2}),
+            encode({'page': 'two', 'after': [1, 1]}),
+            encode({'page': 2, 'after': [1]}),
+            encode({'page': 2, 'after': ['a', 'b']}),
+            encode({'page': 2, 'after': [None, 1]}),
+            encode({'page': 2, 'after': [[1], {'id': 1}]}),
+            encode({'page': 9, 'after': [1, 1]}),
+        ]
+        for cursor in cursors:
+            with self.subTest(cursor=cursor):
+                response = self.client.get('/api/quotes/', {'cursor': cursor})
+                self.assertEqual(response.status_code, 404)
+                self.assertEqual(response.json(), {'detail': 'Invalid cursor'})
+
+
+class GeneratedColumnsTests(TestCase):
+    BOUNDARIES = (0, 1, 100, 101, 300, 301, 400, 401, 600, 601, 1000)
+
+    def legacy_font_size(self, quote):
+        """Font size bucket as Quote.font_size computed it in Python before the generated column"""
+        signs = len(quote) if quote else 0
+        if signs > 600:
+            return 'min'
+        elif signs > 400:
+            return 'under'
+        elif signs > 300:
+            return 'middle'
+        elif signs > 100:
+            return 'upper'
+        return 'max'
+
+    def test_columns_match_python_at_bucket_boundaries(self):
+        for length in self.BOUNDARIES:
+            # Multibyte letters count once, as len() counts them
+            text = 'ё' * length
+            quote = Quote.objects.get(pk=Quote.objects.create(quote=text).pk)
+            with self.subTest(length=length):
+                self.assertEqual(quote.length, len(text))
+                self.assertEqual(quote.signs, len(text))
+                self.assertEqual(quote.font_size, self.legacy_font_size(text))
+
+    def test_save_refreshes_generated_columns(self):
+        quote = Quote.objects.create(quote='x' * 100)
+        self.assertEqual((quote.length, quote.font_size), (100, 'max'))
+        quote.quote = 'x' * 101
+        quote.save()
+        self.assertEqual((quote.length, quote.font_size), (101, 'upper'))
+        quote.quote = 'x' * 601
+        quote.save(update_fields=['quote'])
+        self.assertEqual((quote.signs, quote.font_size), (601, 'min'))
+
+
+class PagesInfoTests(TestCase):
+    def setUp(self):
+        api_cache.clear()
+        self.client = APIClient()
+
+    def create_quotes(self, count):
+        # Repeating lengths give plenty of ties for the (length, id) ordering
+        Quote.objects.bulk_create(
+            Quote(quote='x' * (1 + (index * 37) % 250), author='Author') for index in range(count)
+        )
+        # bulk_create sends no signals
+        bump_catalog_version()
+
+    def assert_matches_legacy(self, count):
+        for ordering, queryset in (
+            ('', Quote.objects.order_by('length', 'id')),
+            ('id', Quote.objects.order_by('id')),
+            ('-id', Quote.objects.order_by('-id')),
+        ):
+            with self.subTest(count=count, ordering=ordering):
+                response = self.client.get('/api/quotes/pages_info/', {'ordering': ordering} if ordering else {})
+                self.assertEqual(response.status_code, 200)
+                expected = legacy_pages_info(queryset, is_descending=ordering == '-id')
+                self.assertEqual(response.content, JSONRenderer().render(expected))
+
+    def test_matches_legacy_implementation(self):
+        created = 0
+        for count in (0, 1, 99, 100, 101, 200, 250, 1234):
+            self.create_quotes(count - created)
+            created = count
+            self.assert_matches_legacy(count)
+
+    def test_matches_legacy_with_id_gaps(self):
+        self.create_quotes(777)
+        Quote.objects.annotate(mod=F('id') % 7).filter(mod=0).delete()
+        self.assert_matches_legacy(Quote.objects.count())
+
+    def test_constant_query_count(self):
+        self.create_quotes(2345)
+        with self.assertNumQueries(2):
+            self.client.get('/api/quotes/pages_info/', {'ordering': '-id'})
+
+
+class ResponseCacheTests(TransactionTestCase):
+    # Catalog version bumps run on commit, so these tests need real transactions
+    def setUp(self):
+        api_cache.clear()
+        self.client = APIClient()
+        self.type = Type.objects.create(type='Философские')
+        self.topic = Topic.objects.create(topic='Любовь')
+        self.quote = Quote.objects.create(quote='Всё проходит.', author='Соломон')
+        self.quote.type.add(self.type)
+        self.quote.topics.add(self.topic)
+
+    def test_repeated_request_is_served_from_cache(self):
+        for url in ('/api/quotes/', '/api/quotes/pages_info/', '/api/quotes/total_count/', '/api/types/', '/api/topics/'):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                with self.assertNumQueries(0):
+                    cached = self.client.get(url)
+                self.assertEqual(cached.content, response.content)
+
+    def test_query_params_are_normalized(self):
+        self.client.get('/api/quotes/', {'page': 1, 'ordering': '-id'})
+        with self.assertNumQueries(0):
+            self.client.get('/api/quotes/?ordering=-id&search=&page=1')
+
+    def test_saving_quote_invalidates_cache(self):
+        self.client.get('/api/quotes/total_count/')
+        Quote.objects.create(quote='Познай самого себя.')
+        self.assertEqual(self.client.get('/api/quotes/total_count/').json(), {'total_count': 2})
+
+    def test_deleting_quote_invalidates_cache(self):
+        self.client.get('/api/quotes/total_count/')
+        self.quote.delete()
+        self.assertEqual(self.client.get('/api/quotes/total_count/').json(), {'total_count': 0})
+
+    def test_m2m_change_invalidates_cache(self):
+        self.assertEqual(len(self.client.get('/api/types/').json()), 1)
+        version = get_catalog_version()
+        with transaction.atomic():
+            self.quote.type.clear()
+            self.quote.topics.clear()
+        # One version bump per transaction
+        self.assertEqual(get_catalog_version(), version + 1)
+        self.assertEqual(self.client.get('/api/types/').json(), [])
+
+
+class CatalogVersionTests(TestCase):
+    def setUp(self):
+        api_cache.clear()
+
+    def test_bump_by_another_process_is_seen_once_the_copy_expires(self):
+        version = get_catalog_version()
+        # What bump_catalog_version does in another worker with its own cache
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT nextval('main_catalog_version')")
+        self.assertEqual(get_catalog_version(), version)
+        api_cache.delete(CATALOG_VERSION_KEY)
+        self.assertEqual(get_catalog_version(), version + 1)
+
+    def test_version_survives_a_cleared_cache(self):
+        version = bump_catalog_version()
+        api_cache.clear()
+        self.assertEqual(get_catalog_version(), version)
+        self.assertEqual(bump_catalog_version(), version + 1)
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        api_cache.clear()
+        self.client = APIClient()
+        Quote.objects.create(quote='Всё проходит.', author='Соломон')
+
+    def test_matching_etag_returns_not_modified_without_queries(self):
+        for url in ('/api/quotes/', '/api/quotes/total_count/', '/api/types/', '/api/topics/', '/api/pages/'):
+            with self.subTest(url=url):
+                etag = self.client.get(url)['ETag']
+                with self.assertNumQueries(0):
+                    response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.content, b'')
+                self.assertEqual(response['ETag'], etag)
+
+    def test_etag_depends_on_query_params(self):
+        first = self.client.get('/api/quotes/', {'ordering': 'id'})['ETag']
+        self.assertNotEqual(self.client.get('/api/quotes/', {'ordering': '-id'})['ETag'], first)
+
+    def test_catalog_change_changes_etag(self):
+        etag = self.client.get('/api/quotes/total_count/')['ETag']
+        bump_catalog_version()
+        response = self.client.get('/api/quotes/total_count/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class SerializeQuotesTests(TestCase):
+    def test_matches_quote_serializer(self):
+        types = [Type.objects.create(type=f'Type {index}') for index in range(3)]
+        topics = [Topic.objects.create(topic=f'Topic {index}') for index in range(3)]
+        for index in range(12):
+            quote = Quote.objects.create(quote='слово ' * (index * 15), author=f'Author {index}', book='')
+            quote.type.set(types[:index % 4])
+            quote.topics.set(topics[index % 3:])
+
+        queryset = Quote.objects.order_by('length', 'id')
+        expected = QuoteSerializer(queryset, many=True).data
+        with self.assertNumQueries(1):
+            results = serialize_quotes(queryset)
+        # Neither side promises an order for type and topic IDs
+        for quote in [*results, *expected]:
+            quote['type'] = sorted(quote['type'])
+            quote['topics'] = sorted(quote['topics'])
+        self.assertEqual(JSONRenderer().render(results), JSONRenderer().render(expected))
+
+
+class QueryCountTests(TestCase):
+    """Query counts of list pages must not grow with the number of quotes listed"""
+    def setUp(self):
+        api_cache.clear()
+        self.client = APIClient()
+        self.types = [Type.objects.create(type=f'Type {index}') for index in range(3)]
+        self.topics = [Topic.objects.create(topic=f'Topic {index}') for index in range(3)]
+
+    def set_catalog_size(self, count):
+        """Grow the catalog to count quotes, each with two types and a topic"""
+        created = Quote.objects.bulk_create(
+            Quote(quote=f'Quote {index}', author='Author') for index in range(Quote.objects.count(), count)
+        )
+        Quote.type.through.objects.bulk_create(
+            Quote.type.through(quote_id=quote.id, type_id=type_obj.id)
+            for quote in created for type_obj in self.types[:2]
+        )
+        Quote.topics.through.objects.bulk_create(
+            Quote.topics.through(quote_id=quote.id, topic_id=self.topics[quote.id % 3].id)
+            for quote in created
+        )
+        QuoteRank.objects.rebuild()
+        bump_catalog_version()
+
+    def count_queries(self, url, params=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def assert_constant_queries(self, url, cases):
+        """cases: (catalog size, query params) pairs listing different numbers of quotes"""
+        counts = {}
+        for size, params in cases:
+            self.set_catalog_size(size)
+            counts[(size, tuple(params.items()))] = self.count_queries(url, params)
+        self.assertEqual(len(set(counts.values())), 1, f'{url} query counts {counts}')
+
+    def test_paginated_list(self):
+        self.assert_constant_queries('/api/quotes/', [
+            (100, {'page': 1, 'page_size': 10}),
+            (1000, {'page': 1}),
+            (1000, {'page': 3, 'ordering': '-id'}),
+        ])
+
+    def test_unpaginated_filtered_list(self):
+        self.assert_constant_queries('/api/quotes/', [
+            (100, {'type': self.types[0].id}),
+            (1000, {'type': self.types[0].id}),
+            (1000, {'topic': self.topics[1].id}),
+        ])
+
+    def test_position(self):
+        self.assert_constant_queries('/api/quotes/', [(100, {'position': 50}), (1000, {'position': 900})])
+
+    def test_admin_changelist(self):
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(admin)
+        self.assert_constant_queries('/admin/main/quote/', [(10, {}), (100, {})])
+
+
+class StreamingListTests(TestCase):
+    def setUp(self):
+        api_cache.clear()
+        self.client = APIClient()
+        self.type = Type.objects.create(type='Философские')
+        for index in range(30):
+            quote = Quote.objects.create(quote='Мысль\u2028' * (index + 1), author='Автор')
+            quote.type.add(self.type)
+
+    def test_streamed_list_matches_buffered_list(self):
+        params = {'type': self.type.id}
+        with override_settings(QUOTES_STREAM_MIN_COUNT=10**6):
+            buffered = self.client.get('/api/quotes/', params)
+        api_cache.clear()
+        with override_settings(QUOTES_STREAM_MIN_COUNT=10):
+            streamed = self.client.get('/api/quotes/', params)
+        self.assertTrue(streamed.streaming)
+        self.assertEqual(b''.join(streamed.streaming_content), buffered.content)
+
+
+class QuoteRankTests(TestCase):
+    def setUp(self):
+        api_cache.clear()
+        self.client = APIClient()
+        self.types = [Type.objects.create(type=f'Type {index}') for index in range(2)]
+        self.topics = [Topic.objects.create(topic=f'Topic {index}') for index in range(2)]
+        created = Quote.objects.bulk_create(
+            Quote(quote='x' * (1 + (index * 37) % 50), author='Author') for index in range(120)
+        )
+        for quote in created:
+            quote.type.set(self.types[:quote.id % 3])
+            quote.topics.set(self.topics[quote.id % 2:])
+        QuoteRank.objects.rebuild()
+        bump_catalog_version()
+
+    def get_quote_at(self, params, position):
+        response = self.client.get('/api/quotes/', {**params, 'position': position})
+        return response.status_code, response.json()
+
+    def test_positions_match_offset_lookup(self):
+        scopes = [{}, {'type': self.types[0].id}, {'topic': self.topics[1].id},
+                  {'type': self.types[1].id, 'topic': self.topics[0].id}]
+        for scope in scopes:
+            for ordering in ('', 'id', '-id'):
+                params = {**scope, 'ordering': ordering} if ordering else scope
+                ranked = [self.get_quote_at(params, position) for position in (0, 1, 7, 60, 200)]
+                with self.subTest(params=params):
+                    self.assertTrue(QuoteRank.objects.exists())
+                    QuoteRank.objects.all().delete()
+                    api_cache.clear()
+                    expected = [self.get_quote_at(params, position) for position in (0, 1, 7, 60, 200)]
+                    self.assertEqual(ranked, expected)
+                    QuoteRank.objects.rebuild()
+                    api_cache.clear()
+
+    def test_ranked_position_skips_count_and_offset(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/api/quotes/', {'position': 100, 'ordering': '-id'})
+        sql = ' '.join(query['sql'] for query in queries)
+        self.assertNotIn('OFFSET', sql)
+        self.assertNotIn('COUNT(', sql)
+
+    def test_positions_window(self):
+        response = self.client.get('/api/quotes/positions/', {'position': 2, 'radius': 3, 'ordering': 'id'})
+        self.assertEqual(response.status_code, 200)
+        ids = list(Quote.objects.order_by('id').values_list('id', flat=True)[:5])
+        self.assertEqual(response.json()['total_count'], 120)
+        self.assertEqual([(quote['position'], quote['id']) for quote in response.json()['results']],
+                         list(enumerate(ids, 1)))
+
+    def test_positions_window_radius_is_limited(self):
+        response = self.client.get('/api/quotes/positions/', {'position': 2, 'radius': 500})
+        self.assertEqual(response.status_code, 400)
+
+
+class AsyncViewTests(TransactionTestCase):
+    # Async views query from worker threads with their own connections
+    def setUp(self):
+        api_cache.clear()
+        self.client = APIClient()
+        self.type = Type.objects.create(type='Философские')
+        self.topic = Topic.objects.create(topic='Любовь')
+        created = Quote.objects.bulk_create(
+            Quote(quote='слово ' * (1 + index % 40), author=f'Author {index % 7}') for index in range(250)
+        )
+        for quote in created[::3]:
+            quote.type.add(self.type)
+        for quote in created[::5]:
+            quote.topics.add(self.topic)
+
+    def test_matches_sync_endpoints(self):
+        cases = [
+            ('quotes', {}),
+            ('quotes', {'page': 2}),
+            ('quotes', {'page': 1, 'ordering': '-id'}),
+            ('quotes', {'page': 2, 'ordering': 'id', 'page_size': 30}),
+            ('quotes', {'type': self.type.id}),
+            ('quotes', {'topic': self.topic.id, 'ordering': '-id'}),
+            ('quotes', {'search': 'author 3', 'search_mode': 'regex'}),
+            ('types', {'topic': self.topic.id}),
+            ('topics', {}),
+        ]
+        for resource, params in cases:
+            with self.subTest(resource=resource, params=params):
+                expected = self.client.get(f'/api/{resource}/', params).json()
+                response = self.client.get(f'/api/async/{resource}/', params)
+                self.assertEqual(response.status_code, 200)
+                data = response.json()
+                if isinstance(expected, dict):
+                    for key in ('next', 'previous'):
+                        self.assertEqual(data.pop(key) is None, expected.pop(key) is None)
+                self.assertEqual(data, expected)
+
+    def test_cursor_links_match_sync_endpoint(self):
+        for query in ('', '?ordering=-id', '?page_size=30'):
+            with self.subTest(query=query):
+                url, previous_url = f'/api/quotes/{query}', None
+                while url:
+                    expected = self.client.get(url).json()
+                    response = self.client.get(url.replace('/api/', '/api/async/'))
+                    self.assertEqual(response.status_code, 200)
+                    data = response.json()
+                    for key in ('next', 'previous'):
+                        link = data.pop(key)
+                        self.assertEqual(link and link.replace('/api/async/', '/api/'), expected.pop(key))
+                    self.assertEqual(data, expected)
+                    url, previous_url = self.client.get(url).json()['next'], url
+                # Back from the last page by its previous cursor
+                expected = self.client.get(previous_url).json()['previous']
+                self.assertEqual(
+                    self.client.get(expected.replace('/api/', '/api/async/')).json()['results'],
+                    self.client.get(expected).json()['results'],
+                )
+
+    def test_invalid_requests(self):
+        self.assertEqual(self.client.get('/api/async/quotes/', {'cursor': 'abc'}).status_code, 404)
+        self.assertEqual(self.client.get('/api/async/quotes/', {'page': 5}).status_code, 404)
+        self.assertEqual(self.client.get('/api/async/quotes/', {'type': 'abc'}).status_code, 400)
+
+
+class FacetsTests(TestCase):
+    def setUp(self):
+        api_cache.clear()
+        self.client = APIClient()
+        self.types = [Type.objects.create(type=f'Type {index}') for index in range(3)]
+        self.topics = [Topic.objects.create(topic=f'Topic {index}') for index in range(3)]
+        for index in range(40):
+            quote = Quote.objects.create(quote=f'Quote {index}', author='Author' if index % 2 else 'Writer')
+            quote.type.set(self.types[:index % 4])
+            quote.topics.set(self.topics[index % 3:])
+        # Read the catalog version now, so it isn't counted with the facets query
+        get_catalog_version()
+
+    def expected_facets(self, quotes, type_id=None, topic_id=None):
+        by_type = quotes.filter(topics__id=topic_id) if topic_id else quotes
+        by_topic = quotes.filter(type__id=type_id) if type_id else quotes
+        return {
+            'total_count': (by_type.filter(type__id=type_id) if type_id else by_type).count(),
+            'types': [
+                {'id': item.id, 'type': item.type, 'count': by_type.filter(type=item).count()}
+                for item in self.types if by_type.filter(type=item).exists()
+            ],
+            'topics': [
+                {'id': item.id, 'topic': item.topic, 'count': by_topic.filter(topics=item).count()}
+                for item in self.topics if by_topic.filter(topics=item).exists()
+            ],
+        }
+
+    def test_counts_match_filtered_querysets(self):
+        for params in ({}, {'type': self.types[0].id}, {'topic': self.topics[2].id},
+                       {'type': self.types[1].id, 'topic': self.topics[0].id}):
+            with self.subTest(params=params):
+                with self.assertNumQueries(1):
+                    response = self.client.get('/api/quotes/facets/', params)
+                self.assertEqual(response.json(), self.expected_facets(
+                    Quote.objects.all(), params.get('type'), params.get('topic')
+                ))
+                # Same total as the filtered list
+                self.assertEqual(response.json()['total_count'],
+                                 self.client.get('/api/quotes/total_count/', params).json()['total_count'])
+
+    def test_search_ignores_type_and_topic(self):
+        params = {'search': 'Writer', 'search_mode': 'regex', 'type': self.types[0].id}
+        response = self.client.get('/api/quotes/facets/', params)
+        self.assertEqual(response.json(), self.expected_facets(Quote.objects.filter(author='Writer')))
+
+
+class RankRebuildTests(TransactionTestCase):
+    # Bulk changes rebuild ranks on commit
+    def setUp(self):
+        api_cache.clear()
+        self.types = [Type.objects.create(type=f'Type {index}') for index in range(2)]
+        self.topics = [Topic.objects.create(topic=f'Topic {index}') for index in range(2)]
+        self.quotes = [Quote.objects.create(quote='x' * (1 + index * 7 % 5), author='Author') for index in range(8)]
+        for quote in self.quotes:
+            quote.type.set(self.types[:quote.id % 3])
+            quote.topics.set(self.topics[quote.id % 2:])
+
+    def ranks(self):
+        return set(QuoteRank.objects.values_list('scope', 'quote_id', 'length_position', 'id_position'))
+
+    def assert_ranks_match_rebuild(self):
+        ranks = self.ranks()
+        QuoteRank.objects.rebuild()
+        self.assertEqual(ranks, self.ranks())
+
+    def save_quote(self, quote, text):
+        quote.quote = text
+        quote.save()
+
+    def test_changes_keep_ranks_exact(self):
+        first, second = self.quotes[:2]
+        steps = [
+            lambda: Quote.objects.create(quote='xxx'),
+            lambda: Quote.objects.create(quote='x'),
+            lambda: self.save_quote(first, 'x' * 9),
+            lambda: self.save_quote(first, 'x' * 2),
+            lambda: self.save_quote(first, 'x' * 3),
+            lambda: first.type.add(*self.types),
+            lambda: self.topics[1].quote_set.add(*self.quotes[2:5]),
+            lambda: second.topics.remove(*self.topics),
+            lambda: self.topics[0].quote_set.clear(),
+            lambda: second.delete(),
+            lambda: Quote.objects.filter(pk__in=[quote.pk for quote in self.quotes[5:7]]).delete(),
+            lambda: self.types[1].delete(),
+        ]
+        for index, step in enumerate(steps):
+            with self.subTest(step=index):
+                with unittest.mock.patch.object(QuoteRank.objects, 'rebuild') as rebuild:
+                    step()
+                rebuild.assert_not_called()
+                self.assert_ranks_match_rebuild()
+
+    def test_length_change_moves_quote_in_its_scopes(self):
+        quote = next(quote for quote in self.quotes if quote.id % 3 == 1)
+        quote.quote = 'x' * 10
+        with unittest.mock.patch.object(QuoteRank.objects, 'move') as move:
+            quote.save()
+        quote_id, scopes = move.call_args.args
+        self.assertEqual(quote_id, quote.id)
+        self.assertIn('', scopes)
+        self.assertIn(f'type={self.types[0].id}', scopes)
+        self.assertNotIn(f'type={self.types[1].id}', scopes)
+
+    def test_name_and_author_changes_skip_rebuild(self):
+        quote = self.quotes[0]
+        quote.author = 'Other'
+        with unittest.mock.patch.object(QuoteRank.objects, 'rebuild') as rebuild:
+            quote.save()
+            self.types[0].type = 'Renamed'
+            self.types[0].save()
+            self.topics[0].topic = 'Renamed'
+            self.topics[0].save()
+        rebuild.assert_not_called()
+
+    def test_bulk_transaction_rebuilds_once(self):
+        rebuild = unittest.mock.patch.object(QuoteRank.objects, 'rebuild', wraps=QuoteRank.objects.rebuild)
+        with unittest.mock.patch('main.signals.RANK_SHIFT_LIMIT', 3), rebuild as rebuild:
+            with transaction.atomic():
+                self.quotes[0].type.add(self.types[1])
+                self.quotes[1].topics.add(self.topics[0])
+                self.save_quote(self.quotes[2], 'x' * 12)
+                self.quotes[3].delete()
+                Quote.objects.create(quote='xx')
+        rebuild.assert_called_once()
+        self.assert_ranks_match_rebuild()
+
+    def test_concurrent_rebuilds(self):
+        errors = []
+
+        def rebuild():
+            try:
+                QuoteRank.objects.rebuild()
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=rebuild) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assert_ranks_match_rebuild()
+
+
+class TypeTopicCountTests(TransactionTestCase):
+    # Signals run on commit
+    def setUp(self):
+        api_cache.clear()
+        self.types = [Type.objects.create(type=f'Type {index}') for index in range(3)]
+        self.topics = [Topic.objects.create(topic=f'Topic {index}') for index in range(3)]
+        self.quotes = [Quote.objects.create(quote=f'Quote {index}') for index in range(6)]
+
+    def assert_counts_match_rebuild(self):
+        counts = set(TypeTopicCount.objects.values_list('type_id', 'topic_id', 'count'))
+        TypeTopicCount.objects.rebuild()
+        self.assertEqual(counts, set(TypeTopicCount.objects.values_list('type_id', 'topic_id', 'count')))
+
+    def test_m2m_changes_keep_counts_exact(self):
+        first, second, third = self.quotes[:3]
+        steps = [
+            lambda: first.type.add(*self.types),
+            lambda: first.topics.add(self.topics[0], self.topics[1]),
+            lambda: second.topics.set(self.topics[1:]),
+            lambda: second.type.add(self.types[0], self.types[0]),
+            lambda: self.types[2].quote_set.add(second, third),
+            lambda: self.topics[0].quote_set.add(*self.quotes),
+            lambda: first.type.remove(self.types[1], self.types[1]),
+            lambda: second.topics.remove(self.topics[2], self.topics[0]),
+            lambda: third.type.remove(self.types[0]),
+            lambda: self.topics[0].quote_set.remove(first, third),
+            lambda: first.topics.clear(),
+            lambda: self.types[2].quote_set.clear(),
+            lambda: second.type.set([self.types[1]]),
+            lambda: first.delete(),
+            lambda: self.types[1].delete(),
+        ]
+        for index, step in enumerate(steps):
+            with self.subTest(step=index):
+                step()
+                self.assert_counts_match_rebuild()
+
+    def test_deletes_adjust_counts(self):
+        for quote in self.quotes[:4]:
+            quote.type.add(*self.types[:quote.id % 3])
+            quote.topics.add(*self.topics[quote.id % 2:])
+        with unittest.mock.patch.object(TypeTopicCount.objects, 'rebuild') as rebuild:
+            self.quotes[0].delete()
+            Quote.objects.filter(pk__in=[self.quotes[1].pk, self.quotes[2].pk]).delete()
+            self.topics[1].delete()
+        rebuild.assert_not_called()
+        self.assert_counts_match_rebuild()
+
+    def test_concurrent_rebuilds(self):
+        self.quotes[0].type.add(*self.types)
+        self.quotes[0].topics.add(*self.topics)
+        errors = []
+
+        def rebuild():
+            try:
+                TypeTopicCount.objects.rebuild()
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=rebuild) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assert_counts_match_rebuild()
+
+    def test_lists_served_from_counts(self):
+        self.quotes[0].type.add(self.types[0])
+        self.quotes[0].topics.add(self.topics[1])
+        self.quotes[1].type.add(self.types[1])
+        client = APIClient()
+        self.assertEqual([item['id'] for item in client.get('/api/types/').json()], [self.types[0].id, self.types[1].id])
+        self.assertEqual([item['id'] for item in client.get('/api/types/', {'topic': self.topics[1].id}).json()],
+                         [self.types[0].id])
+        self.assertEqual([item['id'] for item in client.get('/api/topics/', {'type': self.types[1].id}).json()], [])
+
+    def test_lists_reject_non_integer_filters(self):
+        client = APIClient()
+        for url, param in (('/api/types/', 'topic'), ('/api/topics/', 'type')):
+            with self.subTest(url=url):
+                response = client.get(url, {param: 'abc'})
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json(), {param: ['Enter a whole number.']})
+
+
+class StatisticsSnapshotTests(TransactionTestCase):
+    def setUp(self):
+        # Flushed by earlier tests along with the rows the migration built
+        UnlinkedQuoteCount.objects.rebuild()
+        self.types = [Type.objects.create(type=f'Type {index}') for index in range(2)]
+        self.topics = [Topic.objects.create(topic=f'Topic {index}') for index in range(2)]
+        authors = ['Лев Толстой', 'Антон Чехов', 'Пушкин', '', 'Фёдор Михайлович Достоевский', 'Лев Толстой']
+        self.quotes = [Quote.objects.create(quote=f'Quote {index}', author=author) for index, author in enumerate(authors)]
+
+    def snapshot(self):
+        return (
+            set(AuthorCount.objects.values_list('author', 'sort_key', 'count')),
+            set(UnlinkedQuoteCount.objects.values_list('field', 'count')),
+        )
+
+    def assert_snapshot_matches_rebuild(self):
+        snapshot = self.snapshot()
+        AuthorCount.objects.rebuild()
+        UnlinkedQuoteCount.objects.rebuild()
+        self.assertEqual(snapshot, self.snapshot())
+
+    def test_changes_keep_counts_exact(self):
+        first, second, third = self.quotes[:3]
+
+        def rename(quote, author):
+            quote.author = author
+            quote.save()
+
+        steps = [
+            lambda: first.type.add(*self.types),
+            lambda: self.topics[0].quote_set.add(*self.quotes[:4]),
+            lambda: second.type.set([self.types[1]]),
+            lambda: first.type.remove(self.types[0]),
+            lambda: first.type.remove(self.types[1]),
+            lambda: self.topics[0].quote_set.remove(second),
+            lambda: self.topics[0].quote_set.clear(),
+            lambda: third.topics.add(self.topics[1]),
+            lambda: third.topics.clear(),
+            lambda: rename(first, 'Антон Чехов'),
+            lambda: rename(third, ''),
+            lambda: second.save(update_fields=['quote']),
+            lambda: Quote.objects.create(quote='New', author='Новый Автор'),
+            lambda: second.delete(),
+            lambda: self.types[1].delete(),
+        ]
+        for index, step in enumerate(steps):
+            with self.subTest(step=index):
+                step()
+                self.assert_snapshot_matches_rebuild()
+
+    def test_deletes_adjust_counts(self):
+        self.quotes[0].type.add(*self.types)
+        self.quotes[1].type.add(self.types[1])
+        self.quotes[1].topics.add(self.topics[0])
+        self.quotes[2].topics.add(*self.topics)
+        steps = [
+            lambda: self.quotes[3].delete(),
+            lambda: self.quotes[1].delete(),
+            lambda: self.types[1].delete(),
+            lambda: Quote.objects.filter(author='Лев Толстой').delete(),
+            lambda: self.topics[1].delete(),
+        ]
+        for index, step in enumerate(steps):
+            with self.subTest(step=index):
+                with unittest.mock.patch.object(AuthorCount.objects, 'rebuild') as rebuild_authors, \
+                        unittest.mock.patch.object(UnlinkedQuoteCount.objects, 'rebuild') as rebuild_unlinked:
+                    step()
+                rebuild_authors.assert_not_called()
+                rebuild_unlinked.assert_not_called()
+                self.assert_snapshot_matches_rebuild()
+
+    def test_statistics_page(self):
+        self.quotes[0].type.add(self.types[0])
+        self.quotes[1].type.add(self.types[0], self.types[1])
+        self.quotes[1].topics.add(self.topics[1])
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(admin)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/admin/statistics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(len(queries), 6)
+
+        context = response.context
+        self.assertEqual([(item['type'], item['quote_count']) for item in context['type_stats']],
+                         [('Type 0', 2), ('Type 1', 1)])
+        self.assertEqual([(item['topic'], item['quote_count']) for item in context['topic_stats']], [('Topic 1', 1)])
+        self.assertEqual((context['quotes_without_types'], context['quotes_without_topics']), (4, 5))
+        # Sorted by the second word of the name, else the first
+        self.assertEqual([(item['full_name'], item['quote_count']) for item in context['author_stats']], [
+            ('Фёдор Михайлович Достоевский', 1),
+            ('Пушкин', 1),
+            ('Лев Толстой', 2),
+            ('Антон Чехов', 1),
+        ])
+        self.assertEqual(context['quotes_without_authors'], 1)
+
+
+class ImportQuotesTests(TestCase):
+    def import_file(self, suffix, content, **options):
+        with tempfile.NamedTemporaryFile('w', suffix=suffix, encoding='utf-8', delete=False) as file:
+            file.write(content)
+        self.addCleanup(os.remove, file.name)
+        stderr = io.StringIO()
+        call_command('import_quotes', file.name, stdout=io.StringIO(), stderr=stderr, **options)
+        return stderr.getvalue()
+
+    def test_csv_import(self):
+        Type.objects.create(type='Философские')
+        errors = self.import_file('.csv', (
+            'quote,author,book,types,topics\n'
+            'Всё проходит.,Соломон,,Философские|Жизненные,Время\n'
+            '"Познай, самого себя.",Сократ,,Философские,\n'
+            ',Никто,,,\n'
+        ), batch_size=1)
+        self.assertIn('Line 4: skipped, empty quote', errors)
+        self.assertEqual(Type.objects.count(), 2)
+        first, second = Quote.objects.order_by('id')
+        self.assertEqual(second.quote, 'Познай, самого себя.')
+        self.assertEqual(sorted(first.type.values_list('type', flat=True)), ['Жизненные', 'Философские'])
+        self.assertEqual(list(first.topics.values_list('topic', flat=True)), ['Время'])
+        self.assertEqual(list(second.type.values_list('type', flat=True)), ['Философские'])
+        self.assertTrue(Quote.objects.filter(search_vector=build_prefix_query('самого')).exists())
+        self.assertEqual(QuoteRank.objects.filter(scope='').count(), 2)
+        self.assertEqual(TypeTopicCount.objects.get(type__type='Философские', topic=None).count, 2)
+
+    def test_jsonl_import(self):
+        lines = [
+            {'quote': 'Quote one', 'author': 'A', 'types': ['T1', 'T2'], 'topics': 'P1'},
+            {'quote': 'Quote two', 'book': 'B' * 201},
+            'not an object',
+        ]
+        errors = self.import_file('.jsonl', '\n'.join(json.dumps(line) for line in lines) + '\n{broken\n')
+        self.assertIn('Line 2: skipped, book longer than 200 characters', errors)
+        self.assertIn('Line 3: skipped, not a JSON object', errors)
+        self.assertIn('Line 4: skipped, invalid JSON', errors)
+        quote = Quote.objects.get()
+        self.assertEqual(sorted(quote.type.values_list('type', flat=True)), ['T1', 'T2'])
+        self.assertEqual(list(quote.topics.values_list('topic', flat=True)), ['P1'])
+
+    def test_query_count_does_not_grow_with_rows(self):
+        def count_queries(rows):
+            content = ''.join(
+                json.dumps({'quote': f'Quote {index}', 'types': [f'T{index % 3}'], 'topics': ['P']}) + '\n'
+                for index in range(rows)
+            )
+            with CaptureQueriesContext(connection) as queries:
+                self.import_file('.jsonl', content)
+            return len(queries)
+        count_queries(10)
+        self.assertEqual(count_queries(10), count_queries(500))
+
+    def test_failed_batch_still_refreshes_committed_batches(self):
+        bulk_create = Quote.topics.through.objects.bulk_create
+        calls = []
+
+        def fail_second_batch(links):
+            calls.append(links)
+            if len(calls) == 2:
+                raise RuntimeError('Disk full')
+            return bulk_create(links)
+        content = ''.join(
+            json.dumps({'quote': f'Quote {index}', 'author': 'A', 'types': ['T'], 'topics': ['P']}) + '\n'
+            for index in range(4)
+        )
+        version = get_catalog_version()
+        with unittest.mock.patch.object(Quote.topics.through.objects, 'bulk_create', side_effect=fail_second_batch):
+            with self.assertRaisesMessage(RuntimeError, 'Disk full'):
+                self.import_file('.jsonl', content, batch_size=2)
+        self.assertEqual(Quote.objects.count(), 2)
+        self.assertEqual(QuoteRank.objects.filter(scope='').count(), 2)
+        self.assertEqual(TypeTopicCount.objects.get(type__type='T', topic__topic='P').count, 2)
+        self.assertEqual(AuthorCount.objects.get(author='A').count, 2)
+        self.assertEqual(get_catalog_version(), version + 1)
+
+
+class ReindexQuotesTests(TestCase):
+    def test_renumbers_quotes_and_links_in_order(self):
+        types = [Type.objects.create(type=f'Type {index}') for index in range(2)]
+        topic = Topic.objects.create(topic='Topic')
+        for index in range(20):
+            quote = Quote.objects.create(quote=f'Quote {index}')
+            quote.type.set(types[:index % 3])
+            if index % 2:
+                quote.topics.add(topic)
+        Quote.objects.annotate(mod=F('id') % 3).filter(mod=0).delete()
+        QuoteRank.objects.rebuild()
+
+        def snapshot():
+            return [
+                (quote.quote, sorted(quote.type.values_list('type', flat=True)), quote.topics.count())
+                for quote in Quote.objects.order_by('id')
+            ]
+        before = snapshot()
+        call_command('reindex_quotes', interactive=False, stdout=io.StringIO())
+
+        self.assertEqual(list(Quote.objects.order_by('id').values_list('id', flat=True)), list(range(1, len(before) + 1)))
+        self.assertEqual(snapshot(), before)
+        self.assertEqual(
+            list(QuoteRank.objects.filter(scope='').order_by('id_position').values_list('quote_id', flat=True)),
+            list(range(1, len(before) + 1))
+        )
+        self.assertEqual(Quote.objects.create(quote='Next').id, len(before) + 1)
+
+
+class CheckQuotesIdsTests(TestCase):
+    def check_ids(self, **options):
+        stdout = io.StringIO()
+        call_command('check_quotes_ids', format='json', stdout=stdout, **options)
+        return json.loads(stdout.getvalue())
+
+    def test_reports_gap_ranges(self):
+        quotes = Quote.objects.bulk_create(Quote(quote=f'Quote {index}') for index in range(20))
+        ids = [quote.id for quote in quotes]
+        Quote.objects.filter(id__in=ids[3:6] + ids[10:11] + ids[15:19]).delete()
+
+        report = self.check_ids()
+        self.assertEqual(report['total'], 12)
+        self.assertEqual(report['missing_ids'], 8)
+        self.assertEqual(report['gap_count'], 3)
+        self.assertEqual(report['gaps'], [[ids[3], ids[5]], [ids[10], ids[10]], [ids[15], ids[18]]])
+        self.assertEqual(self.check_ids(limit=2)['gaps'], [[ids[3], ids[5]], [ids[10], ids[10]]])
+
+    def test_empty_table(self):
+        report = self.check_ids()
+        self.assertEqual((report['total'], report['gap_count'], report['gaps']), (0, 0, []))
+
+
+class GenerateQuotesTests(TransactionTestCase):
+    def generate(self, **options):
+        call_command('generate_quotes', fast=True, clear=True, count=57, seed=7, chunk_size=20,
+                     stdout=io.StringIO(), **options)
+        return [
+            (quote.id, quote.quote, quote.author, quote.book,
+             sorted(quote.type.values_list('type', flat=True)), sorted(quote.topics.values_list('topic', flat=True)))
+            for quote in Quote.objects.order_by('id')
+        ]
+
+    def test_fast_mode_is_reproducible(self):
+        dataset = self.generate()
+        self.assertEqual([row[0] for row in dataset], list(range(1, 58)))
+        self.assertTrue(all(1 <= len(row[4]) <= 3 and len(row[5]) <= 2 for row in dataset))
+        self.assertTrue(any(row[5] for row in dataset))
+        self.assertFalse(Quote.objects.filter(search_vector__isnull=True).exists())
+        self.assertEqual(QuoteRank.objects.filter(scope='').count(), 57)
+        self.assertEqual(TypeTopicCount.objects.filter(topic=None, type__isnull=False).aggregate(total=Sum('count'))['total'],
+                         sum(len(row[4]) for row in dataset))
+
+        self.assertEqual(self.generate(processes=2), dataset)
+
+    def test_default_mode_refreshes_ranks_and_counts(self):
+        Quote.objects.bulk_create(Quote(quote=f'Quote {index}') for index in range(30))
+        QuoteRank.objects.rebuild()
+        call_command('generate_quotes', count=150, stdout=io.StringIO())
+        self.assertEqual(QuoteRank.objects.filter(scope='').count(), 180)
+        ranks = set(QuoteRank.objects.values_list('scope', 'quote_id', 'length_position', 'id_position'))
+        counts = set(TypeTopicCount.objects.values_list('type_id', 'topic_id', 'count'))
+        QuoteRank.objects.rebuild()
+        TypeTopicCount.objects.rebuild()
+        self.assertEqual(ranks, set(QuoteRank.objects.values_list('scope', 'quote_id', 'length_position', 'id_position')))
+        self.assertEqual(counts, set(TypeTopicCount.objects.values_list('type_id', 'topic_id', 'count')))
+
+
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        api_cache.clear()
+        endpoint_stats.reset()
+        self.client = APIClient()
+        quote_type = Type.objects.create(type='Type')
+        for index in range(5):
+            Quote.objects.create(quote=f'Quote {index}', author='Author').type.add(quote_type)
+
+    def test_server_timing_header(self):
+        self.assertNotIn('Server-Timing', self.client.get('/api/quotes/'))
+        self.client.force_login(User.objects.create_user('staff', password='password', is_staff=True))
+        api_cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/quotes/')
+        timing = response['Server-Timing']
+        self.assertIn('db;dur=', timing)
+        self.assertIn(f'desc="{len(queries)} queries"', timing)
+        self.assertIn('serialize;dur=', timing)
+        self.assertIn('render;dur=', timing)
+        self.assertIn(f'size;desc="{len(response.content)} bytes"', timing)
+
+    async def test_server_timing_header_under_asgi(self):
+        response = await self.async_client.get('/api/types/')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Server-Timing', response)
+        await self.async_client.aforce_login(await User.objects.acreate(username='staff', is_staff=True))
+        response = await self.async_client.get('/api/types/')
+        self.assertIn('db;dur=', response['Server-Timing'])
+
+    def test_slow_request_log(self):
+        with override_settings(QUOTES_SLOW_REQUEST_MS=0), self.assertLogs('main.metrics', 'WARNING') as logs:
+            self.client.get('/api/quotes/', {'type': Type.objects.get().id})
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual((record['event'], record['endpoint'], record['status']), ('slow_request', 'GET quote-list', 200))
+        self.assertTrue(record['slowest_queries'])
+        self.assertTrue(all(query['sql'].startswith('SELECT') for query in record['slowest_queries']))
+
+    def test_metrics_endpoint(self):
+        for _ in range(3):
+            self.client.get('/api/types/')
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 403)
+
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        endpoints = self.client.get('/api/metrics/').json()['endpoints']
+        self.assertEqual(endpoints['GET type-list']['count'], 3)
+        self.assertLessEqual(endpoints['GET type-list']['p50_ms'], endpoints['GET type-list']['p99_ms'])
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual([percentile(values, percent) for percent in (50, 90, 99, 100)], [50, 90, 99, 100])
+        self.assertEqual(percentile([7], 95), 7)
+
+
+class ExportQuotesTests(TestCase):
+    def setUp(self):
+        api_cache.clear()
+        self.client = APIClient()
+        philosophy = Type.objects.create(type='Философские')
+        humor = Type.objects.create(type='Юмор')
+        time_topic = Topic.objects.create(topic='Время')
+        first = Quote.objects.create(quote='Всё проходит, и это пройдёт.', author='Соломон')
+        first.type.add(humor)
+        first.type.add(philosophy)
+        first.topics.add(time_topic)
+        Quote.objects.create(quote='Line "one"\nline two', book='Книга')
+        self.expected = [
+            {'id': first.id, 'quote': first.quote, 'author': 'Соломон', 'book': '',
+             'types': ['Юмор', 'Философские'], 'topics': ['Время']},
+            {'id': first.id + 1, 'quote': 'Line "one"\nline two', 'author': '', 'book': 'Книга',
+             'types': [], 'topics': []},
+        ]
+
+    def export(self, **params):
+        response = self.client.get('/api/quotes/export/', params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    def test_ndjson_export(self):
+        self.assertEqual([json.loads(line) for line in self.export().splitlines()], self.expected)
+        filtered = self.export(type=Type.objects.get(type='Юмор').id)
+        self.assertEqual([json.loads(line)['id'] for line in filtered.splitlines()], [self.expected[0]['id']])
+
+    def test_csv_export_imports_back(self):
+        content = self.export(export_format='csv')
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', encoding='utf-8', newline='', delete=False) as file:
+            file.write(content)
+        self.addCleanup(os.remove, file.name)
+        Quote.objects.all().delete()
+        call_command('import_quotes', file.name, stdout=io.StringIO())
+
+        imported = [
+            {**row, 'id': quote.id}
+            for row, quote in zip(self.expected, Quote.objects.order_by('id'))
+        ]
+        self.assertEqual([json.loads(line) for line in self.export().splitlines()], imported)
+
+    def test_command_matches_endpoint(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'quotes.ndjson')
+            call_command('export_quotes', path, chunk_size=1, stderr=io.StringIO())
+            with open(path, encoding='utf-8') as file:
+                self.assertEqual(file.read(), self.export())
+
+    def test_unknown_format(self):
+        self.assertEqual(self.client.get('/api/quotes/export/', {'export_format': 'xml'}).status_code, 400)
+
+
+@override_settings(API_COMPRESS_MIN_SIZE=100)
+class ResponseEncodingTests(TestCase):
+    def setUp(self):
+        api_cache.clear()
+        self.client = APIClient()
+        quote_type = Type.objects.create(type='Философские')
+        for index in range(20):
+            Quote.objects.create(quote=f'Цитата номер {index}', author='Автор').type.add(quote_type)
+
+    def test_negotiate_encoding(self):
+        self.assertEqual(negotiate_encoding(''), None)
+        self.assertEqual(negotiate_encoding('gzip, deflate'), 'gzip')
+        self.assertEqual(negotiate_encoding('gzip;q=0, identity'), None)
+        if brotli is not None:
+            self.assertEqual(negotiate_encoding('gzip, deflate, br'), 'br')
+            self.assertEqual(negotiate_encoding('br;q=0.5, gzip'), 'gzip')
+            self.assertEqual(negotiate_encoding('*'), 'br')
+
+    @override_settings(DEBUG=True)
+    def test_cached_response_is_compressed_once(self):
+        plain = self.client.get('/api/quotes/')
+        compressed = self.client.get('/api/quotes/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', compressed['Vary'])
+        self.assertNotEqual(compressed['ETag'], plain['ETag'])
+        self.assertEqual(gzip.decompress(compressed.content), plain.content)
+
+        with self.assertNumQueries(0):
+            repeated = self.client.get('/api/quotes/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(repeated.content, compressed.content)
+        self.assertNotIn('compress;', repeated['Server-Timing'])
+
+    @unittest.skipIf(brotli is None, 'brotli is not installed')
+    def test_brotli(self):
+        compressed = self.client.get('/api/quotes/pages_info/', HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(compressed['Content-Encoding'], 'br')
+        self.assertEqual(json.loads(brotli.decompress(compressed.content))['total_count'], 20)
+        # The single type list is below API_COMPRESS_MIN_SIZE
+        self.assertFalse(self.client.get('/api/types/', HTTP_ACCEPT_ENCODING='br').has_header('Content-Encoding'))
+
+    @unittest.skipIf(msgpack is None, 'msgpack is not installed')
+    def test_msgpack(self):
+        expected = self.client.get('/api/quotes/', {'page': 1}).json()
+        response = self.client.get('/api/quotes/', {'page': 1}, HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        self.assertEqual(msgpack.unpackb(response.content), expected)
+
+    def test_streamed_response_is_compressed(self):
+        with override_settings(QUOTES_STREAM_MIN_COUNT=10):
+            plain = self.client.get('/api/quotes/', {'type': Type.objects.get().id})
+            compressed = self.client.get('/api/quotes/', {'type': Type.objects.get().id}, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertTrue(compressed.streaming)
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(b''.join(compressed.streaming_content)), b''.join(plain.streaming_content))
+
+    def test_admin_pages_are_not_compressed(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        response = self.client.get('/admin/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+
+class PublishStaticApiTests(TestCase):
+    def setUp(self):
+        api_cache.clear()
+        Quote.objects.bulk_create(
+            Quote(quote='x' * (1 + (index * 37) % 250), author='Author') for index in range(250)
+        )
+        QuoteRank.objects.rebuild()
+        bump_catalog_version()
+        self.output = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.output)
+
+    def publish(self):
+        stdout = io.StringIO()
+        call_command('publish_static_api', output=self.output, base_url='http://testserver', stdout=stdout)
+        with open(os.path.join(self.output, 'manifest.json'), encoding='utf-8') as file:
+            return json.load(file)['files'], stdout.getvalue()
+
+    def read(self, name):
+        with open(os.path.join(self.output, name), 'rb') as file:
+            return file.read()
+
+    def test_files_match_api_responses(self):
+        files, _ = self.publish()
+        # 250 quotes make two pages per ordering, the last one merged
+        self.assertEqual(len(files), 4 + 5)
+        client = APIClient()
+        for key, entry in files.items():
+            self.assertEqual(self.read(entry['file']), client.get(key).content, key)
+        with open(os.path.join(self.output, 'static_api.map'), encoding='utf-8') as file:
+            self.assertIn(f'"/api/quotes/?page=2&ordering=-id" /static-api/{files["/api/quotes/?page=2&ordering=-id"]["file"]};', file.read())
+
+    def test_only_changed_pages_are_rendered(self):
+        files, _ = self.publish()
+        self.assertIn('5 rendered, 0 files written', self.publish()[1])
+
+        # Same length, so the quote stays on its page in both orderings
+        quote = Quote.objects.order_by('id').first()
+        quote.author = 'Другой автор'
+        quote.save()
+        api_cache.clear()
+        updated, output = self.publish()
+        self.assertIn('7 rendered, 2 files written, 2 stale files removed', output)
+        changed = {key for key in files if files[key]['file'] != updated[key]['file']}
+        self.assertEqual(changed, {'/api/quotes/?page=1', '/api/quotes/?page=2&ordering=-id'})
+        for key in changed:
+            self.assertFalse(os.path.exists(os.path.join(self.output, files[key]['file'])))
+            self.assertIn('Другой автор', self.read(updated[key]['file']).decode('utf-8'))
+
+
+class RandomQuoteTests(TestCase):
+    def setUp(self):
+        api_cache.clear()
+        self.client = APIClient()
+        self.type = Type.objects.create(type='Философские')
+        created = Quote.objects.bulk_create(Quote(quote=f'Цитата {index}', author='Автор') for index in range(60))
+        for quote in created[::3]:
+            quote.type.add(self.type)
+        # Leave gaps in the IDs, as check_quotes_ids would report
+        Quote.objects.filter(id__in=[quote.id for quote in created[1:40:2]]).delete()
+        QuoteRank.objects.rebuild()
+        bump_catalog_version()
+
+    def test_random_quote(self):
+        ids = set(Quote.objects.values_list('id', flat=True))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/quotes/random/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(response.json()['id'], ids)
+        self.assertNotIn('ETag', response)
+        self.assertIn('no-store', response['Cache-Control'])
+        sql = ' '.join(query['sql'] for query in queries)
+        self.assertNotIn('RANDOM()', sql)
+        self.assertNotIn('OFFSET', sql)
+        self.assertEqual(sql.count('MAX('), 1)
+
+        type_ids = set(self.type.quote_set.values_list('id', flat=True))
+        picked = {self.client.get('/api/quotes/random/', {'type': self.type.id}).json()['id'] for _ in range(30)}
+        self.assertLessEqual(picked, type_ids)
+        self.assertGreater(len(picked), 1)
+
+    def test_random_quote_without_rank_index(self):
+        QuoteRank.objects.all().delete()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/quotes/random/', {'type': self.type.id})
+        sql = ' '.join(query['sql'] for query in queries)
+        self.assertIn('ROW_NUMBER()', sql)
+        self.assertNotIn('OFFSET', sql)
+        self.assertIn(response.json()['id'], set(self.type.quote_set.values_list('id', flat=True)))
+        Quote.objects.all().delete()
+        self.assertEqual(self.client.get('/api/quotes/random/').status_code, 404)
+
+    def test_daily_quote(self):
+        first = self.client.get('/api/quotes/daily/')
+        self.assertEqual(first.status_code, 200)
+        # Same quote after the catalog changes, until the day ends
+        Quote.objects.create(quote='Новая цитата')
+        QuoteRank.objects.rebuild()
+        bump_catalog_version()
+        second = self.client.get('/api/quotes/daily/')
+        self.assertEqual(second.json(), first.json())
+        self.assertNotEqual(second['ETag'], first['ETag'])
+
+        with unittest.mock.patch('main.views.timezone.localdate', return_value=datetime.date(2030, 1, 1)):
+            other_day = self.client.get('/api/quotes/daily/')
+            self.assertNotEqual(other_day['ETag'], second['ETag'])
+            api_cache.clear()
+            self.assertEqual(self.client.get('/api/quotes/daily/').json(), other_day.json())
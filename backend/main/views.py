@@ -1,34 +1,105 @@
-from .models import Quote, Page, Type, Topic
+from .models import Quote, QuoteRank, Page, Type, Topic, TypeTopicCount, rank_scope
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import add_never_cache_headers
 from django.views.decorators.csrf import csrf_exempt
 from rest_framework import viewsets
-from rest_framework.decorators import action
+from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
-from .serializers import QuoteSerializer, PageSerializer, TypeSerializer, TopicSerializer
-from .pagination import CustomQuotePagination
+from .serializers import (
+    EXPORT_FIELDS, QuoteSerializer, PageSerializer, TypeSerializer, TopicSerializer,
+    iter_quote_exports, iter_serialized_quotes, serialize_quotes,
+)
+from .renderers import API_RENDERERS, stream_csv, stream_json_envelope, stream_ndjson
+from .pagination import CustomQuotePagination, get_page_bounds
 from django_nextjs.render import render_nextjs_page_sync
-from django.db.models.functions import Length
-from django.db.models import Count
+from django.db.models import Max, Window
+from django.db.models.functions import RowNumber
 from rest_framework.filters import SearchFilter, OrderingFilter
 from django_filters.rest_framework import DjangoFilterBackend
 from .filters import QuoteFilter
+from .cache import ConditionalGetMixin, api_cache, cached_response
+from .metrics import endpoint_stats
+import hashlib
 import math
+import random
 
 
+# Content type and file extension of each export format
+EXPORT_FORMATS = {
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+}
+
+# The quote of the day is remembered by date, so catalog changes during the day don't replace it
+DAILY_PICK_TIMEOUT = 24 * 60 * 60
+
+
+def get_unpaginated_info(count):
+    """Envelope of a filtered quote list returned as one page, without results"""
+    return {
+        'count': count,
+        'total_pages': 1,
+        'current_page': 1,
+        'page_size': count,
+        'items_on_page': count,
+        'start_item': 1,
+        'end_item': count,
+        'page_label': f"1 - {count}",
+        'next': None,
+        'previous': None,
+    }
+
+
+def get_id_param(request, param):
+    """The ID in ?param=, None when missing; a 400 like the facets one when not a whole number"""
+    value = request.query_params.get(param)
+    if not value:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ValidationError({param: ['Enter a whole number.']})
+
 def index(request):
     return render_nextjs_page_sync(request)
 
 def page(request, slug):
     return render_nextjs_page_sync(request)
 
-class QuoteViewSet(viewsets.ModelViewSet):
-    queryset = Quote.objects.all().order_by(Length('quote').asc())
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def metrics(request):
+    """Latency percentiles, query counts and sizes per endpoint from this process's recent requests"""
+    return Response({
+        'slow_request_ms': settings.QUOTES_SLOW_REQUEST_MS,
+        'endpoints': endpoint_stats.summary(),
+    })
+
+class QuoteViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
+    queryset = Quote.objects.defer('search_vector').order_by('length', 'id')
     serializer_class = QuoteSerializer
+    renderer_classes = API_RENDERERS
     permission_classes = []
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
     filterset_class = QuoteFilter
     ordering_fields = ['id']
     pagination_class = CustomQuotePagination
+    # QuoteRank column and direction answering each supported queryset ordering
+    rank_orderings = {
+        ('length', 'id'): ('length_position', False),
+        ('id',): ('id_position', False),
+        ('-id',): ('id_position', True),
+    }
+    max_position_radius = 50
     
+    def get_queryset(self):
+        """Prefetch type and topics so serializing a page doesn't query them per quote"""
+        return super().get_queryset().prefetch_related('type', 'topics')
+
     def _is_descending_order(self, request):
         """Определить, используется ли убывающая сортировка по ID"""
         ordering = request.query_params.get('ordering', '')
@@ -40,6 +111,87 @@ class QuoteViewSet(viewsets.ModelViewSet):
         max_id = max(first_id, last_id)
         return f"{min_id} - {max_id}"
     
+    def _get_ids_at_positions(self, queryset, positions):
+        """Map 1-based positions in the queryset ordering to quote IDs with one ROW_NUMBER() query"""
+        if not positions:
+            return {}
+        numbered = queryset.annotate(
+            position=Window(RowNumber(), order_by=queryset.query.order_by)
+        )
+        return dict(numbered.filter(position__in=positions).values_list('position', 'id'))
+    
+    def _get_rank_index(self, queryset):
+        """
+        (ranks, field, descending, total_count) of the precomputed QuoteRank index
+        answering the queryset, or None when it can't (search results, other
+        orderings, or a scope that hasn't been built yet).
+        """
+        params = self.request.query_params
+        rank_ordering = self.rank_orderings.get(tuple(queryset.query.order_by))
+        if params.get('search') or rank_ordering is None:
+            return None
+        try:
+            scope = rank_scope(params.get('type'), params.get('topic'))
+        except ValueError:
+            return None
+
+        field, descending = rank_ordering
+        ranks = QuoteRank.objects.filter(scope=scope)
+        total_count = ranks.aggregate(total=Max(field))['total']
+        if total_count is None:
+            return None
+        return ranks, field, descending, total_count
+
+    def _get_ranked_ids(self, rank_index, positions):
+        """Map 1-based positions to quote IDs with one lookup in a rank index from _get_rank_index"""
+        ranks, field, descending, total_count = rank_index
+        if descending:
+            ranks_by_position = {position: total_count + 1 - position for position in positions}
+        else:
+            ranks_by_position = {position: position for position in positions}
+        positions_by_rank = {rank: position for position, rank in ranks_by_position.items()}
+        rows = ranks.filter(**{f'{field}__in': positions_by_rank}).values_list(field, 'quote_id')
+        return {positions_by_rank[rank]: quote_id for rank, quote_id in rows}
+
+    def _get_positions(self, queryset, first, last):
+        """
+        (total_count, {position: id}) for 1-based positions first..last, from the
+        rank index when possible, otherwise with a count and an offset slice.
+        """
+        rank_index = self._get_rank_index(queryset)
+        if rank_index is not None:
+            return rank_index[-1], self._get_ranked_ids(rank_index, range(first, last + 1))
+        total_count = queryset.count()
+        if first > total_count or last < 1:
+            return total_count, {}
+        ids = queryset[first - 1:last].values_list('id', flat=True)
+        return total_count, dict(enumerate(ids, first))
+
+    def _pick_quote_id(self, queryset, choose_position):
+        """
+        ID of the quote at position choose_position(total_count) in ID order, or None
+        for an empty queryset. Rank positions are dense whatever gaps deleted quotes
+        left in the IDs, so every quote is equally likely, and both the count and the
+        lookup are index seeks on QuoteRank. Without ranks, a count and a ROW_NUMBER()
+        lookup.
+        """
+        queryset = queryset.order_by('id')
+        rank_index = self._get_rank_index(queryset)
+        total_count = rank_index[-1] if rank_index is not None else queryset.count()
+        if not total_count:
+            return None
+        position = choose_position(total_count)
+        if rank_index is not None:
+            return self._get_ranked_ids(rank_index, [position]).get(position)
+        return self._get_ids_at_positions(queryset, [position]).get(position)
+
+    def get_cache_variant(self, request):
+        if self.action == 'random':
+            return None
+        if self.action == 'daily':
+            return timezone.localdate().isoformat()
+        return super().get_cache_variant(request)
+
     def filter_queryset(self, queryset):
         """Override to ignore type/topic filters when search is present"""
         # If search parameter is present, only apply search filter
@@ -70,6 +222,7 @@ class QuoteViewSet(viewsets.ModelViewSet):
             return None  # No pagination
         return super().paginate_queryset(queryset)
     
+    @cached_response
     def list(self, request, *args, **kwargs):
         """Override list to handle unpaginated responses consistently"""
         queryset = self.filter_queryset(self.get_queryset())
@@ -78,50 +231,46 @@ class QuoteViewSet(viewsets.ModelViewSet):
         position = request.query_params.get('position')
         if position:
             try:
-                pos = int(position) - 1  # Convert to 0-based index
-                total_count = queryset.count()
-                
-                # Validate position is within range
-                if pos < 0 or pos >= total_count:
-                    return Response({
-                        'error': 'Position out of range',
-                        'total_count': total_count
-                    }, status=400)
-                
-                # Get the specific quote at position
-                quote = queryset[pos:pos+1].first()
-                if quote:
-                    serializer = self.get_serializer(quote)
-                    return Response(serializer.data)
-                else:
-                    return Response({'error': 'Quote not found'}, status=404)
-                    
+                pos = int(position)
             except ValueError:
                 return Response({'error': 'Invalid position parameter'}, status=400)
+
+            total_count, ids_by_position = self._get_positions(queryset, pos, pos)
+            # Validate position is within range
+            if pos < 1 or pos > total_count:
+                return Response({
+                    'error': 'Position out of range',
+                    'total_count': total_count
+                }, status=400)
+
+            # Get the specific quote at position
+            quote = self.get_queryset().filter(id=ids_by_position.get(pos)).first()
+            if quote:
+                serializer = self.get_serializer(quote)
+                return Response(serializer.data)
+            else:
+                return Response({'error': 'Quote not found'}, status=404)
         
         if (request.query_params.get('search') or 
             request.query_params.get('type') or 
             request.query_params.get('topic')):
             # When search, type or topic filter is applied, return all results without pagination
-            serializer = self.get_serializer(queryset, many=True)
-            return Response({
-                'count': queryset.count(),
-                'total_pages': 1,
-                'current_page': 1,
-                'page_size': queryset.count(),
-                'items_on_page': queryset.count(),
-                'start_item': 1,
-                'end_item': queryset.count(),
-                'page_label': f"1 - {queryset.count()}",
-                'next': None,
-                'previous': None,
-                'results': serializer.data
-            })
+            count = queryset.count()
+            envelope = get_unpaginated_info(count)
+            if count >= settings.QUOTES_STREAM_MIN_COUNT and request.accepted_renderer.format == 'json':
+                # Large results are streamed from a server-side cursor to keep memory flat
+                return StreamingHttpResponse(
+                    stream_json_envelope(envelope, iter_serialized_quotes(queryset, chunk_size=2000)),
+                    content_type='application/json'
+                )
+            envelope['results'] = serialize_quotes(queryset)
+            return Response(envelope)
         
         # Normal paginated response
         return super().list(request, *args, **kwargs)
 
     @action(detail=False, methods=['get'])
+    @cached_response
     def pages_info(self, request):
         """Get pagination metadata for all available pages"""
         # Apply same filters as main queryset
@@ -155,67 +304,36 @@ class QuoteViewSet(viewsets.ModelViewSet):
             total_pages = standard_pages
         
         # Generate page info for each page
+        if total_pages > 1:
+            page_bounds = [
+                get_page_bounds(page_num, total_count, page_size, is_descending)
+                for page_num in range(1, total_pages + 1)
+            ]
+        else:
+            # A single page is reported with the standard page size
+            page_bounds = [(0, min(page_size, total_count))] * total_pages
+        ids_by_position = self._get_ids_at_positions(
+            queryset,
+            {start_index + 1 for start_index, _ in page_bounds} | {end_index for _, end_index in page_bounds}
+        )
+
         pages = []
-        for page_num in range(1, total_pages + 1):
-            # Determine if this is the merged page
-            if is_descending:
-                # For descending order, first page is merged
-                is_merged_page = (page_num == 1 and total_pages > 1 and 
-                                total_count % page_size > 0 and 
-                                total_count % page_size < page_size)
-            else:
-                # For ascending order, last page is merged
-                is_merged_page = (page_num == total_pages and total_pages > 1 and
-                                total_count % page_size > 0 and 
-                                total_count % page_size < page_size)
-            
-            if is_merged_page:
-                if is_descending:
-                    # First page with merged content
-                    remainder = total_count % page_size
-                    items_count = page_size + remainder
-                    start_item = 1
-                    end_item = items_count
-                else:
-                    # Last page with merged content  
-                    start_item = ((page_num - 1) * page_size) + 1
-                    end_item = total_count
-                    items_count = end_item - start_item + 1
-            else:
-                if is_descending and total_pages > 1 and total_count % page_size > 0 and total_count % page_size < page_size:
-                    # Adjust for pages after the merged first page
-                    remainder = total_count % page_size
-                    start_item = ((page_num - 1) * page_size) + 1 + remainder
-                    end_item = min(page_num * page_size + remainder, total_count)
-                    items_count = end_item - start_item + 1
-                else:
-                    # Normal page
-                    start_item = ((page_num - 1) * page_size) + 1
-                    end_item = min(page_num * page_size, total_count)
-                    items_count = end_item - start_item + 1
-            
-            # Get actual IDs for this page range
-            page_start_index = start_item - 1
-            page_end_index = end_item
-            
-            # Get the actual quote IDs for this page
-            page_quotes = queryset[page_start_index:page_end_index]
-            if page_quotes:
-                # Get first and last IDs on this page
-                page_ids = list(page_quotes.values_list('id', flat=True))
-                first_id = page_ids[0] if page_ids else start_item
-                last_id = page_ids[-1] if page_ids else end_item
-                
+        for page_num, (start_index, end_index) in enumerate(page_bounds, 1):
+            start_item = start_index + 1
+            end_item = end_index
+            first_id = ids_by_position.get(start_item)
+            last_id = ids_by_position.get(end_item)
+            if first_id is not None and last_id is not None:
                 # Use actual IDs for the label in min-max format
                 label = self._format_min_max_label(first_id, last_id)
             else:
                 label = f"{start_item} - {end_item}"
-            
+
             pages.append({
                 'page': page_num,
                 'start_item': start_item,
                 'end_item': end_item,
-                'items_count': items_count,
+                'items_count': end_item - start_item + 1,
                 'label': label
             })
         
@@ -228,6 +346,99 @@ class QuoteViewSet(viewsets.ModelViewSet):
         })
 
     @action(detail=False, methods=['get'])
+    @cached_response
+    def positions(self, request):
+        """Quotes at positions around ?position=N (N-radius..N+radius), for prefetching neighbours"""
+        try:
+            pos = int(request.query_params['position'])
+            radius = int(request.query_params.get('radius', 0))
+        except KeyError:
+            return Response({'error': 'Position parameter is required'}, status=400)
+        except ValueError:
+            return Response({'error': 'Invalid position or radius parameter'}, status=400)
+        if radius < 0 or radius > self.max_position_radius:
+            return Response({'error': f'Radius must be between 0 and {self.max_position_radius}'}, status=400)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        total_count, ids_by_position = self._get_positions(queryset, max(pos - radius, 1), pos + radius)
+        quotes = {quote['id']: quote for quote in serialize_quotes(Quote.objects.filter(id__in=ids_by_position.values()))}
+
+        return Response({
+            'total_count': total_count,
+            'results': [
+                {'position': position, **quotes[quote_id]}
+                for position, quote_id in sorted(ids_by_position.items())
+                if quote_id in quotes
+            ]
+        })
+
+    @action(detail=False, methods=['get'])
+    @cached_response
+    def facets(self, request):
+        """Type counts, topic counts and the total for the current search/type/topic filter"""
+        if request.query_params.get('search'):
+            # Search ignores type and topic, so facets count over the search results
+            return Response(self.filter_queryset(self.get_queryset()).facet_counts())
+
+        selected = {}
+        for param in ('type', 'topic'):
+            value = request.query_params.get(param)
+            if value:
+                try:
+                    selected[f'{param}_id'] = int(value)
+                except ValueError:
+                    return Response({param: ['Enter a whole number.']}, status=400)
+        return Response(TypeTopicCount.objects.facet_counts(**selected))
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Stream all quotes matching the filters, in ID order with type and topic names,
+        as NDJSON or CSV (?export_format=); memory stays flat whatever the catalog size
+        """
+        export_format = request.query_params.get('export_format', 'ndjson')
+        if export_format not in EXPORT_FORMATS:
+            return Response({'export_format': [f'Choose one of: {", ".join(EXPORT_FORMATS)}.']}, status=400)
+
+        rows = iter_quote_exports(self.filter_queryset(self.get_queryset()).order_by('id'))
+        content = stream_csv(rows, EXPORT_FIELDS) if export_format == 'csv' else stream_ndjson(rows)
+        content_type, extension = EXPORT_FORMATS[export_format]
+        response = StreamingHttpResponse(content, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="quotes.{extension}"'
+        return response
+
+    @action(detail=False, methods=['get'])
+    def random(self, request):
+        """A random quote, optionally of the ?type= and ?topic= filter"""
+        queryset = self.filter_queryset(self.get_queryset())
+        quote_id = self._pick_quote_id(queryset, lambda total_count: random.randint(1, total_count))
+        quotes = serialize_quotes(queryset.filter(id=quote_id)) if quote_id else []
+        response = Response(quotes[0]) if quotes else Response({'error': 'Quote not found'}, status=404)
+        add_never_cache_headers(response)
+        return response
+
+    @action(detail=False, methods=['get'])
+    @cached_response
+    def daily(self, request):
+        """The quote of the day (UTC), the same for every request with the same filter that day"""
+        params = request.query_params
+        seed = ':'.join([timezone.localdate().isoformat(), *(params.get(param, '') for param in ('type', 'topic', 'search'))])
+        pick_key = f'daily:{seed}'
+        queryset = self.filter_queryset(self.get_queryset())
+        quote_id = api_cache.get(pick_key)
+        quotes = serialize_quotes(queryset.filter(id=quote_id)) if quote_id else []
+        if not quotes:
+            # First request of the day, or the remembered quote was deleted or left the filter
+            offset = int.from_bytes(hashlib.sha256(seed.encode('utf-8')).digest()[:8], 'big')
+            quote_id = self._pick_quote_id(queryset, lambda total_count: offset % total_count + 1)
+            quotes = serialize_quotes(queryset.filter(id=quote_id)) if quote_id else []
+            if not quotes:
+                return Response({'error': 'Quote not found'}, status=404)
+            api_cache.set(pick_key, quote_id, timeout=DAILY_PICK_TIMEOUT)
+        return Response(quotes[0])
+
+    @action(detail=False, methods=['get'])
+    @cached_response
     def total_count(self, request):
         """Get total count of quotes with current filters applied"""
         # Apply same filters as main queryset
@@ -238,35 +449,37 @@ class QuoteViewSet(viewsets.ModelViewSet):
             'total_count': total_count
         })
 
-class PageViewSet(viewsets.ModelViewSet):
+class PageViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Page.objects.all()
     serializer_class = PageSerializer
     permission_classes = []
 
-class TypeViewSet(viewsets.ModelViewSet):
+class TypeViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     serializer_class = TypeSerializer
+    renderer_classes = API_RENDERERS
     permission_classes = []
+
+    @cached_response
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
     
     def get_queryset(self):
-        queryset = Type.objects.annotate(num_items=Count('quote')).filter(num_items__gt=0).order_by('type')
-        
-        # Filter types by selected topic
-        topic = self.request.query_params.get('topic')
-        if topic:
-            queryset = queryset.filter(quote__topics__id=topic).distinct()
-        
-        return queryset
+        # Types having quotes, in the selected topic if any, from the co-occurrence counts
+        topic = get_id_param(self.request, 'topic')
+        counts = TypeTopicCount.objects.filter(topic_id=topic, type__isnull=False, count__gt=0)
+        return Type.objects.filter(id__in=counts.values('type_id')).order_by('type')
 
-class TopicViewSet(viewsets.ModelViewSet):
+class TopicViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     serializer_class = TopicSerializer
+    renderer_classes = API_RENDERERS
     permission_classes = []
+
+    @cached_response
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
     
     def get_queryset(self):
-        queryset = Topic.objects.annotate(num_items=Count('quote')).filter(num_items__gt=0).order_by('topic')
-        
-        # Filter topics by selected type
-        type_id = self.request.query_params.get('type')
-        if type_id:
-            queryset = queryset.filter(quote__type__id=type_id).distinct()
-        
-        return queryset
+        # Topics having quotes, of the selected type if any, from the co-occurrence counts
+        type_id = get_id_param(self.request, 'type')
+        counts = TypeTopicCount.objects.filter(type_id=type_id, topic__isnull=False, count__gt=0)
+        return Topic.objects.filter(id__in=counts.values('topic_id')).order_by('topic')
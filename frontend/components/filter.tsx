@@ -1,12 +1,10 @@
 import React, { useState, useEffect } from "react";
-import axios from "axios";
-import { API_URL } from "../lib/constants";
 import { useRouter } from "next/router";
 import ThemeToggle from "./theme-toggle";
 import { cn } from "../lib/utils";
 import Select from "./select";
 import { Type, Topic } from "../lib/types";
-import { getTopics } from "../lib/quotes";
+import { getFacets } from "../lib/quotes";
 import { Icon } from "./icon";
 import { Logo } from "./logo";
 
@@ -32,29 +30,18 @@ const Filter: React.FC<FilterProps> = ({
   const [isSearchActive, setIsSearchActive] = useState(false);
   const [isSearchEmpty, setIsSearchEmpty] = useState(true);
 
-  // Fetch types with topic filter
+  // Fetch types (filtered by topic) and topics (filtered by type) in one request
   useEffect(() => {
-    const fetchTypes = async () => {
-      const searchParams = new URLSearchParams();
-      if (selectedTopic) {
-        searchParams.set("topic", selectedTopic.toString());
-      }
-
-      const url = `${API_URL}types/?${searchParams.toString()}`;
-      const data = await axios.get<Type[]>(url);
-      setTypes(data.data);
-    };
-    fetchTypes();
-  }, [selectedTopic]);
-
-  // Fetch topics with type filter
-  useEffect(() => {
-    const fetchTopics = async () => {
-      const topicsData = await getTopics(selectedValue?.toString());
-      setTopics(topicsData);
+    const fetchFacets = async () => {
+      const facets = await getFacets({
+        type: selectedValue?.toString(),
+        topic: selectedTopic?.toString(),
+      });
+      setTypes(facets.types);
+      setTopics(facets.topics.sort((a, b) => a.id - b.id));
     };
-    fetchTopics();
-  }, [selectedValue]);
+    fetchFacets();
+  }, [selectedValue, selectedTopic]);
 
   const handleChange = (e: React.ChangeEvent<HTMLInputElement>) => {
     const value = e.target.value;
@@ -1,6 +1,6 @@
 import axios from "axios";
 import { API_URL } from "./constants";
-import { Quote, Topic, PaginatedResponse, PagesInfoResponse } from "./types";
+import { Quote, Topic, PaginatedResponse, PagesInfoResponse, FacetsResponse } from "./types";
 
 export async function getQuotes(): Promise<Quote[]> {
   const response = await axios.get<Quote[]>(API_URL + "quotes/");
@@ -71,3 +71,21 @@ export async function getTopics(type?: string): Promise<Topic[]> {
   const response = await axios.get<Topic[]>(url);
   return response.data.sort((a, b) => a.id - b.id);
 }
+
+export async function getFacets(params?: {
+  type?: string;
+  topic?: string;
+}): Promise<FacetsResponse> {
+  const searchParams = new URLSearchParams();
+
+  if (params?.type) {
+    searchParams.set("type", params.type);
+  }
+  if (params?.topic) {
+    searchParams.set("topic", params.topic);
+  }
+
+  const url = `${API_URL}quotes/facets/?${searchParams.toString()}`;
+  const response = await axios.get<FacetsResponse>(url);
+  return response.data;
+}
@@ -68,6 +68,12 @@ export interface PagesInfoResponse {
   pagination_disabled?: boolean;
 }
 
+export interface FacetsResponse {
+  total_count: number;
+  types: (Type & { count: number })[];
+  topics: (Topic & { count: number })[];
+}
+
 export type Theme = "light" | "dark";
 
 export interface FilterProps {